@@ -1,154 +1,281 @@
 ## Importing libraries and files
+# crewai, the LLM SDKs and the tools are heavy to import, so everything here
+# is built on first use (or by the app's warm-up) rather than at import time.
 import os
+import time
+import hashlib
+import threading
 from dotenv import load_dotenv
 load_dotenv()
 
-# Try to import required packages with fallbacks
-try:
-    from crewai.agents import Agent  # type: ignore
-except ImportError:
-    print("Warning: crewai package not available. Please install it with: pip install crewai")
-    # Create a mock Agent class for development
-    class Agent:
-        def __init__(self, **kwargs):
-            self.role = kwargs.get('role', 'Mock Agent')
-            self.goal = kwargs.get('goal', 'Mock Goal')
-            self.tools = kwargs.get('tools', [])
-            self.llm = kwargs.get('llm', None)
-            print(f"Mock Agent created: {self.role}")
-
-try:
-    from langchain_openai import ChatOpenAI  # type: ignore
-except ImportError:
-    print("Warning: langchain_openai package not available. Please install it with: pip install langchain-openai")
-    ChatOpenAI = None
-
-try:
-    from langchain_google_genai import ChatGoogleGenerativeAI  # type: ignore
-except ImportError:
-    print("Warning: langchain_google_genai package not available. Please install it with: pip install langchain-google-genai")
-    ChatGoogleGenerativeAI = None
-
-try:
-    from tools import blood_test_tool, nutrition_tool, exercise_tool
-except ImportError:
-    print("Warning: tools module not available. Creating mock tools.")
-    # Create mock tools
-    class MockTool:
-        def __init__(self, name):
-            self.name = name
-        def __call__(self, *args, **kwargs):
-            return f"Mock {self.name} tool called"
-        def __getattr__(self, name):
-            # Handle any attribute access (like read_data_tool)
-            return self
-    
-    blood_test_tool = MockTool("blood_test")
-    nutrition_tool = MockTool("nutrition")
-    exercise_tool = MockTool("exercise")
+# LLM_PROVIDER=mock skips the provider SDKs entirely so the app runs offline
+LLM_PROVIDER = os.getenv("LLM_PROVIDER", "auto").lower()
+# crewai's console output is slow under load; spans (TRACE_LOG=1) are the structured alternative
+CREW_VERBOSE = os.getenv("CREW_VERBOSE", "0") == "1"
+AGENT_NAMES = ("doctor", "verifier", "nutritionist", "exercise_specialist")
+AGENT_ROLES = {
+    "doctor": "Senior Medical Doctor and Blood Test Analyst",
+    "verifier": "Medical Report Verification Specialist",
+    "nutritionist": "Clinical Nutritionist",
+    "exercise_specialist": "Exercise Physiologist and Fitness Specialist",
+}
 
-### Loading LLM - Fixed the circular reference bug
-# Try OpenAI first, fallback to Google if not available
-llm = None
-if ChatOpenAI:
+_lock = threading.RLock()
+_llm = None
+_agents = None
+
+
+class MockLLM:
+    """Deterministic stand-in LLM: waits MOCK_LLM_LATENCY seconds and answers from a hash of the prompt"""
+    model_name = "mock"
+
+    def __init__(self, latency=None):
+        self.latency = float(latency if latency is not None else os.getenv("MOCK_LLM_LATENCY", "0"))
+
+    def __call__(self, prompt="", *args, **kwargs):
+        from streaming import emit_token
+
+        digest = hashlib.sha256(str(prompt).encode("utf-8")).hexdigest()[:12]
+        reply = f"Mock LLM response {digest} ({len(str(prompt))} prompt characters)"
+        # Generated word by word, like a provider token stream
+        words = reply.split(" ")
+        for index, word in enumerate(words):
+            if self.latency:
+                time.sleep(self.latency / len(words))
+            emit_token(word if index == 0 else " " + word)
+        return reply
+
+
+def _agent_class():
+    # Try to import required packages with fallbacks
     try:
-        llm = ChatOpenAI(
-            model="gpt-3.5-turbo",
-            temperature=0.7,
-            api_key=os.getenv("OPENAI_API_KEY")
-        )
-    except Exception as e:
-        print(f"Error initializing OpenAI: {e}")
-        llm = None
-
-if not llm and ChatGoogleGenerativeAI:
+        if LLM_PROVIDER == "mock":
+            raise ImportError("mock LLM mode")
+        from crewai.agents import Agent  # type: ignore
+    except ImportError:
+        if LLM_PROVIDER != "mock":
+            print("Warning: crewai package not available. Please install it with: pip install crewai")
+        # Create a mock Agent class for development
+        class Agent:
+            def __init__(self, **kwargs):
+                self.role = kwargs.get('role', 'Mock Agent')
+                self.goal = kwargs.get('goal', 'Mock Goal')
+                self.backstory = kwargs.get('backstory', '')
+                self.tools = kwargs.get('tools', [])
+                self.llm = kwargs.get('llm', None)
+                print(f"Mock Agent created: {self.role}")
+    return Agent
+
+
+def _tools():
     try:
-        llm = ChatGoogleGenerativeAI(
-            model="gemini-pro",
-            temperature=0.7,
-            google_api_key=os.getenv("GOOGLE_API_KEY")
-        )
-    except Exception as e:
-        print(f"Error initializing Google AI: {e}")
-        llm = None
-
-if not llm:
-    print("Warning: No LLM available. Using mock LLM.")
-    class MockLLM:
-        def __call__(self, *args, **kwargs):
-            return "Mock LLM response"
-    llm = MockLLM()
-
-# Creating an Experienced Doctor agent - Fixed to be professional
-doctor = Agent(
-    role="Senior Medical Doctor and Blood Test Analyst",
-    goal="Analyze blood test reports accurately and provide evidence-based medical insights for: {query}",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a board-certified physician with over 15 years of experience in internal medicine "
-        "and laboratory medicine. You specialize in interpreting blood test results and providing "
-        "comprehensive health assessments. You always base your recommendations on scientific evidence "
-        "and current medical guidelines. You communicate clearly and compassionately with patients, "
-        "explaining complex medical concepts in understandable terms."
-    ),
-    tools=[blood_test_tool.read_data_tool],
-    llm=llm,
-    max_iter=3,
-    max_rpm=10,
-    allow_delegation=True
-)
-
-# Creating a verifier agent - Fixed to be professional
-verifier = Agent(
-    role="Medical Report Verification Specialist",
-    goal="Verify the authenticity and completeness of medical reports, ensuring they contain valid blood test data",
-    verbose=True,
-    memory=True,
-    backstory=(
-        "You are a certified medical technologist with expertise in laboratory procedures and "
-        "medical documentation. You have extensive experience in validating medical reports and "
-        "ensuring they meet clinical standards. You are thorough and detail-oriented, always "
-        "verifying that reports contain the necessary information for proper medical interpretation."
-    ),
-    llm=llm,
-    max_iter=2,
-    max_rpm=5,
-    allow_delegation=True
-)
-
-# Creating a nutritionist agent - Fixed to be professional
-nutritionist = Agent(
-    role="Clinical Nutritionist",
-    goal="Provide evidence-based nutritional recommendations based on blood test results for: {query}",
-    verbose=True,
-    backstory=(
-        "You are a registered dietitian with a master's degree in clinical nutrition and over "
-        "10 years of experience working with patients with various health conditions. You specialize "
-        "in translating blood test results into practical dietary recommendations. You always base "
-        "your advice on scientific research and individual patient needs, avoiding fad diets and "
-        "unproven supplements."
-    ),
-    llm=llm,
-    max_iter=3,
-    max_rpm=8,
-    allow_delegation=False
-)
-
-# Creating an exercise specialist agent - Fixed to be professional
-exercise_specialist = Agent(
-    role="Exercise Physiologist and Fitness Specialist",
-    goal="Design safe and effective exercise programs based on blood test results and health status for: {query}",
-    verbose=True,
-    backstory=(
-        "You are a certified exercise physiologist with a degree in kinesiology and specialized "
-        "training in medical exercise therapy. You have worked with patients of all ages and fitness "
-        "levels, including those with chronic health conditions. You design personalized exercise "
-        "programs that are safe, effective, and appropriate for each individual's health status "
-        "and fitness goals."
-    ),
-    llm=llm,
-    max_iter=3,
-    max_rpm=8,
-    allow_delegation=False
-)
+        from tools import blood_test_tool, nutrition_tool, exercise_tool
+    except ImportError:
+        print("Warning: tools module not available. Creating mock tools.")
+        # Create mock tools
+        class MockTool:
+            def __init__(self, name):
+                self.name = name
+            def __call__(self, *args, **kwargs):
+                return f"Mock {self.name} tool called"
+            def __getattr__(self, name):
+                # Handle any attribute access (like read_data_tool)
+                return self
+
+        blood_test_tool = MockTool("blood_test")
+        nutrition_tool = MockTool("nutrition")
+        exercise_tool = MockTool("exercise")
+    return blood_test_tool, nutrition_tool, exercise_tool
+
+
+### Loading LLM - Fixed the circular reference bug
+def _build_llm():
+    """Try OpenAI first, fallback to Google if not available"""
+    if LLM_PROVIDER == "mock":
+        return MockLLM()
+
+    from streaming import STREAM_TOKENS, token_callbacks
+
+    llm = None
+    try:
+        from langchain_openai import ChatOpenAI  # type: ignore
+    except ImportError:
+        print("Warning: langchain_openai package not available. Please install it with: pip install langchain-openai")
+        ChatOpenAI = None
+
+    if ChatOpenAI:
+        # Every provider call goes through the shared rate limit and token budget
+        from llm_http import scheduled_http_client, scheduled_async_http_client
+        try:
+            llm = ChatOpenAI(
+                model="gpt-3.5-turbo",
+                temperature=0.7,
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=scheduled_http_client(),
+                http_async_client=scheduled_async_http_client(),
+                # The scheduled transport is the only retry layer; SDK retries would multiply its attempts
+                max_retries=0,
+                # Tokens are forwarded to streaming /analyze clients as they arrive
+                streaming=STREAM_TOKENS,
+                callbacks=token_callbacks()
+            )
+        except Exception as e:
+            print(f"Error initializing OpenAI: {e}")
+            llm = None
+
+    if not llm:
+        try:
+            from langchain_google_genai import ChatGoogleGenerativeAI  # type: ignore
+        except ImportError:
+            print("Warning: langchain_google_genai package not available. Please install it with: pip install langchain-google-genai")
+            ChatGoogleGenerativeAI = None
+
+        if ChatGoogleGenerativeAI:
+            # Gemini calls its API over gRPC, so it is scheduled by callback rather than by HTTP transport
+            from llm_http import scheduler_callbacks
+            try:
+                llm = ChatGoogleGenerativeAI(
+                    model="gemini-pro",
+                    temperature=0.7,
+                    google_api_key=os.getenv("GOOGLE_API_KEY"),
+                    streaming=STREAM_TOKENS,
+                    callbacks=scheduler_callbacks() + token_callbacks()
+                )
+            except Exception as e:
+                print(f"Error initializing Google AI: {e}")
+                llm = None
+
+    if not llm:
+        print("Warning: No LLM available. Using mock LLM.")
+        llm = MockLLM()
+    return llm
+
+
+def get_llm():
+    global _llm
+    with _lock:
+        if _llm is None:
+            _llm = _build_llm()
+        return _llm
+
+
+def llm_provider():
+    """"openai", "gemini" or "mock": the provider this process's LLM was actually built for"""
+    llm = get_llm()
+    if isinstance(llm, MockLLM):
+        return "mock"
+    if type(llm).__module__.startswith("langchain_google_genai"):
+        return "gemini"
+    return "openai"
+
+
+def grpc_channel(llm=None):
+    """The gRPC channel a Gemini client sends every call over, or None"""
+    client = getattr(llm or get_llm(), "client", None)
+    return getattr(getattr(client, "transport", None), "grpc_channel", None)
+
+
+def build_agents(llm=None):
+    """Create the four specialist agents, returned by name"""
+    Agent = _agent_class()
+    blood_test_tool, nutrition_tool, exercise_tool = _tools()
+    llm = llm or get_llm()
+
+    # Creating an Experienced Doctor agent - Fixed to be professional
+    doctor = Agent(
+        role=AGENT_ROLES["doctor"],
+        goal="Analyze blood test reports accurately and provide evidence-based medical insights for: {query}",
+        verbose=CREW_VERBOSE,
+        memory=True,
+        backstory=(
+            "You are a board-certified physician with over 15 years of experience in internal medicine "
+            "and laboratory medicine. You specialize in interpreting blood test results and providing "
+            "comprehensive health assessments. You always base your recommendations on scientific evidence "
+            "and current medical guidelines. You communicate clearly and compassionately with patients, "
+            "explaining complex medical concepts in understandable terms."
+        ),
+        tools=[blood_test_tool.read_data_tool],
+        llm=llm,
+        max_iter=3,
+        max_rpm=10,
+        allow_delegation=True
+    )
+
+    # Creating a verifier agent - Fixed to be professional
+    verifier = Agent(
+        role=AGENT_ROLES["verifier"],
+        goal="Verify the authenticity and completeness of medical reports, ensuring they contain valid blood test data",
+        verbose=CREW_VERBOSE,
+        memory=True,
+        backstory=(
+            "You are a certified medical technologist with expertise in laboratory procedures and "
+            "medical documentation. You have extensive experience in validating medical reports and "
+            "ensuring they meet clinical standards. You are thorough and detail-oriented, always "
+            "verifying that reports contain the necessary information for proper medical interpretation."
+        ),
+        llm=llm,
+        max_iter=2,
+        max_rpm=5,
+        allow_delegation=True
+    )
+
+    # Creating a nutritionist agent - Fixed to be professional
+    nutritionist = Agent(
+        role=AGENT_ROLES["nutritionist"],
+        goal="Provide evidence-based nutritional recommendations based on blood test results for: {query}",
+        verbose=CREW_VERBOSE,
+        backstory=(
+            "You are a registered dietitian with a master's degree in clinical nutrition and over "
+            "10 years of experience working with patients with various health conditions. You specialize "
+            "in translating blood test results into practical dietary recommendations. You always base "
+            "your advice on scientific research and individual patient needs, avoiding fad diets and "
+            "unproven supplements."
+        ),
+        llm=llm,
+        max_iter=3,
+        max_rpm=8,
+        allow_delegation=False
+    )
+
+    # Creating an exercise specialist agent - Fixed to be professional
+    exercise_specialist = Agent(
+        role=AGENT_ROLES["exercise_specialist"],
+        goal="Design safe and effective exercise programs based on blood test results and health status for: {query}",
+        verbose=CREW_VERBOSE,
+        backstory=(
+            "You are a certified exercise physiologist with a degree in kinesiology and specialized "
+            "training in medical exercise therapy. You have worked with patients of all ages and fitness "
+            "levels, including those with chronic health conditions. You design personalized exercise "
+            "programs that are safe, effective, and appropriate for each individual's health status "
+            "and fitness goals."
+        ),
+        llm=llm,
+        max_iter=3,
+        max_rpm=8,
+        allow_delegation=False
+    )
+
+    return {
+        "doctor": doctor,
+        "verifier": verifier,
+        "nutritionist": nutritionist,
+        "exercise_specialist": exercise_specialist,
+    }
+
+
+def get_agents():
+    """The shared agents, built on first call"""
+    global _agents
+    with _lock:
+        if _agents is None:
+            _agents = build_agents()
+        return _agents
+
+
+def __getattr__(name):
+    # Keeps `from agents import doctor` working while deferring construction
+    if name in AGENT_NAMES:
+        return get_agents()[name]
+    if name == "llm":
+        return get_llm()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
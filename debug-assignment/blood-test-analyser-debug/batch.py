@@ -0,0 +1,364 @@
+"""Bulk blood test report processing across CPU cores.
+
+PDF parsing and marker extraction for each report run in a process pool;
+when agents are requested each worker reuses the prebuilt crews in its
+own crew pool. Results are written as JSONL or Parquet as they complete.
+
+    python batch.py reports/ archive.zip --output outputs/results.jsonl --workers 8
+"""
+import io
+import os
+import sys
+import json
+import time
+import asyncio
+import zipfile
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from document import content_hash, document_cache, parse_stream
+from screening import ReportRejected
+from ocr import run_ocr_inline
+from uploads import looks_like_pdf, MAX_UPLOAD_BYTES
+
+DEFAULT_QUERY = "Summarise my Blood Test Report"
+STAGES = ("parse", "extract", "crew")
+
+
+## Worker side
+def process_report(name, source, query=DEFAULT_QUERY, run_agents=False):
+    """Parse one report, extract its markers and optionally run the crew.
+
+    source is either raw PDF bytes or a path to read. Always returns a
+    JSON-serialisable record; failures are reported in it rather than raised.
+    """
+    record = {"file": name, "status": "success", "error": None, "timings": {}}
+    try:
+        started = time.perf_counter()
+        if isinstance(source, (bytes, bytearray)):
+            data = bytes(source)
+        else:
+            with open(source, "rb") as f:
+                data = f.read()
+        if not looks_like_pdf(data):
+            raise ValueError("File is not a valid PDF")
+
+        digest = content_hash(data)
+        report = document_cache.get(digest)
+        if report is None:
+            report = parse_stream(io.BytesIO(data), digest)
+            document_cache.put(report)
+        parsed = time.perf_counter()
+        record["timings"]["parse"] = parsed - started
+
+        table = report.markers
+        record["timings"]["extract"] = time.perf_counter() - parsed
+        record["content_hash"] = digest
+        record["pages"] = len(report.pages)
+        record["markers"] = table.to_records() if table is not None else []
+        record["abnormal"] = [row["name"] for row in record["markers"] if row["flag"]]
+
+        if run_agents:
+            crew_started = time.perf_counter()
+            # The same pipeline, verification gate and response cache as /analyze, on this
+            # worker's own crew pool; batch calls yield the shared LLM budget to interactive requests
+            from crew import run_crew, VerificationFailed
+            from rate_limit import BATCH
+            try:
+                result = run_crew(query, file_path=name, report=report, priority=BATCH, flow=digest)
+            except VerificationFailed as e:
+                record["status"] = "rejected"
+                record["error"] = f"{e}: {e.output}"
+            else:
+                record["analysis"] = str(result)
+                record["report_tokens"] = getattr(result, "compaction", None)
+            record["timings"]["crew"] = time.perf_counter() - crew_started
+
+    except ReportRejected as e:
+        # Screened out after its first pages; no crew time was spent on it
+        record["status"] = "rejected"
+        record["error"] = f"{e}: {e.output}"
+        record["timings"]["parse"] = time.perf_counter() - started
+
+    except Exception as e:
+        record["status"] = "error"
+        record["error"] = str(e)
+    return record
+
+
+## Output writers
+class JSONLWriter:
+    def __init__(self, path):
+        self._file = open(path, "w", encoding="utf-8")
+
+    def write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """Writes records as Parquet row groups; nested marker lists are stored as JSON text"""
+
+    def __init__(self, path, row_group_size=500):
+        # Optional and slow to import, so only loaded for --format parquet
+        try:
+            import pyarrow as pa  # type: ignore
+            import pyarrow.parquet as pq  # type: ignore
+        except ImportError:
+            raise RuntimeError("Parquet output requires pyarrow. Please install it with: pip install pyarrow")
+        self._pa = pa
+        self._pq = pq
+        self.path = path
+        self.row_group_size = row_group_size
+        self._rows = []
+        self._writer = None
+
+    def write(self, record):
+        self._rows.append({
+            "file": record["file"],
+            "status": record["status"],
+            "error": record["error"],
+            "content_hash": record.get("content_hash"),
+            "pages": record.get("pages"),
+            "abnormal": json.dumps(record.get("abnormal", [])),
+            "markers": json.dumps(record.get("markers", [])),
+            "analysis": record.get("analysis"),
+            "timings": json.dumps(record["timings"]),
+        })
+        if len(self._rows) >= self.row_group_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._rows:
+            return
+        table = self._pa.Table.from_pylist(self._rows, schema=self._schema())
+        if self._writer is None:
+            self._writer = self._pq.ParquetWriter(self.path, table.schema)
+        self._writer.write_table(table)
+        self._rows = []
+
+    def _schema(self):
+        pa = self._pa
+        return pa.schema([
+            ("file", pa.string()), ("status", pa.string()), ("error", pa.string()),
+            ("content_hash", pa.string()), ("pages", pa.int64()), ("abnormal", pa.string()),
+            ("markers", pa.string()), ("analysis", pa.string()), ("timings", pa.string()),
+        ])
+
+    def close(self):
+        self._flush()
+        if self._writer is not None:
+            self._writer.close()
+
+
+def open_writer(path, fmt=None):
+    """Writer for path, choosing JSONL or Parquet from fmt or the file suffix"""
+    fmt = fmt or ("parquet" if path.endswith(".parquet") else "jsonl")
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if fmt == "parquet":
+        return ParquetWriter(path)
+    if fmt == "jsonl":
+        return JSONLWriter(path)
+    raise ValueError(f"Unknown output format: {fmt}")
+
+
+## Throughput and per-stage timing
+class BatchStats:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.total = 0
+        self.succeeded = 0
+        self.failed = 0
+        self.rejected = 0
+        self.stage_totals = {stage: 0.0 for stage in STAGES}
+        self.stage_counts = {stage: 0 for stage in STAGES}
+
+    def add(self, record):
+        self.total += 1
+        if record["status"] == "success":
+            self.succeeded += 1
+        elif record["status"] == "rejected":
+            self.rejected += 1
+        else:
+            self.failed += 1
+        for stage, seconds in record["timings"].items():
+            self.stage_totals[stage] += seconds
+            self.stage_counts[stage] += 1
+
+    def summary(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            "reports": self.total,
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "elapsed_seconds": round(elapsed, 3),
+            "reports_per_second": round(self.total / elapsed, 2) if elapsed else 0.0,
+            "stages": {
+                stage: {
+                    "total_seconds": round(self.stage_totals[stage], 3),
+                    "mean_ms": round(1000 * self.stage_totals[stage] / self.stage_counts[stage], 2),
+                }
+                for stage in STAGES if self.stage_counts[stage]
+            },
+        }
+
+
+## Creating the batch runner
+class BatchRunner:
+    """Process pool that fans report parsing, extraction and crew runs across cores"""
+
+    def __init__(self, workers=None):
+        self.workers = int(workers or os.getenv("BATCH_WORKERS", str(os.cpu_count() or 1)))
+        self._executor = None
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=run_ocr_inline)
+        return self._executor
+
+    def submit(self, name, source, query=DEFAULT_QUERY, run_agents=False):
+        return self.executor.submit(process_report, name, source, query, run_agents)
+
+    def iter_results(self, items, query=DEFAULT_QUERY, run_agents=False, window=None):
+        """Yield records as they complete, keeping at most window reports in flight.
+
+        Items whose source is an exception (e.g. a rejected ZIP member) are
+        yielded straight away as error records.
+        """
+        window = window or self.workers * 4
+        items = iter(items)
+        pending = set()
+        try:
+            while True:
+                for name, source in items:
+                    if isinstance(source, Exception):
+                        yield error_record(name, source)
+                        continue
+                    pending.add(self.submit(name, source, query, run_agents))
+                    if len(pending) >= window:
+                        break
+                if not pending:
+                    return
+                done = next(as_completed(pending))
+                pending.discard(done)
+                yield done.result()
+        finally:
+            # Reports that have not started yet are dropped when the caller stops early
+            for future in pending:
+                future.cancel()
+
+    async def aiter_results(self, items, query=DEFAULT_QUERY, run_agents=False, window=None):
+        """iter_results for the event loop: items is an async iterable of (name, source).
+
+        The same window bounds how many reports are read ahead and queued;
+        when the consumer stops (e.g. the client disconnected) the reports
+        still queued are cancelled.
+        """
+        window = window or self.workers * 4
+        items = aiter(items)
+        pending = set()
+        exhausted = False
+        try:
+            while True:
+                while not exhausted and len(pending) < window:
+                    try:
+                        name, source = await anext(items)
+                    except StopAsyncIteration:
+                        exhausted = True
+                        break
+                    if isinstance(source, Exception):
+                        yield error_record(name, getattr(source, "detail", source))
+                        continue
+                    pending.add(asyncio.wrap_future(self.submit(name, source, query, run_agents)))
+                if not pending:
+                    return
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+    def run(self, items, writer, query=DEFAULT_QUERY, run_agents=False):
+        """Process every item, writing each record as it completes; returns the summary"""
+        stats = BatchStats()
+        for record in self.iter_results(items, query, run_agents):
+            stats.add(record)
+            writer.write(record)
+        return stats.summary()
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None
+
+
+## Input discovery
+def iter_zip_reports(fileobj, max_member_bytes=None):
+    """Yield (name, bytes) for every PDF member of a ZIP archive (a path or file object), one at a time.
+
+    Members whose declared size is over the limit yield an exception instead
+    of data, so a single oversized (or zip-bomb) entry cannot exhaust memory.
+    """
+    max_member_bytes = max_member_bytes or MAX_UPLOAD_BYTES
+    with zipfile.ZipFile(fileobj) as archive:
+        for info in archive.infolist():
+            if info.is_dir() or not info.filename.lower().endswith(".pdf"):
+                continue
+            if info.file_size > max_member_bytes:
+                yield info.filename, ValueError(f"File exceeds the {max_member_bytes} byte upload limit")
+                continue
+            yield info.filename, archive.read(info)
+
+
+def iter_inputs(paths):
+    """Expand files, directories and ZIP archives into (name, path-or-bytes) items"""
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for filename in sorted(files):
+                    if filename.lower().endswith(".pdf"):
+                        yield os.path.join(root, filename), os.path.join(root, filename)
+        elif path.lower().endswith(".zip"):
+            for name, data in iter_zip_reports(path):
+                yield f"{path}:{name}", data
+        else:
+            yield path, path
+
+
+def error_record(name, error):
+    return {"file": name, "status": "error", "error": str(error), "timings": {}}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Batch-process blood test report PDFs")
+    parser.add_argument("inputs", nargs="+", help="PDF files, directories or ZIP archives")
+    parser.add_argument("-o", "--output", default=f"outputs/batch_{time.strftime('%Y%m%d_%H%M%S')}.jsonl")
+    parser.add_argument("--format", choices=["jsonl", "parquet"], help="Defaults to the output file suffix")
+    parser.add_argument("-w", "--workers", type=int, help="Worker processes (default: BATCH_WORKERS or CPU count)")
+    parser.add_argument("-q", "--query", default=DEFAULT_QUERY)
+    parser.add_argument("--agents", action="store_true", help="Also run the LLM crew on every report")
+    args = parser.parse_args(argv)
+
+    runner = BatchRunner(workers=args.workers)
+    writer = open_writer(args.output, args.format)
+    try:
+        summary = runner.run(iter_inputs(args.inputs), writer, args.query, args.agents)
+    finally:
+        writer.close()
+        runner.shutdown()
+
+    print(json.dumps(summary, indent=2))
+    print(f"Results written to {args.output}")
+    return 0 if summary["failed"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
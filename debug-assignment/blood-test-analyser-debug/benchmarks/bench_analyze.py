@@ -0,0 +1,278 @@
+"""End-to-end offline benchmark of POST /analyze and the crew tools.
+
+Generates synthetic reports of each --pages size, then:
+
+* tools: times read_data_tool, read_markers_tool, the nutrition tool and
+  the exercise tool in process against each parsed report;
+* analyze: fires --requests uploads per size at POST /analyze with
+  --concurrency in flight, against the deterministic mock LLM
+  (LLM_PROVIDER=mock) with --llm-latency seconds per call.
+
+By default the app runs in process through httpx's ASGI transport; with
+--server uvicorn it runs in a child uvicorn process instead. Reports
+p50/p95/p99 latency, requests per second and peak RSS, and writes the
+results as JSON so runs can be compared:
+
+    python benchmarks/bench_analyze.py --pages 1 5 20 --requests 40 --concurrency 8
+    python benchmarks/bench_analyze.py --compare outputs/benchmarks/previous.json
+"""
+import io
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import platform
+import resource
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from synthetic_reports import make_report  # noqa: E402
+
+QUERY = "Summarise my Blood Test Report"
+
+
+def configure(args):
+    """Environment for the app under test; set before main is imported or uvicorn started"""
+    env = {
+        "LLM_PROVIDER": "mock",
+        "MOCK_LLM_LATENCY": str(args.llm_latency),
+        "WARMUP": "eager",
+        # Every upload is distinct, but repeated runs must not be served from disk
+        "LLM_CACHE_PATH": "",
+        "LLM_CACHE": "1" if args.llm_cache else "0",
+        "JOB_STORE": "memory",
+    }
+    os.environ.update(env)
+    return env
+
+
+def summarise(samples, elapsed=None, errors=0):
+    ordered = sorted(samples)
+
+    def pct(fraction):
+        return round(ordered[min(len(ordered) - 1, int(fraction * len(ordered)))] * 1000, 2) if ordered else None
+
+    result = {
+        "n": len(samples),
+        "errors": errors,
+        "mean_ms": round(statistics.mean(samples) * 1000, 2) if samples else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+    }
+    if elapsed:
+        result["rps"] = round(len(samples) / elapsed, 2)
+    return result
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return round(resource.getrusage(who).ru_maxrss / scale, 1)
+
+
+## Tool functions
+def bench_tools(reports, iterations):
+    from document import parse_stream, content_hash, use_report
+    from tools import blood_test_tool, nutrition_tool, exercise_tool
+
+    calls = {
+        "read_data_tool": lambda: blood_test_tool.read_data_tool(),
+        "read_markers_tool": lambda: blood_test_tool.read_markers_tool(),
+        "analyze_nutrition_tool": lambda: nutrition_tool.analyze_nutrition_tool(""),
+        "create_exercise_plan_tool": lambda: exercise_tool.create_exercise_plan_tool(""),
+    }
+    results = {}
+    for pages, data in reports.items():
+        timings = {"parse": []}
+        timings.update({name: [] for name in calls})
+        for _ in range(iterations):
+            started = time.perf_counter()
+            report = parse_stream(io.BytesIO(data), content_hash(data))
+            report.markers
+            timings["parse"].append(time.perf_counter() - started)
+            with use_report(report):
+                for name, call in calls.items():
+                    started = time.perf_counter()
+                    asyncio.run(call())
+                    timings[name].append(time.perf_counter() - started)
+        results[str(pages)] = {name: summarise(samples) for name, samples in timings.items()}
+    return results
+
+
+## POST /analyze
+async def fire(client, uploads, concurrency, mode):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+    errors = 0
+
+    async def one(name, data):
+        nonlocal errors
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post(
+                "/analyze", files={"file": (name, data, "application/pdf")}, data={"query": QUERY, "mode": mode}
+            )
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(name, data) for name, data in uploads))
+    return latencies, errors, time.perf_counter() - started
+
+
+def make_uploads(pages, count, seed):
+    return [(f"synthetic_{pages}p_{i}.pdf", make_report(pages, seed=seed + i)) for i in range(count)]
+
+
+async def bench_in_process(args):
+    import httpx
+    import main
+
+    results = {}
+    async with main.lifespan(main.app):
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+            for pages in args.pages:
+                uploads = make_uploads(pages, args.requests, seed=pages * 100003)
+                # One untimed request so lazy imports and first-use setup are not counted
+                await fire(client, uploads[:1], 1, args.mode)
+                latencies, errors, elapsed = await fire(client, uploads, args.concurrency, args.mode)
+                results[str(pages)] = summarise(latencies, elapsed, errors)
+    return results, peak_rss_mb()
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def bench_uvicorn(args, env):
+    import httpx
+
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        cwd=ROOT, env={**os.environ, **env}, stdout=subprocess.DEVNULL,
+    )
+    results = {}
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=600) as client:
+            for _ in range(300):
+                try:
+                    await client.get("/")
+                    break
+                except httpx.TransportError:
+                    await asyncio.sleep(0.1)
+            for pages in args.pages:
+                uploads = make_uploads(pages, args.requests, seed=pages * 100003)
+                await fire(client, uploads[:1], 1, args.mode)
+                latencies, errors, elapsed = await fire(client, uploads, args.concurrency, args.mode)
+                results[str(pages)] = summarise(latencies, elapsed, errors)
+    finally:
+        server.terminate()
+        server.wait()
+    return results, peak_rss_mb(resource.RUSAGE_CHILDREN)
+
+
+## Reporting
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_table(title, rows):
+    print(f"\n{title}")
+    print(f"  {'':<30}{'n':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'rps':>8}")
+    for label, row in rows:
+        cells = [row.get(key) for key in ("p50_ms", "p95_ms", "p99_ms")]
+        cells = "".join(f"{cell if cell is not None else '-':>10}" for cell in cells)
+        rps = row.get("rps")
+        errors = f"  ({row['errors']} errors)" if row.get("errors") else ""
+        print(f"  {label:<30}{row['n']:>6}{cells}{rps if rps is not None else '':>8}{errors}")
+
+
+def compare(current, previous):
+    """Print the relative change of p50/p95/rps against an earlier results file"""
+    print(f"\nChange against {previous.get('git_commit') or 'previous run'}:")
+    for pages, row in current["analyze"].items():
+        old = previous.get("analyze", {}).get(pages)
+        if not old:
+            continue
+        parts = []
+        for key in ("p50_ms", "p95_ms", "rps"):
+            if old.get(key) and row.get(key) is not None:
+                parts.append(f"{key} {100 * (row[key] - old[key]) / old[key]:+.1f}%")
+        print(f"  analyze {pages} page(s): " + ", ".join(parts))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20], help="Report sizes in pages")
+    parser.add_argument("--requests", type=int, default=20, help="Requests per report size")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="Seconds per mock LLM call")
+    parser.add_argument("--mode", default="full", help="Pipeline mode for /analyze (full, fast, sequential)")
+    parser.add_argument("--tool-iterations", type=int, default=20)
+    parser.add_argument("--server", choices=["inprocess", "uvicorn"], default="inprocess")
+    parser.add_argument("--llm-cache", action="store_true", help="Leave the LLM response cache on")
+    parser.add_argument("--output", default=None, help="Results JSON (default outputs/benchmarks/bench_<time>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results JSON to compare against")
+    args = parser.parse_args(argv)
+
+    env = configure(args)
+    reports = {pages: make_report(pages, seed=pages) for pages in args.pages}
+    tools = bench_tools(reports, args.tool_iterations)
+    tools_rss = peak_rss_mb()
+
+    if args.server == "uvicorn":
+        analyze, server_rss = asyncio.run(bench_uvicorn(args, env))
+    else:
+        analyze, server_rss = asyncio.run(bench_in_process(args))
+
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "git_commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        "report_bytes": {str(pages): len(data) for pages, data in reports.items()},
+        "tools": tools,
+        "analyze": analyze,
+        "peak_rss_mb": {"tools": tools_rss, args.server: server_rss},
+    }
+
+    for pages, rows in tools.items():
+        print_table(f"Tools, {pages}-page report", rows.items())
+    print_table(f"POST /analyze ({args.server}, concurrency {args.concurrency}, "
+                f"LLM latency {args.llm_latency}s)", [(f"{p} page(s)", row) for p, row in analyze.items()])
+    print(f"\nPeak RSS: {results['peak_rss_mb']}")
+
+    output = args.output or os.path.join(ROOT, "outputs", "benchmarks", f"bench_{time.strftime('%Y%m%d_%H%M%S')}.json")
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            compare(results, json.load(f))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
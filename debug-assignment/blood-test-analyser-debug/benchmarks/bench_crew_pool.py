@@ -0,0 +1,56 @@
+"""Per-request crew overhead: building a Crew for every request vs checking one out of the pool.
+
+Only the crew setup and teardown are timed, not kickoff, so the numbers
+isolate what the pool saves. Runs offline. Without crewai installed the
+mock Crew costs almost nothing to build, so only the pool's own
+checkout/reset bookkeeping shows up; install crewai for real numbers.
+
+    python benchmarks/bench_crew_pool.py [iterations]
+"""
+import os
+import sys
+import time
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from crew import CrewPool, build_crew
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def report(label, samples):
+    print(f"{label:<22} mean {statistics.mean(samples) * 1e6:10.1f} us   "
+          f"p95 {percentile(samples, 0.95) * 1e6:10.1f} us")
+
+
+def main(iterations=200):
+    per_request = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        build_crew()
+        per_request.append(time.perf_counter() - started)
+
+    pool = CrewPool(size=4)
+    started = time.perf_counter()
+    pool.warm()
+    warm_time = time.perf_counter() - started
+
+    pooled = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        with pool.checkout():
+            pass
+        pooled.append(time.perf_counter() - started)
+
+    print(f"{iterations} iterations, pool warm-up {warm_time * 1000:.1f} ms (one-off at startup)")
+    report("build per request", per_request)
+    report("pool checkout/reset", pooled)
+    print(f"speed-up {statistics.mean(per_request) / statistics.mean(pooled):.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,84 @@
+"""Patient history lookups against a large store.
+
+Fills a fresh SQLite history store with --patients patients, each with
+--reports reports of every known analyte (patients x reports x ~60 rows),
+then times the queries the API makes for random patients: all trends,
+one marker's trends, one marker's series and the agents' summary.
+
+    python benchmarks/bench_history.py [--patients 5000] [--reports 4] [--queries 200]
+"""
+import os
+import sys
+import time
+import random
+import argparse
+import datetime
+import tempfile
+import statistics
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from history import HistoryStore  # noqa: E402
+from markers import ANALYTES  # noqa: E402
+
+
+def fill(store, patients, reports, seed=0):
+    rng = random.Random(seed)
+    keys = list(ANALYTES)
+    start = datetime.date(2020, 1, 1)
+    with store._connect() as conn:
+        for patient in range(patients):
+            rows = []
+            for number in range(reports):
+                collected_on = (start + datetime.timedelta(days=90 * number + rng.randint(0, 20))).isoformat()
+                for key in keys:
+                    name, unit = ANALYTES[key][0], ANALYTES[key][1]
+                    rows.append((f"patient-{patient}", key, collected_on, f"report-{patient}-{number}", name,
+                                 rng.uniform(1, 200), unit, 1.0, 150.0, 0))
+            conn.executemany("INSERT INTO marker_values VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            conn.executemany(
+                "INSERT INTO reports VALUES (?, ?, ?, ?)",
+                {(row[0], row[3], row[2], 0.0) for row in rows},
+            )
+    return patients * reports * len(keys)
+
+
+def timed(call, queries, patients, rng):
+    samples = []
+    for _ in range(queries):
+        patient = f"patient-{rng.randrange(patients)}"
+        started = time.perf_counter()
+        call(patient)
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    return statistics.median(samples) * 1000, samples[int(0.99 * (len(samples) - 1))] * 1000
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--reports", type=int, default=4, help="Reports per patient")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--path", default=None, help="Store to create (default: a temporary file)")
+    args = parser.parse_args(argv)
+
+    directory = tempfile.mkdtemp()
+    store = HistoryStore(args.path or os.path.join(directory, "history.sqlite3"))
+    started = time.perf_counter()
+    rows = fill(store, args.patients, args.reports)
+    print(f"Inserted {rows:,} marker values in {time.perf_counter() - started:.1f}s")
+
+    rng = random.Random(1)
+    checks = {
+        "trends (all markers)": lambda patient: store.trends(patient),
+        "trends (hba1c, ldl)": lambda patient: store.trends(patient, ["hba1c", "ldl"]),
+        "series (hemoglobin)": lambda patient: store.series(patient, "hemoglobin"),
+        "summary for agents": lambda patient: store.summary(patient),
+    }
+    for label, call in checks.items():
+        median, p99 = timed(call, args.queries, args.patients, rng)
+        print(f"  {label:<24} median {median:7.2f} ms   p99 {p99:7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Connection reuse against a local stub provider: a client per call vs the shared pool.
+
+Sends --requests chat completions from --concurrency threads to a local
+fake_llm server, first with a new httpx client per call (a new connection
+every time), then through http_clients' shared keep-alive pool after a
+warm-up. Prints latency and how many requests had to open a connection.
+The stub speaks plain HTTP, so the saving shown is the TCP connect only;
+against a real provider each new connection also pays a TLS handshake.
+
+    python benchmarks/bench_http_pool.py [--requests 400] [--concurrency 8]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from fake_llm import FakeLLMServer  # noqa: E402
+from http_clients import HTTPClients, ConnectionStats, transport_classes  # noqa: E402
+
+BODY = {"model": "fake-model", "messages": [{"role": "user", "content": "Summarise my report"}]}
+
+
+def run(call, requests, concurrency):
+    def timed(_):
+        started = time.perf_counter()
+        call()
+        return time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        samples = sorted(executor.map(timed, range(requests)))
+    return time.perf_counter() - started, samples
+
+
+def report(label, elapsed, samples, stats):
+    pool = next(iter(stats.values()))
+    print(f"{label:<10} {elapsed:6.2f}s  p50 {statistics.median(samples) * 1000:6.2f} ms  "
+          f"p95 {samples[int(0.95 * (len(samples) - 1))] * 1000:6.2f} ms  "
+          f"connections opened {pool['new_connections']:>4} of {pool['requests']} (reuse {pool['reuse_rate']:.0%})")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--latency", type=float, default=0.005, help="Stub server latency in seconds")
+    args = parser.parse_args(argv)
+
+    with FakeLLMServer(latency=args.latency) as server:
+        url = f"{server.base_url}/chat/completions"
+
+        fresh_stats = ConnectionStats()
+
+        def fresh_call():
+            transport = transport_classes()[0]("llm", httpx.HTTPTransport(), fresh_stats)
+            with httpx.Client(transport=transport, timeout=30) as client:
+                client.post(url, json=BODY).raise_for_status()
+
+        elapsed, samples = run(fresh_call, args.requests, args.concurrency)
+        report("per call", elapsed, samples, fresh_stats.to_dict())
+
+        clients = HTTPClients()
+        warmed = clients.warm({"llm": server.base_url}, connections=args.concurrency)
+        print(f"warm-up    opened {warmed['llm']['connections']} connections in {warmed['llm']['seconds'] * 1000:.1f} ms")
+        pooled = clients.client("llm", timeout=30)
+
+        def pooled_call():
+            pooled.post(url, json=BODY).raise_for_status()
+
+        elapsed, samples = run(pooled_call, args.requests, args.concurrency)
+        report("pooled", elapsed, samples, clients.stats.to_dict())
+        clients.close()
+
+
+if __name__ == "__main__":
+    main()
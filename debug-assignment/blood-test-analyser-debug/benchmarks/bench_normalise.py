@@ -0,0 +1,90 @@
+"""Micro-benchmark for report text normalisation.
+
+Compares the single-pass helpers in normalise.py with the quadratic loops
+the tools used before, on synthetic lab reports from 1 to 200 pages.
+
+    python benchmarks/bench_normalise.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from normalise import collapse_spaces, normalise_report
+
+PAGE_SIZES = [1, 10, 50, 100, 200]
+# The old space loop grows quadratically, so it is only timed on small inputs
+LEGACY_MAX_PAGES = 50
+
+ROWS = [
+    "Haemoglobin      13.5  g/dL        13.0 - 17.0",
+    "Total Cholesterol    212   mg/dL    <200",
+    "",
+    "",
+    "Fasting Glucose   98    mg/dL       70 - 100",
+    "Vitamin D (25-OH)     18  ng/mL     30 - 100",
+    "",
+]
+
+
+def synthetic_page(number):
+    lines = [f"PATHOLOGY LABORATORY    Page {number}", "", ""]
+    for _ in range(12):
+        lines.extend(ROWS)
+    return "\n".join(lines)
+
+
+def legacy_blank_lines(pages):
+    full_report = ""
+    for content in pages:
+        while "\n\n" in content:
+            content = content.replace("\n\n", "\n")
+        full_report += content + "\n"
+    return full_report
+
+
+def legacy_spaces(processed_data):
+    i = 0
+    while i < len(processed_data):
+        if processed_data[i:i+2] == "  ":
+            processed_data = processed_data[:i] + processed_data[i+1:]
+        else:
+            i += 1
+    return processed_data
+
+
+def best_of(fn, arg, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(arg)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    print(f"{'pages':>6} {'chars':>9} {'report ms':>10} {'spaces ms':>10} {'us/page':>8} {'legacy ms':>10}")
+    per_page = []
+    for count in PAGE_SIZES:
+        pages = [synthetic_page(n) for n in range(1, count + 1)]
+        text = "\n".join(pages)
+
+        report = best_of(normalise_report, pages)
+        spaces = best_of(collapse_spaces, text)
+        per_page.append((report + spaces) / count)
+
+        legacy = ""
+        if count <= LEGACY_MAX_PAGES:
+            legacy_total = best_of(legacy_blank_lines, pages, 1) + best_of(legacy_spaces, text, 1)
+            legacy = f"{legacy_total * 1000:10.2f}"
+
+        print(f"{count:>6} {len(text):>9} {report * 1000:>10.3f} {spaces * 1000:>10.3f} "
+              f"{per_page[-1] * 1e6:>8.1f} {legacy:>10}")
+
+    # Linear scaling keeps the per-page cost flat as reports grow
+    print(f"\nper-page cost ratio 200 pages / 1 page: {per_page[-1] / per_page[0]:.2f}")
+
+
+if __name__ == "__main__":
+    main()
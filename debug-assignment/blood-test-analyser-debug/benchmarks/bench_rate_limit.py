@@ -0,0 +1,93 @@
+"""Throttling against a quota-enforcing fake LLM: unscheduled calls vs the shared scheduler.
+
+Fires a burst of batch calls plus a trickle of interactive calls at a local
+fake_llm server that allows --rpm requests per minute. Unscheduled calls
+are sent straight through httpx and the 429s are counted; scheduled calls
+go through rate_limit's transport with a budget just under the server's
+quota. Runs offline; expect it to take a few minutes at the defaults.
+
+    python benchmarks/bench_rate_limit.py [--requests 40] [--rpm 30]
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx  # noqa: E402
+
+from fake_llm import FakeLLMServer  # noqa: E402
+from llm_http import ScheduledTransport  # noqa: E402
+from rate_limit import LLMScheduler, MemoryBudget, llm_context, INTERACTIVE, BATCH  # noqa: E402
+
+BODY = {"model": "fake-model", "max_tokens": 64, "messages": [{"role": "user", "content": "Summarise my report " * 20}]}
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def fire(client, base_url, jobs):
+    """Send every (priority, flow) job from its own thread; returns latencies by priority and status counts"""
+    latencies = {INTERACTIVE: [], BATCH: []}
+    statuses = {}
+    lock = threading.Lock()
+
+    def call(priority, flow, delay):
+        time.sleep(delay)
+        started = time.perf_counter()
+        with llm_context(priority, flow):
+            status = client.post(f"{base_url}/chat/completions", json=BODY).status_code
+        with lock:
+            latencies[priority].append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    threads = [threading.Thread(target=call, args=job) for job in jobs]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, statuses
+
+
+def report(label, latencies, statuses, elapsed):
+    print(f"{label}: {elapsed:.1f}s, responses {dict(sorted(statuses.items()))}")
+    for priority, name in ((INTERACTIVE, "interactive"), (BATCH, "batch")):
+        samples = latencies[priority]
+        if samples:
+            print(f"  {name:<12} n={len(samples):<4} mean {statistics.mean(samples):6.2f}s   "
+                  f"p95 {percentile(samples, 0.95):6.2f}s")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=40, help="Batch calls in the burst")
+    parser.add_argument("--rpm", type=int, default=30, help="Fake server quota")
+    args = parser.parse_args(argv)
+
+    # Batch calls arrive at once from two flows; interactive calls arrive a second later
+    jobs = [(BATCH, f"batch-{i % 2}", 0.0) for i in range(args.requests)]
+    jobs += [(INTERACTIVE, f"user-{i}", 1.0) for i in range(4)]
+
+    with FakeLLMServer(rpm=args.rpm, latency=0.05) as server:
+        with httpx.Client(timeout=120) as client:
+            started = time.perf_counter()
+            latencies, statuses = fire(client, server.base_url, jobs)
+            report("unscheduled", latencies, statuses, time.perf_counter() - started)
+
+    with FakeLLMServer(rpm=args.rpm, latency=0.05) as server:
+        # A small burst keeps any sixty-second window under the server's sliding-window quota
+        scheduler = LLMScheduler(MemoryBudget(rpm=args.rpm * 0.9, tpm=10 ** 9, burst=0.1), max_retries=5)
+        with httpx.Client(transport=ScheduledTransport(scheduler), timeout=120) as client:
+            started = time.perf_counter()
+            latencies, statuses = fire(client, server.base_url, jobs)
+            report("scheduled", latencies, statuses, time.perf_counter() - started)
+        print(f"  scheduler {scheduler.stats()}")
+
+
+if __name__ == "__main__":
+    main()
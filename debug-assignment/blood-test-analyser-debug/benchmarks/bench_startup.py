@@ -0,0 +1,74 @@
+"""Worker cold start: time to import main and time to warm the crews.
+
+Each measurement runs in a fresh interpreter under `python -X importtime`,
+so nothing is cached between runs. Prints the total import time of main,
+the slowest top-level imports and how long the warm-up (crewai, the LLM
+client, agents, tasks and pooled crews) takes on its own. Defaults to
+LLM_PROVIDER=mock so it runs offline; pass --provider auto to measure the
+real SDKs.
+
+    python benchmarks/bench_startup.py [--runs 5] [--top 15] [--provider mock]
+"""
+import os
+import re
+import sys
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Prints the warm-up time after main has been imported
+WARM_SCRIPT = (
+    "import time, main\n"
+    "started = time.perf_counter()\n"
+    "main.warm_up()\n"
+    "print(f'WARM {time.perf_counter() - started:.6f}')\n"
+)
+
+_IMPORT_LINE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def run(code, provider):
+    env = dict(os.environ, LLM_PROVIDER=provider, PYTHONPATH=ROOT, LLM_CACHE_PATH="")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    imports = {}
+    for line in result.stderr.splitlines():
+        match = _IMPORT_LINE.match(line)
+        # Only modules imported directly by the top level, with their cumulative time
+        if match and len(match.group(3)) <= 3:
+            imports[match.group(4)] = int(match.group(2))
+    warm = re.search(r"WARM ([\d.]+)", result.stdout)
+    return imports, float(warm.group(1)) if warm else None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--provider", default="mock", help="LLM_PROVIDER for the child processes")
+    args = parser.parse_args(argv)
+
+    totals, warms, slowest = [], [], {}
+    for _ in range(args.runs):
+        imports, warm = run(WARM_SCRIPT, args.provider)
+        totals.append(imports.get("main", 0) / 1e6)
+        warms.append(warm)
+        for module, micros in imports.items():
+            slowest.setdefault(module, []).append(micros)
+
+    print(f"import main   median {statistics.median(totals) * 1000:8.1f} ms   "
+          f"min {min(totals) * 1000:8.1f} ms")
+    print(f"warm_up()     median {statistics.median(warms) * 1000:8.1f} ms   "
+          f"min {min(warms) * 1000:8.1f} ms")
+    print(f"\nSlowest imports (median cumulative, {args.runs} runs):")
+    ranked = sorted(slowest.items(), key=lambda item: statistics.median(item[1]), reverse=True)
+    for module, samples in ranked[:args.top]:
+        print(f"  {statistics.median(samples) / 1000:8.1f} ms  {module}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Synthetic blood test report PDFs laid out like data/blood_test_report.pdf.
+
+Each page repeats the sample report's header block and lists markers as
+name, method and "low - high unit value" lines, so the text pypdf extracts
+matches what markers.py parses from the real report. Values are drawn
+from a seeded generator, so the same seed always gives the same PDF.
+Writes plain PDF 1.4 with the built-in Helvetica font; no dependencies.
+
+    python benchmarks/synthetic_reports.py out/ --pages 1 5 20 --count 3
+"""
+import os
+import sys
+import random
+import argparse
+
+# (name, method, unit, low, high) from the sample report's panels
+MARKERS = (
+    ("Hemoglobin", "Photometry", "g/dL", 13.0, 17.0),
+    ("Packed Cell Volume (PCV)", "Calculated", "%", 40.0, 50.0),
+    ("RBC Count", "Electrical Impedence", "mill/mm3", 4.5, 5.5),
+    ("MCV", "Electrical Impedence", "fL", 83.0, 101.0),
+    ("MCH", "Calculated", "pg", 27.0, 32.0),
+    ("MCHC", "Calculated", "g/dL", 31.5, 34.5),
+    ("Total Leukocyte Count (TLC)", "Electrical Impedence", "thou/mm3", 4.0, 10.0),
+    ("Platelet Count", "Electrical impedence", "thou/mm3", 150.0, 410.0),
+    ("Creatinine", "Modified Jaffe,Kinetic", "mg/dL", 0.7, 1.3),
+    ("Urea", "Urease UV", "mg/dL", 13.0, 43.0),
+    ("Uric Acid", "Uricase", "mg/dL", 3.5, 7.2),
+    ("AST (SGOT)", "IFCC without P5P", "U/L", 15.0, 40.0),
+    ("ALT (SGPT)", "IFCC without P5P", "U/L", 10.0, 49.0),
+    ("Alkaline Phosphatase (ALP)", "IFCC-AMP", "U/L", 30.0, 120.0),
+    ("Cholesterol, Total", "CHO-POD", "mg/dL", 0.0, 200.0),
+    ("Triglycerides", "GPO-POD", "mg/dL", 0.0, 150.0),
+    ("HDL Cholesterol", "Direct", "mg/dL", 40.0, 60.0),
+    ("LDL Cholesterol, Calculated", "Calculated", "mg/dL", 0.0, 100.0),
+    ("Glucose, Fasting", "Hexokinase", "mg/dL", 70.0, 100.0),
+    ("Vitamin D, 25 - Hydroxy", "CLIA", "nmol/L", 75.0, 250.0),
+    ("Vitamin B12", "CLIA", "pg/mL", 211.0, 911.0),
+    ("TSH", "CLIA", "uIU/mL", 0.55, 4.78),
+)
+
+HEADER = (
+    "Report Status    Final",
+    "Name        : DUMMY {patient}",
+    "Lab No.    : {lab_no}",
+    "Age : 30 Years   Gender : Male",
+    "Collected at : LPL-ROHINI (NATIONAL REFERENCE LAB)",
+    "Test Report",
+    "Test Name Results Units Bio. Ref. Interval",
+)
+MARKERS_PER_PAGE = 14
+
+
+def report_lines(pages, rng):
+    """Text lines for each page of a report"""
+    patient = rng.randint(1000, 9999)
+    lab_no = rng.randint(100000000, 999999999)
+    out = []
+    for number in range(pages):
+        lines = [line.format(patient=patient, lab_no=lab_no) for line in HEADER]
+        for i in range(MARKERS_PER_PAGE):
+            name, method, unit, low, high = MARKERS[(number * MARKERS_PER_PAGE + i) % len(MARKERS)]
+            span = (high - low) or high or 1.0
+            # Roughly one value in five falls outside the reference interval
+            value = rng.uniform(low - 0.3 * span, high + 0.3 * span) if rng.random() < 0.2 else rng.uniform(low, high)
+            lines += [name, f"({method})", f" {low:.2f} - {high:.2f} {unit}{max(value, 0):.2f}"]
+        lines.append(f"Page {number + 1} of {pages}")
+        out.append(lines)
+    return out
+
+
+def _escape(text):
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def pdf_bytes(pages):
+    """A minimal PDF with one text line per entry of each page"""
+    objects = [None, None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        commands = ["BT", "/F1 9 Tf", "11 TL", "40 800 Td"]
+        for line in lines:
+            commands.append(f"({_escape(line)}) Tj T*")
+        commands.append("ET")
+        stream = "\n".join(commands).encode("latin-1", "replace")
+        objects.append(b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    objects[0] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_report(pages=1, seed=0):
+    """PDF bytes of a synthetic report with the given number of pages"""
+    return pdf_bytes(report_lines(pages, random.Random(seed)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic blood test report PDFs")
+    parser.add_argument("directory")
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 5, 20])
+    parser.add_argument("--count", type=int, default=1, help="Reports per page count")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.directory, exist_ok=True)
+    for pages in args.pages:
+        for i in range(args.count):
+            path = os.path.join(args.directory, f"synthetic_{pages}p_{i}.pdf")
+            with open(path, "wb") as f:
+                f.write(make_report(pages, seed=args.seed * 100003 + pages * 1009 + i))
+            print(path)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,216 @@
+## Token-aware compaction of report text before it reaches the agents
+import os
+import re
+import threading
+import contextvars
+from collections import Counter
+from contextlib import contextmanager
+from functools import lru_cache
+
+from agents import AGENT_ROLES
+from metrics import current_agent_role, record_compaction
+from normalise import collapse_spaces
+
+COMPACTION_ENABLED = os.getenv("COMPACTION", "1") != "0"
+
+# What each agent is sent. "panels" limits read_markers_tool to the marker
+# panels the agent works with (abnormal results from other panels are still
+# listed); the budgets cap read_data_tool and read_markers_tool output in tokens.
+PROFILES = {
+    "doctor": {"panels": None, "text_budget": 4000, "marker_budget": 1500},
+    "verifier": {"panels": None, "text_budget": 1000, "marker_budget": 500},
+    "nutritionist": {
+        "panels": ("glucose", "lipids", "vitamins", "iron", "kidney", "liver"),
+        "text_budget": 2000, "marker_budget": 800,
+    },
+    "exercise_specialist": {
+        "panels": ("cbc", "glucose", "lipids", "thyroid", "electrolytes", "kidney"),
+        "text_budget": 2000, "marker_budget": 800,
+    },
+}
+# Used when the caller is not one of the agents above (e.g. the sequential crew)
+DEFAULT_PROFILE = {"panels": None, "text_budget": 6000, "marker_budget": 2000}
+
+for _name, _profile in PROFILES.items():
+    # e.g. COMPACT_TEXT_BUDGET_DOCTOR=3000, COMPACT_MARKER_BUDGET_NUTRITIONIST=600
+    _profile["text_budget"] = int(os.getenv(f"COMPACT_TEXT_BUDGET_{_name.upper()}", _profile["text_budget"]))
+    _profile["marker_budget"] = int(os.getenv(f"COMPACT_MARKER_BUDGET_{_name.upper()}", _profile["marker_budget"]))
+
+_ROLE_NAMES = {role: name for name, role in AGENT_ROLES.items()}
+
+# Page counters, barcodes, punctuation-only filler and "End of report" rules
+_NOISE = re.compile(r"^\s*([:.\-*_|=]*|page \d+ of \d+|\*\d+\*|[A-Z]{30,})\s*$", re.I)
+_END_OF_REPORT = re.compile(r"[-*=]{3,}\s*end of report\s*[-*=]{3,}", re.I)
+
+
+## Token counting
+@lru_cache(maxsize=None)
+def _encoding():
+    try:
+        import tiktoken  # type: ignore
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        # Optional: without tiktoken (or its encoding files) tokens are estimated from length
+        return None
+
+
+def count_tokens(text):
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def fit_to_budget(lines, budget):
+    """Keep whole lines from the start until budget tokens are used, noting what was cut"""
+    kept = []
+    used = 0
+    for index, line in enumerate(lines):
+        cost = count_tokens(line) + 1
+        if used + cost > budget:
+            kept.append(f"[{len(lines) - index} more lines omitted to fit the {budget}-token budget]")
+            break
+        kept.append(line)
+        used += cost
+    return "\n".join(kept)
+
+
+## Boilerplate removal
+def _line_key(line):
+    return " ".join(line.split()).lower()
+
+
+def strip_boilerplate(pages):
+    """Report text without the furniture repeated on every page.
+
+    Lines found on at least half of the pages (headers, lab addresses,
+    footers) are kept only where they first appear. Page counters,
+    barcodes and punctuation-only lines are dropped, as is everything
+    after an "End of report" rule (signatures and disclaimers).
+    """
+    texts = [getattr(page, "page_content", page) for page in pages]
+    lines_by_page = [text.splitlines() for text in texts]
+    repeated = set()
+    if len(texts) > 1:
+        counts = Counter(key for lines in lines_by_page for key in {_line_key(line) for line in lines})
+        threshold = max(2, (len(texts) + 1) // 2)
+        repeated = {key for key, count in counts.items() if count >= threshold}
+
+    seen = set()
+    out = []
+    for lines in lines_by_page:
+        for line in lines:
+            if _END_OF_REPORT.search(line):
+                return "\n".join(out) + "\n"
+            key = _line_key(line)
+            if not key or _NOISE.match(line):
+                continue
+            if key in repeated:
+                if key in seen:
+                    continue
+                seen.add(key)
+            out.append(collapse_spaces(line.strip()))
+    return "\n".join(out) + "\n"
+
+
+## Per-request savings
+class CompactionStats:
+    """Tokens in the full report versus tokens actually sent, per agent and tool"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.calls = {}
+
+    def add(self, agent, tool, original, sent):
+        with self._lock:
+            entry = self.calls.setdefault((agent, tool), [0, 0, 0])
+            entry[0] += 1
+            entry[1] += original
+            entry[2] += sent
+
+    def to_dict(self):
+        with self._lock:
+            original = sum(entry[1] for entry in self.calls.values())
+            sent = sum(entry[2] for entry in self.calls.values())
+            by_agent = {}
+            for (agent, tool), (calls, tool_original, tool_sent) in sorted(self.calls.items()):
+                by_agent.setdefault(agent, {})[tool] = {
+                    "calls": calls, "original_tokens": tool_original, "sent_tokens": tool_sent,
+                }
+        return {
+            "original_tokens": original,
+            "sent_tokens": sent,
+            "saved_tokens": original - sent,
+            "saved_ratio": round((original - sent) / original, 4) if original else 0.0,
+            "by_agent": by_agent,
+        }
+
+
+_current_stats = contextvars.ContextVar("compaction_stats", default=None)
+
+
+@contextmanager
+def track_compaction():
+    """Collect the token savings of every tool call made in this context"""
+    stats = CompactionStats()
+    token = _current_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _current_stats.reset(token)
+
+
+def _record(agent, tool, original, sent):
+    stats = _current_stats.get()
+    if stats is not None:
+        stats.add(agent, tool, original, sent)
+    record_compaction(original, sent)
+
+
+## Agent views of a report
+def _profile(role=None):
+    role = current_agent_role() if role is None else role
+    name = _ROLE_NAMES.get(role, "default")
+    return name, PROFILES.get(name, DEFAULT_PROFILE)
+
+
+def text_for_agent(report, role=None):
+    """The report text for the calling agent: boilerplate removed and cut to its token budget"""
+    if not COMPACTION_ENABLED:
+        return report.text
+    name, profile = _profile(role)
+    text = fit_to_budget(report.compact_text.splitlines(), profile["text_budget"])
+    _record(name, "read_data_tool", count_tokens(report.text), count_tokens(text))
+    return text
+
+
+def markers_for_agent(report, role=None):
+    """Marker lines for the calling agent's panels, abnormal results first, cut to its token budget.
+
+    None when no markers could be extracted.
+    """
+    table = report.markers
+    if table is None or not len(table):
+        return None
+    full = table.to_text()
+    if not COMPACTION_ENABLED:
+        return full
+
+    from markers import NORMAL
+    name, profile = _profile(role)
+    panels = profile["panels"]
+    relevant = table.select(panels=panels) if panels else table
+    lines = relevant.abnormal().to_text().splitlines()
+    others = table.abnormal()
+    if panels and len(others):
+        others = others.take([panel not in panels for panel in others.panel])
+    normal = relevant.take(relevant.flag == NORMAL)
+    if panels and len(others):
+        lines += ["Abnormal results outside this specialty:"] + others.to_text().splitlines()
+        if len(normal):
+            lines.append("Other results for this specialty:")
+    lines += normal.to_text().splitlines()
+
+    text = fit_to_budget([line for line in lines if line], profile["marker_budget"])
+    _record(name, "read_markers_tool", count_tokens(full), count_tokens(text))
+    return text
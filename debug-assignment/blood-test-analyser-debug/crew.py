@@ -0,0 +1,516 @@
+## Importing libraries and files
+import os
+import re
+import copy
+import json
+import asyncio
+import inspect
+import uuid
+import queue
+import threading
+import contextvars
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from document import load_report, use_report, current_report
+from compaction import track_compaction
+from history import use_history, history_digest
+from llm_cache import llm_cache, make_key, model_name, prompt_fingerprint
+from rate_limit import llm_context, INTERACTIVE
+from metrics import span
+from streaming import check_cancelled
+
+# crewai, the agents and the tasks are slow to import, so they are loaded on
+# first use (or by the app's warm-up) instead of when this module is imported
+from agents import LLM_PROVIDER, CREW_VERBOSE
+
+# Mock classes used when crewai is missing or LLM_PROVIDER=mock
+class MockCrew:
+    """Runs each task's tools and then its agent's (mock) LLM, so offline runs do the real non-LLM work"""
+    def __init__(self, **kwargs):
+        self.agents = kwargs.get('agents', [])
+        self.tasks = kwargs.get('tasks', [])
+        self.process = kwargs.get('process', 'sequential')
+        self.task_callback = kwargs.get('task_callback')
+    def kickoff(self, inputs):
+        outputs = []
+        for task in self.tasks:
+            output = MockTaskOutput(task, _mock_execute(task, inputs))
+            outputs.append(output)
+            if self.task_callback:
+                self.task_callback(output)
+        return MockCrewOutput(outputs, inputs)
+
+class MockTaskOutput:
+    def __init__(self, task, raw=None):
+        self.description = getattr(task, 'description', getattr(task, 'name', 'Mock Task'))
+        self.agent = getattr(task, 'agent', None)
+        self.raw = raw or f"Mock output for: {self.description[:50]}"
+
+class MockCrewOutput:
+    def __init__(self, tasks_output, inputs):
+        self.tasks_output = tasks_output
+        self.raw = tasks_output[-1].raw if tasks_output else f"Mock crew analysis for: {inputs}"
+    def __str__(self):
+        return self.raw
+
+def _mock_execute(task, inputs):
+    """Call every tool of task, then the agent's LLM with the task prompt and the tool results"""
+    results = []
+    for tool in getattr(task, 'tools', None) or []:
+        if not callable(tool):
+            continue
+        # Tools that take the report text get "", meaning the report of the current request
+        required = [
+            p for p in inspect.signature(tool).parameters.values()
+            if p.default is inspect.Parameter.empty and p.kind in (p.POSITIONAL_ONLY, p.POSITIONAL_OR_KEYWORD)
+        ]
+        result = tool(*[""] * len(required))
+        if inspect.iscoroutine(result):
+            result = asyncio.run(result)
+        results.append(str(result))
+
+    llm = getattr(getattr(task, 'agent', None), 'llm', None)
+    if not callable(llm):
+        return None
+    description = getattr(task, 'description', '')
+    try:
+        description = description.format(**inputs)
+    except (KeyError, IndexError, ValueError):
+        pass
+    return str(llm("\n\n".join([description, *results])))
+
+class MockProcess:
+    sequential = "sequential"
+
+# Task names in the order build_crew() lays the tasks out
+TASK_NAMES = ("verification", "help_patients", "nutrition_analysis", "exercise_planning")
+AGENT_NAMES = ("verifier", "doctor", "nutritionist", "exercise_specialist")
+
+class CrewParts:
+    """The Crew and Process classes in use plus the shared agents and tasks"""
+    def __init__(self, crew_class, process, agents, tasks):
+        self.crew_class = crew_class
+        self.process = process
+        self.agents = agents
+        self.tasks = tasks
+
+_parts_lock = threading.Lock()
+_parts = None
+_prompt_version = None
+
+def _load_parts():
+    crew_class, process = MockCrew, MockProcess
+    if LLM_PROVIDER != "mock":
+        try:
+            from crewai import Crew as crew_class, Process as process  # type: ignore
+        except ImportError:
+            print("Warning: crewai package not available. Please install it with: pip install crewai")
+
+    try:
+        from agents import get_agents
+        agents = get_agents()
+    except ImportError:
+        print("Warning: agents module not available. Creating mock agents.")
+        class MockAgent:
+            def __init__(self, name):
+                self.name = name
+        agents = {name: MockAgent(name) for name in AGENT_NAMES}
+
+    try:
+        from task import get_tasks
+        tasks = get_tasks()
+    except ImportError:
+        print("Warning: task module not available. Creating mock tasks.")
+        class MockTask:
+            def __init__(self, name):
+                self.name = name
+        tasks = {name: MockTask(name) for name in TASK_NAMES}
+
+    return CrewParts(
+        crew_class, process,
+        [agents[name] for name in AGENT_NAMES],
+        [tasks[name] for name in TASK_NAMES],
+    )
+
+def crew_parts():
+    """Load crewai, the LLM, the tools, the agents and the tasks once"""
+    global _parts
+    with _parts_lock:
+        if _parts is None:
+            _parts = _load_parts()
+        return _parts
+
+def prompt_version():
+    """Changes whenever an agent or task prompt changes, invalidating cached responses"""
+    global _prompt_version
+    if _prompt_version is None:
+        parts = crew_parts()
+        _prompt_version = prompt_fingerprint(*parts.agents, *parts.tasks)
+    return _prompt_version
+
+def build_crew(task_callback=None):
+    """Build the medical crew with all specialists"""
+    parts = crew_parts()
+    return parts.crew_class(
+        agents=parts.agents,
+        tasks=parts.tasks,
+        process=parts.process.sequential,
+        verbose=CREW_VERBOSE,
+        task_callback=task_callback
+    )
+
+def build_task_crews(crew):
+    """One single-task crew per task of crew, sharing its agents and tasks, keyed by task name"""
+    parts = crew_parts()
+    return {
+        name: parts.crew_class(
+            agents=[task.agent],
+            tasks=[task],
+            process=parts.process.sequential,
+            verbose=CREW_VERBOSE
+        )
+        for name, task in zip(TASK_NAMES, crew.tasks)
+    }
+
+## Creating the crew pool
+class PooledCrew:
+    """A pooled crew plus a prebuilt single-task crew for each of its tasks.
+
+    The single-task crews hold the crew's own agent and task copies, so
+    pipeline stages run on pooled objects instead of building a Crew per task.
+    """
+
+    def __init__(self, crew, task_crews):
+        self.crew = crew
+        self.task_crews = task_crews
+
+    @property
+    def tasks(self):
+        return self.crew.tasks
+
+
+class CrewPool:
+    """Prebuilt crews checked out one per request.
+
+    Each pooled crew owns its own copies of the agents and tasks, so
+    concurrent runs never share task outputs or memory. Crews are reset
+    when checked back in; if every crew is busy an extra one is built
+    rather than making the request wait.
+    """
+
+    def __init__(self, size=None, factory=None):
+        self.size = int(size or os.getenv("CREW_POOL_SIZE", os.getenv("CREW_MAX_WORKERS", "4")))
+        self._factory = factory or build_crew
+        self._prototype = None
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.checkouts = 0
+        self.overflow = 0
+
+    def _build(self):
+        with self._lock:
+            if self._prototype is None:
+                self._prototype = self._factory()
+            self.created += 1
+        # crewai's Crew.copy() deep-copies agents and tasks; mock crews are rebuilt around
+        # copies of the shared tasks, since run_pipeline sets each task's context per run
+        if hasattr(self._prototype, "copy"):
+            crew = self._prototype.copy()
+        else:
+            crew = self._factory()
+            crew.tasks = [copy.copy(task) for task in crew.tasks]
+        return PooledCrew(crew, build_task_crews(crew))
+
+    def warm(self):
+        """Build crews until the pool holds size idle crews"""
+        while self._idle.qsize() < self.size:
+            self._idle.put(self._build())
+
+    @staticmethod
+    def reset(pooled):
+        """Clear per-run state so the next request starts clean"""
+        crew = pooled.crew
+        callbacks = []
+        for each in (crew, *pooled.task_crews.values()):
+            if getattr(each, "task_callback", None) is not None:
+                callbacks.append(each.task_callback)
+                each.task_callback = None
+        for task in getattr(crew, "tasks", []):
+            if hasattr(task, "output"):
+                task.output = None
+            # kickoff copies the crew callback onto tasks that have none of their own
+            if any(getattr(task, "callback", None) is callback for callback in callbacks):
+                task.callback = None
+        reset_memories = getattr(crew, "reset_memories", None)
+        if reset_memories is not None:
+            # Long-term memory is meant to persist between runs; the rest is per run
+            for command_type in ("short", "entity"):
+                try:
+                    reset_memories(command_type=command_type)
+                except Exception:
+                    pass
+
+    @contextmanager
+    def checkout(self, task_callback=None):
+        try:
+            crew = self._idle.get_nowait()
+        except queue.Empty:
+            crew = self._build()
+            with self._lock:
+                self.overflow += 1
+        with self._lock:
+            self.checkouts += 1
+
+        pooled = crew
+        pooled.crew.task_callback = task_callback
+        try:
+            yield pooled
+        finally:
+            self.reset(pooled)
+            if self._idle.qsize() < self.size:
+                self._idle.put(pooled)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "overflow": self.overflow,
+            }
+
+
+crew_pool = CrewPool()
+
+## Dependency-aware pipelines
+# Each mode is a list of stages; tasks in a stage run concurrently and see
+# the outputs of every earlier stage. "sequential" runs the crew as one unit.
+PIPELINES = {
+    "full": [["verification"], ["help_patients"], ["nutrition_analysis", "exercise_planning"]],
+    "fast": [["verification"], ["help_patients"], ["nutrition_analysis"]],
+    "sequential": None,
+}
+DEFAULT_MODE = os.getenv("CREW_PIPELINE_MODE", "full")
+
+# The verification task must open with this line; only its INVALID form stops the pipeline
+_VERDICT = re.compile(r"VERDICT:\s*(VALID|INVALID)", re.I)
+
+
+def verification_verdict(text):
+    """"VALID" or "INVALID" from the verifier's first line, or None if it gave no verdict"""
+    for line in (text or "").splitlines():
+        line = line.strip().strip("*_#`> ").strip()
+        if line:
+            match = _VERDICT.fullmatch(line)
+            return match.group(1).upper() if match else None
+    return None
+
+_stage_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("CREW_STAGE_WORKERS", "8")), thread_name_prefix="crew-stage"
+)
+
+
+class VerificationFailed(Exception):
+    """Raised when the verification task rejects the uploaded document"""
+
+    def __init__(self, output):
+        super().__init__("The uploaded document did not pass verification")
+        self.output = output
+
+
+class StageOutput:
+    """Output of one pipeline task, shaped like crewai's TaskOutput"""
+
+    def __init__(self, name, task, result):
+        self.name = name
+        self.description = getattr(task, 'description', name)
+        self.agent = getattr(getattr(task, 'agent', None), 'role', None)
+        tasks_output = getattr(result, 'tasks_output', None)
+        self.raw = getattr(tasks_output[-1], 'raw', None) if tasks_output else None
+        if self.raw is None:
+            self.raw = str(result)
+
+    def __str__(self):
+        return self.raw
+
+
+class PipelineResult:
+    """Outputs of a pipeline run, in stage order"""
+
+    def __init__(self, mode, tasks_output):
+        self.mode = mode
+        self.tasks_output = tasks_output
+        # Report tokens sent against the full text, set by run_crew
+        self.compaction = None
+
+    def __str__(self):
+        return "\n\n".join(f"## {output.name}\n{output.raw}" for output in self.tasks_output)
+
+
+class SequentialOutput:
+    """A sequential crew run, live or served from the cache, shaped like crewai's CrewOutput.
+
+    crewai's own CrewOutput is a pydantic model that rejects unknown
+    attributes, so run_crew returns this wrapper to carry the compaction stats.
+    """
+
+    def __init__(self, tasks_output, raw=None):
+        self.tasks_output = tasks_output
+        self.raw = raw if raw is not None else (tasks_output[-1].raw if tasks_output else "")
+        self.compaction = None
+
+    def __str__(self):
+        return self.raw
+
+
+def _cache_key(role, llm, inputs):
+    report = current_report()
+    if report is None:
+        return None
+    # The same report with a different patient history can get a different answer
+    digest = report.content_hash + history_digest()
+    return make_key(digest, inputs['query'], role, model_name(llm), prompt_version())
+
+
+def _restore_output(task, output):
+    """Give a skipped task its cached output so later tasks can use it as context"""
+    if not hasattr(task, 'output'):
+        return
+    try:
+        from crewai.tasks.task_output import TaskOutput  # type: ignore
+    except ImportError:
+        return
+    try:
+        task.output = TaskOutput(description=output.description, raw=output.raw, agent=output.agent or "")
+    except Exception:
+        pass
+
+
+def _run_task(name, medical_crew, inputs, task_callback):
+    """Run a single task of a pooled crew through its prebuilt one-task crew"""
+    single = medical_crew.task_crews[name]
+    role = getattr(getattr(single.tasks[0], 'agent', None), 'role', None)
+    with span(f"task.{name}", agent_role=role):
+        single.task_callback = task_callback
+        return single.kickoff(inputs)
+
+
+def run_pipeline(medical_crew, mode, inputs, task_callback=None):
+    """Run medical_crew's tasks stage by stage according to PIPELINES[mode].
+
+    Verification gates everything after it: if it raises or rejects the
+    document, the remaining stages are skipped and VerificationFailed is raised.
+    """
+    tasks = dict(zip(TASK_NAMES, medical_crew.tasks))
+    original_context = {name: getattr(task, 'context', None) for name, task in tasks.items()}
+    outputs = []
+    finished = []
+    try:
+        for stage in PIPELINES[mode]:
+            # A streaming client that disconnected no longer needs the remaining stages
+            check_cancelled()
+            for name in stage:
+                # Later tasks read earlier outputs through crewai's task context
+                if finished and hasattr(tasks[name], 'context'):
+                    tasks[name].context = [tasks[done] for done in finished]
+
+            stage_outputs = {}
+            keys = {}
+            for name in stage:
+                agent = getattr(tasks[name], 'agent', None)
+                keys[name] = _cache_key(getattr(agent, 'role', name), getattr(agent, 'llm', None), inputs)
+                cached = llm_cache.get(keys[name]) if keys[name] else None
+                if cached is not None:
+                    stage_outputs[name] = StageOutput(name, tasks[name], cached)
+                    _restore_output(tasks[name], stage_outputs[name])
+                    if task_callback is not None:
+                        task_callback(stage_outputs[name])
+
+            to_run = [name for name in stage if name not in stage_outputs]
+            if len(to_run) == 1:
+                results = [_run_task(to_run[0], medical_crew, inputs, task_callback)]
+            else:
+                futures = [
+                    _stage_executor.submit(contextvars.copy_context().run, _run_task, name, medical_crew, inputs, task_callback)
+                    for name in to_run
+                ]
+                results = [future.result() for future in futures]
+
+            for name, result in zip(to_run, results):
+                stage_outputs[name] = StageOutput(name, tasks[name], result)
+                if keys[name]:
+                    llm_cache.put(keys[name], stage_outputs[name].raw, prompt_version())
+
+            for name in stage:
+                output = stage_outputs[name]
+                # Free-form text is never interpreted; a missing verdict lets the run continue,
+                # since uploads that are plainly not lab reports were already screened out
+                if name == "verification" and verification_verdict(output.raw) == "INVALID":
+                    raise VerificationFailed(output.raw)
+                outputs.append(output)
+            finished.extend(stage)
+    finally:
+        for name, task in tasks.items():
+            if hasattr(task, 'context'):
+                task.context = original_context[name]
+    return PipelineResult(mode, outputs)
+
+def _cached_sequential(cached, medical_crew, task_callback=None):
+    """SequentialOutput rebuilt from a cached sequential run, or None on a miss"""
+    try:
+        raws = json.loads(cached) if cached is not None else None
+    except ValueError:
+        return None
+    if not isinstance(raws, list) or len(raws) != len(medical_crew.tasks):
+        return None
+    outputs = [StageOutput(name, task, raw) for name, task, raw in zip(TASK_NAMES, medical_crew.tasks, raws)]
+    if task_callback is not None:
+        for output in outputs:
+            task_callback(output)
+    return SequentialOutput(outputs)
+
+def run_crew(query: str, file_path: str="data/sample.pdf", task_callback=None, report=None, mode=None,
+             priority=INTERACTIVE, flow=None, history=None):
+    """To run the whole crew with all specialists
+
+    Pass an already parsed report to skip loading file_path from disk, and
+    a mode from PIPELINES to choose which tasks run and in what order.
+    priority and flow tag the run's LLM calls for the shared rate limiter.
+    history is the patient's trend summary, which the marker tool adds for the agents.
+    """
+    mode = mode or DEFAULT_MODE
+    if mode not in PIPELINES:
+        raise ValueError(f"Unknown pipeline mode: {mode}")
+
+    # Parse the PDF once up front; every tool call in this run reads the shared copy
+    if report is None:
+        report = load_report(file_path)
+    inputs = {'query': query, 'file_path': file_path or "uploaded report"}
+    flow = flow or uuid.uuid4().hex
+    with crew_pool.checkout(task_callback) as medical_crew, use_report(report), llm_context(priority, flow), \
+            span("crew", mode=mode) as crew_span, track_compaction() as compaction, use_history(history):
+        if PIPELINES[mode] is not None:
+            result = run_pipeline(medical_crew, mode, inputs, task_callback)
+        else:
+            # The single sequential crew is cached as one unit
+            key = _cache_key("crew:sequential", getattr(crew_parts().agents[1], 'llm', None), inputs)
+            result = _cached_sequential(llm_cache.get(key) if key else None, medical_crew, task_callback)
+            if result is None:
+                with span("task.sequential"):
+                    output = medical_crew.crew.kickoff(inputs)
+                result = SequentialOutput(
+                    list(getattr(output, 'tasks_output', None) or []), getattr(output, 'raw', None) or str(output)
+                )
+                if key:
+                    # Every task's output is kept, so a hit has the same shape as a run
+                    raws = [getattr(task_output, 'raw', None) or str(task_output) for task_output in result.tasks_output]
+                    llm_cache.put(key, json.dumps(raws), prompt_version())
+
+        # Report tokens each agent was sent against what the full text would have cost
+        savings = compaction.to_dict()
+        crew_span.set(report_tokens_saved=savings["saved_tokens"])
+        result.compaction = savings
+        return result
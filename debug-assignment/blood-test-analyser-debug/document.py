@@ -0,0 +1,285 @@
+## Importing libraries and files
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+import threading
+import contextvars
+from collections import OrderedDict
+from functools import lru_cache
+from contextlib import contextmanager
+
+from normalise import normalise_report
+from metrics import span, record_bytes
+from screening import SCREEN_ENABLED, ReportScreen, screen_pages
+from ocr import ocr_missing_text, page_images
+from uploads import UploadRejected
+
+# The PDF libraries are imported on first parse to keep app start-up fast
+@lru_cache(maxsize=None)
+def _pdf_loader():
+    try:
+        from langchain_community.document_loaders import PDFLoader  # type: ignore
+    except ImportError:
+        print("Warning: PDFLoader not available. Creating mock PDF loader.")
+        class PDFLoader:
+            # Its placeholder text is not a report, so the lab report screen is skipped
+            mock = True
+            def __init__(self, file_path):
+                self.file_path = file_path
+            def load(self):
+                return [MockDocument("Mock PDF content")]
+    return PDFLoader
+
+@lru_cache(maxsize=None)
+def _pdf_reader():
+    try:
+        from pypdf import PdfReader  # type: ignore
+    except ImportError:
+        # Optional: without pypdf, uploads are parsed through a temporary file instead
+        PdfReader = None
+    return PdfReader
+
+@lru_cache(maxsize=None)
+def _pdf_errors():
+    """Exceptions pypdf raises for a malformed document, or () without pypdf"""
+    try:
+        from pypdf.errors import PyPdfError  # type: ignore
+    except ImportError:
+        return ()
+    return (PyPdfError,)
+
+class MockDocument:
+    def __init__(self, content):
+        self.page_content = content
+
+class PageDocument:
+    """One page of text read directly from an in-memory PDF stream"""
+    def __init__(self, content, page):
+        self.page_content = content
+        self.metadata = {"page": page}
+
+
+def content_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+## Parsed report shared by every agent and tool in a request
+class ParsedReport:
+    """A blood test report parsed once: raw page objects plus cleaned text"""
+
+    def __init__(self, digest, pages, text, screen=None):
+        self.content_hash = digest
+        self.pages = pages
+        self.text = text
+        self.size = len(text) + sum(len(page.page_content) for page in pages)
+        # The heuristic screen's verdict (see screening.py), None when screening is off
+        self.screen = screen
+        self._markers = None
+        self._compact_text = None
+
+    @property
+    def markers(self):
+        """Extracted MarkerTable, built on first use and cached with the report.
+
+        None when numpy (and so marker extraction) is not available.
+        """
+        if self._markers is None:
+            try:
+                from markers import extract_markers
+            except ImportError:
+                return None
+            self._markers = extract_markers(self.text)
+        return self._markers
+
+    @property
+    def compact_text(self):
+        """Text with page furniture repeated across pages removed, built on first use"""
+        if self._compact_text is None:
+            from compaction import strip_boilerplate
+            self._compact_text = strip_boilerplate(self.pages)
+        return self._compact_text
+
+
+## Page streams
+def iter_pdf_pages(stream):
+    """Yield a PageDocument per page of an in-memory PDF, extracting text lazily page by page"""
+    reader = _pdf_reader()(stream)
+    pages = (PageDocument(page.extract_text() or "", number) for number, page in enumerate(reader.pages))
+    # Scanned pages have no text layer; they are OCRed from their embedded images instead
+    yield from ocr_missing_text(pages, lambda number: page_images(reader.pages[number]))
+
+
+def iter_loader_pages(path, ocr=True):
+    """Yield the pages of the PDF at path through PDFLoader, lazily where the loader supports it"""
+    loader = _pdf_loader()(file_path=path)
+    pages = loader.lazy_load() if hasattr(loader, "lazy_load") else loader.load()
+    if not ocr or _pdf_reader() is None:
+        yield from pages
+        return
+
+    reader = None
+    def images_for(number):
+        nonlocal reader
+        if reader is None:
+            reader = _pdf_reader()(path)
+        return page_images(reader.pages[number])
+    yield from ocr_missing_text(pages, images_for)
+
+
+def _collect(pages, digest, loader, screen):
+    """Read pages through the screen (if any) and build the report.
+
+    Raises ReportRejected after the first page or two of a document the
+    screen rejects, so the rest of it is never extracted, and UploadRejected
+    (400) for a file with a PDF header that pypdf cannot read.
+    """
+    with span("parse", loader=loader) as current:
+        if screen is not None:
+            pages = screen_pages(pages, screen)
+        docs = []
+        try:
+            for page in pages:
+                docs.append(page)
+        except _pdf_errors() as e:
+            raise UploadRejected(400, f"Uploaded file is not a valid PDF: {e}")
+        finally:
+            current.set(pages=len(docs))
+            if screen is not None:
+                current.set(screen=screen.reason)
+    with span("normalise"):
+        text = normalise_report(docs)
+    return ParsedReport(digest, docs, text, screen.to_dict() if screen is not None else None)
+
+
+def _new_screen(screen):
+    if screen is None:
+        return ReportScreen() if SCREEN_ENABLED else None
+    return screen or None
+
+
+def parse_report(path, digest, screen=None):
+    """Parse the PDF at path; pass screen=False to skip the lab report screen"""
+    mock = getattr(_pdf_loader(), "mock", False)
+    if mock:
+        screen = False
+    return _collect(iter_loader_pages(path, ocr=not mock), digest, "PDFLoader", _new_screen(screen))
+
+
+def parse_stream(stream, digest, screen=None):
+    """Parse a PDF from a file object without writing it under data/"""
+    stream.seek(0)
+    if _pdf_reader() is not None:
+        return _collect(iter_pdf_pages(stream), digest, "pypdf", _new_screen(screen))
+
+    with tempfile.NamedTemporaryFile(suffix=".pdf") as tmp:
+        shutil.copyfileobj(stream, tmp)
+        tmp.flush()
+        return parse_report(tmp.name, digest, screen)
+
+
+## Creating the content-hash keyed LRU cache
+class DocumentCache:
+    """LRU cache of parsed reports keyed by content hash, bounded by count, size and age"""
+
+    def __init__(self, max_entries=None, max_bytes=None, ttl_seconds=None):
+        self.max_entries = int(max_entries or os.getenv("DOC_CACHE_MAX_ENTRIES", "128"))
+        self.max_bytes = int(max_bytes or os.getenv("DOC_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("DOC_CACHE_TTL", "3600"))
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, digest):
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                stored_at, report = entry
+                if time.time() - stored_at <= self.ttl_seconds:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return report
+                self._drop(digest)
+            self.misses += 1
+            return None
+
+    def put(self, report):
+        if report.size > self.max_bytes:
+            return
+        with self._lock:
+            if report.content_hash in self._entries:
+                self._drop(report.content_hash)
+            self._entries[report.content_hash] = (time.time(), report)
+            self._bytes += report.size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, digest):
+        _, report = self._entries.pop(digest)
+        self._bytes -= report.size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+document_cache = DocumentCache()
+
+
+def load_report(path):
+    """Parse the report at path, or return the cached parse of identical content"""
+    with open(path, "rb") as f:
+        digest = content_hash(f.read())
+
+    report = document_cache.get(digest)
+    if report is None:
+        record_bytes("parse", os.path.getsize(path))
+        report = parse_report(path, digest)
+        document_cache.put(report)
+    return report
+
+
+def load_uploaded_report(upload):
+    """Parse a spooled upload, or return the cached parse of identical content"""
+    report = document_cache.get(upload.content_hash)
+    if report is None:
+        record_bytes("parse", upload.size)
+        report = parse_stream(upload.file, upload.content_hash)
+        document_cache.put(report)
+    return report
+
+
+## Per-request document context
+_current_report = contextvars.ContextVar("current_report", default=None)
+
+
+@contextmanager
+def use_report(report):
+    """Make report the document every tool call in this context reads from"""
+    token = _current_report.set(report)
+    try:
+        yield report
+    finally:
+        _current_report.reset(token)
+
+
+def current_report():
+    return _current_report.get()
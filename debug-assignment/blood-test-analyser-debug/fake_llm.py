@@ -0,0 +1,164 @@
+"""Local OpenAI-compatible chat completions server for offline testing.
+
+Answers POST /v1/chat/completions with a canned reply after a fixed
+latency and enforces its own requests/tokens-per-minute quota, returning
+429 with Retry-After like a real provider. Point the app at it with
+OPENAI_API_BASE=http://127.0.0.1:8001/v1.
+
+    python fake_llm.py --port 8001 --rpm 30 --tpm 20000 --latency 0.5
+"""
+import json
+import time
+import argparse
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class Quota:
+    """Sliding one-minute window of requests and tokens"""
+
+    def __init__(self, rpm, tpm):
+        self.rpm = rpm
+        self.tpm = tpm
+        self._events = deque()
+        self._lock = threading.Lock()
+
+    def admit(self, tokens):
+        """Record the request and return 0, or the seconds until it would fit"""
+        with self._lock:
+            now = time.monotonic()
+            while self._events and now - self._events[0][0] >= 60:
+                self._events.popleft()
+            used = sum(t for _, t in self._events)
+            if (self.rpm and len(self._events) >= self.rpm) or (self.tpm and used + tokens > self.tpm):
+                return max(0.1, 60 - (now - self._events[0][0])) if self._events else 1.0
+            self._events.append((now, tokens))
+            return 0.0
+
+
+class FakeLLMHandler(BaseHTTPRequestHandler):
+    server_version = "FakeLLM/1.0"
+    # Keep connections open between requests, like a real provider
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        # Anything but chat completions, e.g. connection warm-up requests
+        self._send_json(200, {"status": "ok"})
+
+    def do_POST(self):
+        # Read the body even when rejecting, so the kept-alive connection stays in sync
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length)
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        payload = json.loads(body or b"{}")
+        prompt = " ".join(str(m.get("content", "")) for m in payload.get("messages", []))
+        prompt_tokens = max(1, len(prompt) // 4)
+        completion = self.server.reply
+        completion_tokens = max(1, len(completion) // 4)
+
+        stats = self.server.stats
+        wait = self.server.quota.admit(prompt_tokens + completion_tokens)
+        if wait:
+            with self.server.lock:
+                stats["throttled"] += 1
+            self._send_json(
+                429,
+                {"error": {"message": "Rate limit reached", "type": "rate_limit_error"}},
+                {"Retry-After": f"{wait:.1f}"},
+            )
+            return
+
+        time.sleep(self.server.latency)
+        with self.server.lock:
+            stats["completed"] += 1
+            stats["tokens"] += prompt_tokens + completion_tokens
+        self._send_json(200, {
+            "id": f"chatcmpl-fake-{stats['completed']}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": payload.get("model", "fake-model"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": completion},
+                "finish_reason": "stop",
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        })
+
+
+class FakeLLMServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, rpm=0, tpm=0, latency=0.0,
+                 reply="Thought: I now know the final answer\nFinal Answer: Mock analysis of the blood test report."):
+        super().__init__((host, port), FakeLLMHandler)
+        self.quota = Quota(rpm, tpm)
+        self.latency = latency
+        self.reply = reply
+        self.lock = threading.Lock()
+        self.stats = {"completed": 0, "throttled": 0, "tokens": 0}
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        """Serve on a background thread; returns self for use in a with block"""
+        self._thread = threading.Thread(target=self.serve_forever, name="fake-llm", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible LLM server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--rpm", type=int, default=0, help="Requests per minute before 429 (0 = unlimited)")
+    parser.add_argument("--tpm", type=int, default=0, help="Tokens per minute before 429 (0 = unlimited)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Seconds to wait before answering")
+    args = parser.parse_args(argv)
+
+    server = FakeLLMServer(args.host, args.port, args.rpm, args.tpm, args.latency)
+    print(f"Fake LLM listening on {server.base_url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
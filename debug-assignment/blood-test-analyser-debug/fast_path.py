@@ -0,0 +1,195 @@
+## Rule-based answers to common queries, without the LLM crew
+import os
+import re
+
+from llm_cache import normalise_query
+from metrics import span
+
+# auto: classify the query and use the crew only when rules cannot answer it; rules: always use rules
+ROUTING_MODES = ("auto", "rules")
+DEFAULT_ANALYZE_MODE = os.getenv("ANALYZE_MODE", "auto")
+
+SUMMARY = "summary"
+MARKER_STATUS = "marker_status"
+COMPLEX = "complex"
+
+# Words that make a question more than a lookup: advice, causes, plans, comparisons
+_COMPLEX_WORDS = re.compile(
+    r"\b(why|should|diet|food|foods|eat|eating|exercise|exercises|workout|supplement\w*|medic\w*|treat\w*|"
+    r"cause\w*|risk\w*|improve|lower|raise|reduce|increase|plan|compare\w*|trend\w*|history|advice|advise|"
+    r"recommend\w*|pregnan\w*|symptom\w*|diagnos\w*|disease\w*|worr\w*|serious|danger\w*|mean|means|"
+    r"how can|how do|how should|what can|what should)\b"
+)
+# Words a plain "summarise my report" request is made of
+_SUMMARY_WORDS = {
+    "summarise", "summarize", "summary", "summarised", "summarized", "overview", "analyse", "analyze",
+    "analysis", "explain", "interpret", "review", "read", "check", "results", "result", "report", "reports",
+    "blood", "test", "tests", "lab", "my", "the", "this", "a", "of", "please", "can", "could", "you", "me",
+    "give", "show", "tell", "about", "what", "does", "do", "say", "says", "in", "is", "are", "for", "quick",
+    "brief", "short", "overall",
+}
+# Words that, with a marker name, still only ask for its value or status
+_STATUS_WORDS = {
+    "is", "are", "was", "were", "my", "the", "a", "an", "of", "in", "what", "whats", "what's", "how", "hows",
+    "how's", "level", "levels", "value", "values", "count", "result", "results", "normal", "ok", "okay",
+    "fine", "good", "bad", "high", "low", "healthy", "within", "range", "reference", "check", "show", "tell",
+    "me", "please", "and", "or", "too", "abnormal", "elevated", "it", "its", "blood", "test", "report", "about",
+}
+MAX_STATUS_WORDS = 16
+
+_WORD = re.compile(r"[a-z0-9']+")
+
+
+def _alias_pattern():
+    try:
+        from markers import ANALYTES
+    except ImportError:
+        return None, {}
+    aliases = {}
+    for key, (_, _, _, names) in ANALYTES.items():
+        for alias in names:
+            aliases.setdefault(alias, key)
+    ordered = sorted(aliases, key=len, reverse=True)
+    return re.compile(r"(?<![\w-])(" + "|".join(re.escape(alias) for alias in ordered) + r")(?![\w-])"), aliases
+
+
+_ALIASES = None
+
+
+def mentioned_markers(query):
+    """Analyte keys named in query, in order of mention"""
+    global _ALIASES
+    if _ALIASES is None:
+        _ALIASES = _alias_pattern()
+    pattern, aliases = _ALIASES
+    if pattern is None:
+        return [], query
+    keys = []
+    for match in pattern.finditer(query):
+        key = aliases[match.group(1)]
+        if key not in keys:
+            keys.append(key)
+    return keys, pattern.sub(" ", query)
+
+
+def classify(query):
+    """(intent, marker keys) for a query: SUMMARY, MARKER_STATUS or COMPLEX"""
+    query = normalise_query(query)
+    if not query:
+        return SUMMARY, []
+    if _COMPLEX_WORDS.search(query):
+        return COMPLEX, []
+    keys, rest = mentioned_markers(query)
+    words = _WORD.findall(rest)
+    if not keys:
+        return (SUMMARY, []) if words and set(words) <= _SUMMARY_WORDS else (COMPLEX, [])
+    if len(_WORD.findall(query)) <= MAX_STATUS_WORDS and set(words) <= _STATUS_WORDS:
+        return MARKER_STATUS, keys
+    return COMPLEX, []
+
+
+def route(mode, query, report):
+    """"rules" for the fast path, else the crew pipeline mode to run (None for the default).
+
+    mode is "rules", "auto" or a crew pipeline mode; auto uses the rules
+    only for summaries and marker lookups, and only when markers were
+    extracted from the report.
+    """
+    if mode == "rules":
+        return "rules"
+    if mode != "auto":
+        return mode
+    table = report.markers
+    if table is None or not len(table):
+        return None
+    return "rules" if classify(query)[0] != COMPLEX else None
+
+
+## Answers
+def _reference(record):
+    low, high, unit = record["low"], record["high"], record["unit"]
+    if low is not None and high is not None:
+        return f"{low:g}-{high:g} {unit}".strip()
+    if high is not None:
+        return f"below {high:g} {unit}".strip()
+    if low is not None:
+        return f"above {low:g} {unit}".strip()
+    return None
+
+
+def _status_line(record):
+    from markers import HIGH, LOW
+
+    value = f"{record['value']:g} {record['unit']}".strip()
+    reference = _reference(record)
+    if reference is None:
+        return f"{record['name']} is {value}; the report gives no reference range for it."
+    if record["flag"] == HIGH:
+        return f"{record['name']} is {value}, above the reference range ({reference})."
+    if record["flag"] == LOW:
+        return f"{record['name']} is {value}, below the reference range ({reference})."
+    return f"{record['name']} is {value}, within the reference range ({reference})."
+
+
+def summarise(table, history=None):
+    records = table.to_records()
+    abnormal = [record for record in records if record["flag"]]
+    panels = sorted({record["panel"] for record in records})
+    lines = [f"Summary of {len(records)} results across {len(panels)} panels ({', '.join(panels)})."]
+    if abnormal:
+        lines.append(f"{len(abnormal)} result(s) are outside the reference range:")
+        lines.extend(f"- {_status_line(record)}" for record in abnormal)
+    else:
+        lines.append("All results are within their reference ranges.")
+    normal_panels = sorted({record["panel"] for record in records} - {record["panel"] for record in abnormal})
+    if normal_panels and abnormal:
+        lines.append(f"Everything in these panels is within range: {', '.join(normal_panels)}.")
+    if history:
+        lines += ["", "Trends from previous reports:", history]
+    return "\n".join(lines)
+
+
+def marker_status(table, keys):
+    lines = []
+    for key in keys:
+        record = table.get(key)
+        if record is None:
+            from markers import ANALYTES
+            lines.append(f"{ANALYTES[key][0]} was not found in this report.")
+        else:
+            lines.append(_status_line(record))
+    return "\n".join(lines)
+
+
+DISCLAIMER = (
+    "These results are compared with the reference ranges printed on the report. "
+    "Please discuss them with your doctor, who can interpret them in the context of your health."
+)
+
+
+class FastPathResult:
+    """Rule-based answer, shaped like the crew's results"""
+
+    def __init__(self, intent, raw):
+        self.intent = intent
+        self.raw = raw
+        self.tasks_output = []
+
+    def __str__(self):
+        return self.raw
+
+
+def answer(query, report, history=None):
+    """Answer query from the report's markers alone"""
+    intent, keys = classify(query)
+    with span("fast_path", intent=intent):
+        table = report.markers
+        if table is None or not len(table):
+            return FastPathResult(intent, "No structured lab markers could be extracted from this report.")
+        if intent == MARKER_STATUS:
+            text = marker_status(table, keys)
+        else:
+            text = summarise(table, history)
+            if intent == COMPLEX:
+                text += "\n\nThis question needs the full specialist analysis; send it with mode=auto or full."
+        return FastPathResult(intent, f"{text}\n\n{DISCLAIMER}")
@@ -0,0 +1,328 @@
+## Longitudinal patient history of extracted marker values
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import datetime
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Opt-in: nothing about a patient is kept unless HISTORY=1
+HISTORY_ENABLED = os.getenv("HISTORY", "0") == "1"
+
+# Changes smaller than this fraction of the first value count as stable
+STABLE_FRACTION = float(os.getenv("HISTORY_STABLE_FRACTION", "0.05"))
+
+# How numeric report dates are read: dmy (05/03/2024 is 5 March), mdy, or strict,
+# which refuses dates whose day and month could be swapped
+DATE_ORDER = os.getenv("HISTORY_DATE_ORDER", "dmy").lower()
+
+_DATE = re.compile(r"\b(?:(\d{4})-(\d{2})-(\d{2})|(\d{1,2})[/.-](\d{1,2})[/.-](\d{4}))\b")
+_FLAG_LABELS = {-1: "LOW", 0: "normal", 1: "HIGH"}
+
+
+class AmbiguousDate(ValueError):
+    """Raised in strict mode when a report date reads differently as day/month and month/day"""
+
+
+def report_date(text, order=None):
+    """Collection date of a report: the first valid date in its text as YYYY-MM-DD, or None.
+
+    ISO dates are read as such; other dates follow order (default
+    HISTORY_DATE_ORDER). In strict mode an ambiguous date raises AmbiguousDate.
+    """
+    order = (order or DATE_ORDER).lower()
+    if order not in ("dmy", "mdy", "strict"):
+        raise ValueError(f"Unknown date order: {order}")
+    for iso_year, iso_month, iso_day, first, second, year in _DATE.findall(text or ""):
+        if iso_year:
+            year, month, day = iso_year, iso_month, iso_day
+        elif order == "mdy":
+            month, day = first, second
+        else:
+            day, month = first, second
+            if order == "strict" and first != second and int(first) <= 12 and int(second) <= 12:
+                raise AmbiguousDate(
+                    f"Report date {first}/{second}/{year} could be day/month or month/day; pass collected_on"
+                )
+        try:
+            return datetime.date(int(year), int(month), int(day)).isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+## Vectorized trend statistics
+def compute_trends(keys, dates, values):
+    """Per-marker trend statistics over rows sorted by key and then date.
+
+    Every statistic is computed for all markers at once with grouped NumPy
+    reductions: first and last value, total and latest change, and the
+    least-squares slope of value against time, in units per year.
+    """
+    # numpy is only needed once history is queried, so it stays off the app's import path
+    import numpy as np
+
+    keys = np.asarray(keys, dtype=object)
+    if not len(keys):
+        return {}
+    days = np.asarray(dates, dtype="datetime64[D]").astype(np.int64).astype(np.float64)
+    values = np.asarray(values, dtype=np.float64)
+
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    ends = np.r_[starts[1:], len(keys)] - 1
+    counts = ends - starts + 1
+
+    # Centre each group's days on its first date for a numerically stable fit
+    x = days - np.repeat(days[starts], counts)
+    sum_x = np.add.reduceat(x, starts)
+    sum_y = np.add.reduceat(values, starts)
+    sum_xy = np.add.reduceat(x * values, starts)
+    sum_xx = np.add.reduceat(x * x, starts)
+    denominator = counts * sum_xx - sum_x ** 2
+    with np.errstate(invalid="ignore", divide="ignore"):
+        slope_per_day = np.where(denominator > 0, (counts * sum_xy - sum_x * sum_y) / denominator, np.nan)
+
+    first, last = values[starts], values[ends]
+    previous = values[np.maximum(ends - 1, starts)]
+    change = last - first
+    with np.errstate(invalid="ignore", divide="ignore"):
+        relative = np.where(first != 0, np.abs(change) / np.abs(first), np.abs(change))
+    direction = np.where(
+        (counts < 2) | (relative <= STABLE_FRACTION), "stable", np.where(change > 0, "rising", "falling")
+    )
+
+    trends = {}
+    for i, key in enumerate(keys[starts]):
+        slope = slope_per_day[i] * 365.25
+        trends[key] = {
+            "points": int(counts[i]),
+            "first_date": str(np.datetime64(int(days[starts[i]]), "D")),
+            "last_date": str(np.datetime64(int(days[ends[i]]), "D")),
+            "first": float(first[i]),
+            "last": float(last[i]),
+            "change": round(float(change[i]), 6),
+            "last_change": round(float(last[i] - previous[i]), 6),
+            "slope_per_year": None if np.isnan(slope) else round(float(slope), 4),
+            "direction": str(direction[i]),
+        }
+    return trends
+
+
+## Creating the history store
+class HistoryStore:
+    """SQLite store of marker values per patient and collection date.
+
+    Rows are clustered on (patient_id, key, collected_on), so a trend lookup
+    is a single index range scan whatever the size of the table.
+    """
+
+    def __init__(self, path=None):
+        self.path = path or os.getenv("HISTORY_PATH", "data/history.sqlite3")
+        self._ready = False
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                if not self._ready:
+                    with self._lock:
+                        directory = os.path.dirname(self.path)
+                        if directory:
+                            os.makedirs(directory, exist_ok=True)
+                        conn.execute("PRAGMA journal_mode=WAL")
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS reports ("
+                            " patient_id TEXT NOT NULL,"
+                            " report_hash TEXT NOT NULL,"
+                            " collected_on TEXT NOT NULL,"
+                            " stored_at REAL NOT NULL,"
+                            " PRIMARY KEY (patient_id, report_hash)) WITHOUT ROWID"
+                        )
+                        conn.execute(
+                            "CREATE TABLE IF NOT EXISTS marker_values ("
+                            " patient_id TEXT NOT NULL,"
+                            " key TEXT NOT NULL,"
+                            " collected_on TEXT NOT NULL,"
+                            " report_hash TEXT NOT NULL,"
+                            " name TEXT NOT NULL,"
+                            " value REAL NOT NULL,"
+                            " unit TEXT,"
+                            " low REAL,"
+                            " high REAL,"
+                            " flag INTEGER NOT NULL,"
+                            " PRIMARY KEY (patient_id, key, collected_on, report_hash)) WITHOUT ROWID"
+                        )
+                        conn.execute(
+                            "CREATE INDEX IF NOT EXISTS idx_reports_date ON reports (patient_id, collected_on)"
+                        )
+                        self._ready = True
+                yield conn
+        finally:
+            conn.close()
+
+    def _rows(self, patient_id, report, collected_on):
+        collected_on = collected_on or report_date(report.text) or datetime.date.today().isoformat()
+        rows = [
+            (patient_id, record["key"], collected_on, report.content_hash, record["name"], record["value"],
+             record["unit"], record["low"], record["high"], record["flag"])
+            for record in report.markers.to_records() if record["value"] is not None
+        ]
+        return collected_on, rows
+
+    def record(self, patient_id, report, collected_on=None):
+        """Store a parsed report's markers for patient_id. Returns the number of markers stored.
+
+        collected_on defaults to the first date in the report text, then to today.
+        Storing the same report twice for a patient replaces the earlier rows.
+        """
+        if report.markers is None or not len(report.markers):
+            return 0
+        collected_on, rows = self._rows(patient_id, report, collected_on)
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "DELETE FROM marker_values WHERE patient_id = ? AND report_hash = ?",
+                (patient_id, report.content_hash),
+            )
+            conn.execute(
+                "INSERT OR REPLACE INTO reports (patient_id, report_hash, collected_on, stored_at) VALUES (?, ?, ?, ?)",
+                (patient_id, report.content_hash, collected_on, time.time()),
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO marker_values "
+                "(patient_id, key, collected_on, report_hash, name, value, unit, low, high, flag) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+        return len(rows)
+
+    def reports(self, patient_id):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT report_hash, collected_on, stored_at FROM reports WHERE patient_id = ? ORDER BY collected_on",
+                (patient_id,),
+            ).fetchall()
+        return [{"report_hash": row[0], "collected_on": row[1], "stored_at": row[2]} for row in rows]
+
+    def series(self, patient_id, key, since=None):
+        """Every value of one marker for a patient in date order, with the change from the previous value"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT collected_on, value, unit, low, high, flag, name FROM marker_values "
+                "WHERE patient_id = ? AND key = ? AND collected_on >= ? ORDER BY collected_on",
+                (patient_id, key, since or ""),
+            ).fetchall()
+        if not rows:
+            return []
+        import numpy as np
+        values = np.array([row[1] for row in rows], dtype=np.float64)
+        deltas = np.r_[np.nan, np.diff(values)]
+        return [
+            {
+                "collected_on": row[0], "name": row[6], "value": row[1], "unit": row[2], "low": row[3],
+                "high": row[4], "flag": row[5], "change": None if np.isnan(delta) else round(float(delta), 6),
+            }
+            for row, delta in zip(rows, deltas)
+        ]
+
+    def _trend_rows(self, patient_id, keys=None, since=None, exclude_report=None):
+        """(key, collected_on, value, name, unit, flag) rows sorted by key and date"""
+        query = (
+            "SELECT key, collected_on, value, name, unit, flag FROM marker_values "
+            "WHERE patient_id = ? AND collected_on >= ? AND report_hash != ?"
+        )
+        params = [patient_id, since or "", exclude_report or ""]
+        if keys:
+            query += f" AND key IN ({', '.join('?' for _ in keys)})"
+            params.extend(keys)
+        with self._connect() as conn:
+            return conn.execute(query + " ORDER BY key, collected_on", params).fetchall()
+
+    def trends(self, patient_id, keys=None, since=None):
+        """Trend statistics for each of a patient's markers (or just keys), keyed by marker"""
+        return self._trends(self._trend_rows(patient_id, keys, since))
+
+    @staticmethod
+    def _trends(rows):
+        if not rows:
+            return {}
+        trends = compute_trends([row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows])
+        # Name, unit and flag come from each marker's latest row
+        for row in rows:
+            trends[row[0]].update(name=row[3], unit=row[4], latest_flag=row[5])
+        return trends
+
+    def summary(self, patient_id, keys=None, report=None, collected_on=None):
+        """Short text of the markers with more than one result, for agent prompts. Empty without history.
+
+        With report, its markers are merged into the stored series in memory
+        as if stored, but nothing is written: record() is called once the
+        analysis has succeeded.
+        """
+        if report is not None and report.markers is not None and len(report.markers):
+            # A stored copy of the same report is replaced by its new rows, as record() would do
+            rows = self._trend_rows(patient_id, keys, exclude_report=report.content_hash)
+            _, new_rows = self._rows(patient_id, report, collected_on)
+            rows += [
+                (row[1], row[2], row[5], row[4], row[6], row[9])
+                for row in new_rows if not keys or row[1] in keys
+            ]
+            rows.sort(key=lambda row: (row[0], row[1]))
+        else:
+            rows = self._trend_rows(patient_id, keys)
+        lines = []
+        for trend in self._trends(rows).values():
+            if trend["points"] < 2:
+                continue
+            slope = trend["slope_per_year"]
+            rate = f", {slope:+g} {trend['unit']}/year" if slope is not None else ""
+            lines.append(
+                f"{trend['name']}: {trend['first']:g} -> {trend['last']:g} {trend['unit']} over "
+                f"{trend['points']} reports from {trend['first_date']} to {trend['last_date']} "
+                f"({trend['direction']}{rate}; latest {_FLAG_LABELS.get(trend['latest_flag'], 'normal')})"
+            )
+        return "\n".join(lines)
+
+    def delete(self, patient_id):
+        """Forget a patient. Returns the number of marker rows removed."""
+        with self._connect() as conn:
+            conn.execute("DELETE FROM reports WHERE patient_id = ?", (patient_id,))
+            return conn.execute("DELETE FROM marker_values WHERE patient_id = ?", (patient_id,)).rowcount
+
+    def stats(self):
+        with self._connect() as conn:
+            patients, reports = conn.execute("SELECT COUNT(DISTINCT patient_id), COUNT(*) FROM reports").fetchone()
+            values = conn.execute("SELECT COUNT(*) FROM marker_values").fetchone()[0]
+        return {"enabled": HISTORY_ENABLED, "patients": patients, "reports": reports, "marker_values": values}
+
+
+history_store = HistoryStore()
+
+
+## Per-request trend summary
+_current_history = contextvars.ContextVar("patient_history", default=None)
+
+
+@contextmanager
+def use_history(summary):
+    """Make summary the patient trend text the report tools add for this context"""
+    token = _current_history.set(summary or None)
+    try:
+        yield summary
+    finally:
+        _current_history.reset(token)
+
+
+def current_history():
+    return _current_history.get()
+
+
+def history_digest():
+    """Short hash of the active trend summary, so cached answers differ per history"""
+    summary = _current_history.get()
+    return hashlib.sha256(summary.encode("utf-8")).hexdigest()[:16] if summary else ""
@@ -0,0 +1,390 @@
+## Shared keep-alive HTTP connection pools for the LLM and search clients
+import os
+import time
+import asyncio
+import threading
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+
+from agents import LLM_PROVIDER, llm_provider, grpc_channel
+from metrics import record_http_request
+
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "100"))
+# Idle connections kept open per service, and for how long
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP2_ENABLED = os.getenv("HTTP2", "1") != "0"
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+# Connections opened to each service by the warm-up, before traffic arrives
+HTTP_WARMUP_CONNECTIONS = int(os.getenv("HTTP_WARMUP_CONNECTIONS", "2"))
+
+# Services whose client library is built on requests rather than httpx
+REQUESTS_SERVICES = ("search",)
+
+
+@lru_cache(maxsize=None)
+def _httpx():
+    # Loaded with the first pool so importing the app stays fast
+    try:
+        import httpx  # type: ignore
+    except ImportError:
+        # Installed with the OpenAI client; without it the providers' own defaults are used
+        return None
+    return httpx
+
+
+@lru_cache(maxsize=None)
+def http2_available():
+    if not HTTP2_ENABLED or _httpx() is None:
+        return False
+    try:
+        import h2  # type: ignore  # noqa: F401
+    except ImportError:
+        print("Warning: h2 package not available, using HTTP/1.1 connection pools. "
+              "Please install it with: pip install httpx[http2]")
+        return False
+    return True
+
+
+def service_urls():
+    """Base URL of each upstream HTTP service this process will call, keyed by pool name"""
+    urls = {}
+    # Only the provider the LLM was built for: OpenAI may have fallen back to Gemini or the mock
+    if LLM_PROVIDER != "mock" and llm_provider() == "openai":
+        urls["llm"] = (os.getenv("OPENAI_API_BASE") or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1")
+    if os.getenv("SERPER_API_KEY"):
+        urls["search"] = os.getenv("SERPER_API_BASE", "https://google.serper.dev")
+    return urls
+
+
+## Connection reuse counters
+class ConnectionStats:
+    """Requests per pool and how many of them had to open a new connection"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}
+        self.new_connections = {}
+
+    def record(self, name, opened):
+        with self._lock:
+            self.requests[name] = self.requests.get(name, 0) + 1
+            if opened:
+                self.new_connections[name] = self.new_connections.get(name, 0) + 1
+        record_http_request(name, opened)
+
+    def to_dict(self):
+        with self._lock:
+            stats = {}
+            for name, requests in sorted(self.requests.items()):
+                opened = self.new_connections.get(name, 0)
+                stats[name] = {
+                    "requests": requests,
+                    "new_connections": opened,
+                    "reused": requests - opened,
+                    "reuse_rate": round((requests - opened) / requests, 4),
+                }
+            return stats
+
+
+# httpcore reports this trace event whenever a request has to open a connection
+_CONNECT_EVENT = "connection.connect_tcp.started"
+
+@lru_cache(maxsize=None)
+def transport_classes():
+    """(CountingTransport, AsyncCountingTransport), built on first use"""
+    httpx = _httpx()
+
+    class CountingTransport(httpx.BaseTransport):
+        """Wraps a pooled transport and records whether each request reused a connection"""
+
+        def __init__(self, name, transport, stats):
+            self.name = name
+            self.transport = transport
+            self.stats = stats
+
+        def handle_request(self, request):
+            opened = []
+            outer = request.extensions.get("trace")
+
+            def trace(event, info):
+                if event == _CONNECT_EVENT:
+                    opened.append(True)
+                if outer is not None:
+                    outer(event, info)
+
+            request.extensions = {**request.extensions, "trace": trace}
+            try:
+                return self.transport.handle_request(request)
+            finally:
+                self.stats.record(self.name, bool(opened))
+
+        def close(self):
+            self.transport.close()
+
+    class AsyncCountingTransport(httpx.AsyncBaseTransport):
+        """Async counterpart of CountingTransport"""
+
+        def __init__(self, name, transport, stats):
+            self.name = name
+            self.transport = transport
+            self.stats = stats
+
+        async def handle_async_request(self, request):
+            opened = []
+            outer = request.extensions.get("trace")
+
+            async def trace(event, info):
+                if event == _CONNECT_EVENT:
+                    opened.append(True)
+                if outer is not None:
+                    await outer(event, info)
+
+            request.extensions = {**request.extensions, "trace": trace}
+            try:
+                return await self.transport.handle_async_request(request)
+            finally:
+                self.stats.record(self.name, bool(opened))
+
+        async def aclose(self):
+            await self.transport.aclose()
+
+    return CountingTransport, AsyncCountingTransport
+
+
+class PooledRequests:
+    """Stands in for the requests module in a library that calls requests.post() directly.
+
+    Those calls go through a keep-alive session instead of opening a new
+    connection each time; everything else is the requests module itself.
+    """
+
+    def __init__(self, session):
+        self._session = session
+
+    def request(self, method, url, **kwargs):
+        return self._session.request(method, url, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self._session.get(url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self._session.post(url, **kwargs)
+
+    def __getattr__(self, name):
+        import requests  # type: ignore
+        return getattr(requests, name)
+
+
+## Creating the client factory
+class HTTPClients:
+    """One keep-alive connection pool per upstream service, shared by every client in this process.
+
+    Pools are created on first use. Clients built here share their pool's
+    transport, so they must not be closed individually; close() shuts the
+    pools down with the app.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._transports = {}
+        self._async_transports = {}
+        self._sessions = {}
+        self.stats = ConnectionStats()
+        self.warmed = {}
+
+    def limits(self):
+        httpx = _httpx()
+        return httpx.Limits(
+            max_connections=HTTP_MAX_CONNECTIONS,
+            max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+            keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        )
+
+    def timeout(self, seconds=120.0):
+        return _httpx().Timeout(seconds, connect=HTTP_CONNECT_TIMEOUT)
+
+    def transport(self, name):
+        """The pooled transport for service name, or None without httpx"""
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        with self._lock:
+            if name not in self._transports:
+                pool = httpx.HTTPTransport(limits=self.limits(), http2=http2_available())
+                self._transports[name] = transport_classes()[0](name, pool, self.stats)
+            return self._transports[name]
+
+    def async_transport(self, name):
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        with self._lock:
+            if name not in self._async_transports:
+                pool = httpx.AsyncHTTPTransport(limits=self.limits(), http2=http2_available())
+                self._async_transports[name] = transport_classes()[1](name, pool, self.stats)
+            return self._async_transports[name]
+
+    def client(self, name, timeout=120.0, **kwargs):
+        """httpx client on service name's pool, or None without httpx"""
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        return httpx.Client(transport=self.transport(name), timeout=self.timeout(timeout), **kwargs)
+
+    def async_client(self, name, timeout=120.0, **kwargs):
+        httpx = _httpx()
+        if httpx is None:
+            return None
+        return httpx.AsyncClient(transport=self.async_transport(name), timeout=self.timeout(timeout), **kwargs)
+
+    def requests_session(self, name):
+        """Keep-alive requests session for service name, for libraries built on requests"""
+        import requests  # type: ignore
+        from requests.adapters import HTTPAdapter  # type: ignore
+
+        with self._lock:
+            if name not in self._sessions:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=HTTP_MAX_KEEPALIVE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                self._sessions[name] = session
+            return self._sessions[name]
+
+    def share_requests_session(self, module, name):
+        """Send a module's requests.get/post calls through service name's session"""
+        if getattr(module, "requests", None) is None or isinstance(module.requests, PooledRequests):
+            return
+        try:
+            module.requests = PooledRequests(self.requests_session(name))
+        except ImportError:
+            pass
+
+    ## Warm-up
+    def _open(self, name, url):
+        if name in REQUESTS_SERVICES:
+            self.requests_session(name).get(url, timeout=HTTP_CONNECT_TIMEOUT).close()
+            return
+        transport = self.transport(name)
+        request = _httpx().Request("GET", url, extensions={"timeout": self.timeout(HTTP_CONNECT_TIMEOUT).as_dict()})
+        response = transport.handle_request(request)
+        try:
+            response.read()
+        finally:
+            response.close()
+
+    def warm(self, urls=None, connections=None):
+        """Open connections to each service before traffic arrives; failures are reported, not raised"""
+        if urls is None:
+            urls = service_urls()
+            if LLM_PROVIDER != "mock" and llm_provider() == "gemini":
+                self.warm_channel("gemini", grpc_channel())
+        connections = HTTP_WARMUP_CONNECTIONS if connections is None else connections
+        if _httpx() is None or not urls or connections <= 0:
+            return self.warmed
+        for name, url in urls.items():
+            started = time.perf_counter()
+            # Concurrent requests so the pool keeps several connections, not one reused serially
+            with ThreadPoolExecutor(max_workers=connections, thread_name_prefix=f"warm-{name}") as executor:
+                results = list(executor.map(lambda _: self._try_open(name, url), range(connections)))
+            errors = [error for error in results if error]
+            self.warmed[name] = {
+                "url": url,
+                "connections": connections - len(errors),
+                "seconds": round(time.perf_counter() - started, 4),
+                "error": errors[0] if errors else None,
+            }
+            if errors:
+                print(f"Warning: could not warm up connections to {url}: {errors[0]}")
+        return self.warmed
+
+    def _try_open(self, name, url):
+        try:
+            self._open(name, url)
+        except Exception as e:
+            return str(e) or type(e).__name__
+        return None
+
+    async def _aopen(self, name, url):
+        request = _httpx().Request("GET", url, extensions={"timeout": self.timeout(HTTP_CONNECT_TIMEOUT).as_dict()})
+        try:
+            response = await self.async_transport(name).handle_async_request(request)
+            try:
+                await response.aread()
+            finally:
+                await response.aclose()
+        except Exception as e:
+            return str(e) or type(e).__name__
+        return None
+
+    async def awarm(self, urls=None, connections=None):
+        """warm() for the async pools, which must be warmed on the event loop that will use them"""
+        urls = service_urls() if urls is None else urls
+        connections = HTTP_WARMUP_CONNECTIONS if connections is None else connections
+        if _httpx() is None or connections <= 0:
+            return self.warmed
+        for name, url in urls.items():
+            if name in REQUESTS_SERVICES:
+                continue
+            started = time.perf_counter()
+            results = await asyncio.gather(*(self._aopen(name, url) for _ in range(connections)))
+            errors = [error for error in results if error]
+            self.warmed[f"{name}:async"] = {
+                "url": url,
+                "connections": connections - len(errors),
+                "seconds": round(time.perf_counter() - started, 4),
+                "error": errors[0] if errors else None,
+            }
+            if errors:
+                print(f"Warning: could not warm up async connections to {url}: {errors[0]}")
+        return self.warmed
+
+    def warm_channel(self, name, channel):
+        """Connect a gRPC channel (Gemini's pool) before traffic arrives"""
+        if channel is None:
+            return
+        started = time.perf_counter()
+        error = None
+        try:
+            import grpc  # type: ignore
+            grpc.channel_ready_future(channel).result(timeout=HTTP_CONNECT_TIMEOUT)
+        except Exception as e:
+            error = str(e) or type(e).__name__
+            print(f"Warning: could not warm up the {name} channel: {error}")
+        self.warmed[name] = {
+            "url": getattr(channel, "_target", None),
+            "connections": 0 if error else 1,
+            "seconds": round(time.perf_counter() - started, 4),
+            "error": error,
+        }
+
+    def to_dict(self):
+        return {
+            "http2": http2_available(),
+            "max_connections": HTTP_MAX_CONNECTIONS,
+            "max_keepalive": HTTP_MAX_KEEPALIVE,
+            "pools": self.stats.to_dict(),
+            "warmed": dict(self.warmed),
+        }
+
+    def close(self):
+        """Close the sync pools; the async ones need aclose()"""
+        with self._lock:
+            transports, self._transports = self._transports, {}
+            sessions, self._sessions = self._sessions, {}
+        for transport in transports.values():
+            transport.close()
+        for session in sessions.values():
+            session.close()
+
+    async def aclose(self):
+        """Close every pool, sync and async"""
+        self.close()
+        with self._lock:
+            transports, self._async_transports = self._async_transports, {}
+        for transport in transports.values():
+            await transport.aclose()
+
+
+http_clients = HTTPClients()
@@ -0,0 +1,268 @@
+## Importing libraries and files
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+FINISHED_STATES = (SUCCEEDED, FAILED)
+
+
+def new_job(query, file_processed):
+    """Build a fresh job record"""
+    now = time.time()
+    return {
+        "id": str(uuid.uuid4()),
+        "status": QUEUED,
+        "query": query,
+        "file_processed": file_processed,
+        "created_at": now,
+        "updated_at": now,
+        "tasks": [],
+        "result": None,
+        "error": None,
+    }
+
+
+def task_output_to_dict(output):
+    """Convert a crewai TaskOutput (or a mock stand-in) into plain JSON data"""
+    text = getattr(output, "raw", None) or getattr(output, "raw_output", None) or str(output)
+    agent = getattr(output, "agent", None)
+    if agent is not None and not isinstance(agent, str):
+        agent = getattr(agent, "role", str(agent))
+    return {
+        "name": getattr(output, "name", None),
+        "description": getattr(output, "description", None),
+        "agent": agent,
+        "output": text,
+        "finished_at": time.time(),
+    }
+
+
+## Creating the job stores
+class JobStore(ABC):
+    """Interface for job persistence. Records are plain JSON-serialisable dicts."""
+
+    @abstractmethod
+    def create(self, job):
+        ...
+
+    @abstractmethod
+    def get(self, job_id):
+        ...
+
+    @abstractmethod
+    def update(self, job_id, **fields):
+        ...
+
+    @abstractmethod
+    def append_task(self, job_id, task_result):
+        ...
+
+    @abstractmethod
+    def delete_expired(self, ttl_seconds):
+        """Remove finished jobs older than ttl_seconds and return how many went"""
+
+
+class InMemoryJobStore(JobStore):
+    """Process-local job store. Fine for a single worker; use SQLite for several."""
+
+    def __init__(self):
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def create(self, job):
+        with self._lock:
+            self._jobs[job["id"]] = json.loads(json.dumps(job))
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job["updated_at"] = time.time()
+            return dict(job)
+
+    def append_task(self, job_id, task_result):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            job["tasks"].append(task_result)
+            job["updated_at"] = time.time()
+            return dict(job)
+
+    def delete_expired(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["status"] in FINISHED_STATES and job["updated_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+
+class SQLiteJobStore(JobStore):
+    """Job store backed by a SQLite file, shared by every worker on the host"""
+
+    def __init__(self, path="data/jobs.sqlite3"):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # Serialises read-modify-write cycles within this process
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " updated_at REAL NOT NULL,"
+                " data TEXT NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status_updated ON jobs (status, updated_at)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def create(self, job):
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, status, updated_at, data) VALUES (?, ?, ?, ?)",
+                (job["id"], job["status"], job["updated_at"], json.dumps(job)),
+            )
+        return job
+
+    def get(self, job_id):
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def _modify(self, job_id, change):
+        with self._lock, self._connect() as conn:
+            # BEGIN IMMEDIATE takes the write lock up front so other workers wait
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT data FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            job = json.loads(row[0])
+            change(job)
+            job["updated_at"] = time.time()
+            conn.execute(
+                "UPDATE jobs SET status = ?, updated_at = ?, data = ? WHERE id = ?",
+                (job["status"], job["updated_at"], json.dumps(job), job_id),
+            )
+            return job
+
+    def update(self, job_id, **fields):
+        return self._modify(job_id, lambda job: job.update(fields))
+
+    def append_task(self, job_id, task_result):
+        return self._modify(job_id, lambda job: job["tasks"].append(task_result))
+
+    def delete_expired(self, ttl_seconds):
+        cutoff = time.time() - ttl_seconds
+        placeholders = ", ".join("?" for _ in FINISHED_STATES)
+        with self._lock, self._connect() as conn:
+            cursor = conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({placeholders}) AND updated_at < ?",
+                (*FINISHED_STATES, cutoff),
+            )
+            return cursor.rowcount
+
+
+def make_job_store(kind=None, path=None):
+    """Build the job store selected by JOB_STORE (memory or sqlite)"""
+    kind = (kind or os.getenv("JOB_STORE", "memory")).lower()
+    if kind == "memory":
+        return InMemoryJobStore()
+    if kind == "sqlite":
+        return SQLiteJobStore(path or os.getenv("JOB_STORE_PATH", "data/jobs.sqlite3"))
+    raise ValueError(f"Unknown job store: {kind}")
+
+
+## Creating the TTL cleanup sweeper
+class JobSweeper:
+    """Background task that periodically drops finished jobs past their TTL"""
+
+    def __init__(self, store, ttl_seconds=None, interval_seconds=None):
+        self.store = store
+        self.ttl_seconds = float(ttl_seconds or os.getenv("JOB_TTL_SECONDS", "3600"))
+        self.interval_seconds = float(interval_seconds or os.getenv("JOB_SWEEP_INTERVAL", "60"))
+        self._task = None
+
+    async def _loop(self):
+        while True:
+            await asyncio.sleep(self.interval_seconds)
+            try:
+                await asyncio.to_thread(self.store.delete_expired, self.ttl_seconds)
+            except Exception as e:
+                print(f"Job sweep failed: {e}")
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.get_running_loop().create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+## Server-Sent Events stream of job progress
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def job_events(store, job_id, poll_interval=0.5, is_disconnected=None):
+    """Yield an SSE message per finished task, then a final status message.
+
+    Polls the store rather than subscribing in-process so the stream works
+    whichever worker is running the job.
+    """
+    sent = 0
+    while True:
+        job = await asyncio.to_thread(store.get, job_id)
+        if job is None:
+            yield _sse("error", {"detail": "Job not found"})
+            return
+
+        for task_result in job["tasks"][sent:]:
+            yield _sse("task", task_result)
+        sent = len(job["tasks"])
+
+        if job["status"] in FINISHED_STATES:
+            yield _sse(job["status"], {"id": job_id, "result": job["result"], "error": job["error"]})
+            return
+
+        if is_disconnected is not None and await is_disconnected():
+            return
+        await asyncio.sleep(poll_interval)
@@ -0,0 +1,181 @@
+## Two-tier cache of agent responses
+import os
+import re
+import json
+import time
+import hashlib
+import sqlite3
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+
+def normalise_query(query):
+    """Case, whitespace and trailing punctuation do not change the answer"""
+    query = re.sub(r"\s+", " ", (query or "").strip().lower())
+    return query.rstrip(" ?!.")
+
+
+def make_key(report_hash, query, agent_role, model, prompt_version):
+    parts = [report_hash, normalise_query(query), agent_role or "", model or "", prompt_version or ""]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def prompt_fingerprint(*objects):
+    """Hash of the prompt-bearing fields of agents and tasks.
+
+    Any edit to a role, goal, backstory, description or expected output
+    produces a new version, so stale responses are never served. Set
+    PROMPT_VERSION to force a new version without touching the prompts.
+    """
+    digest = hashlib.sha256(os.getenv("PROMPT_VERSION", "").encode("utf-8"))
+    for obj in objects:
+        for field in ("role", "goal", "backstory", "description", "expected_output"):
+            value = getattr(obj, field, None)
+            if value:
+                digest.update(f"{field}={value}\x1e".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or type(llm).__name__
+
+
+## Creating the response cache
+class ResponseCache:
+    """In-process LRU in front of an optional SQLite tier shared by all workers.
+
+    Disk rows past ttl_seconds are deleted every prune_every writes, so the
+    file does not keep model output about reports forever.
+    """
+
+    def __init__(self, max_entries=None, ttl_seconds=None, path=None, enabled=None, prune_every=None):
+        self.enabled = (enabled if enabled is not None else os.getenv("LLM_CACHE", "1") != "0")
+        self.max_entries = int(max_entries or os.getenv("LLM_CACHE_MAX_ENTRIES", "1024"))
+        self.ttl_seconds = float(ttl_seconds or os.getenv("LLM_CACHE_TTL", "86400"))
+        # An empty path disables the disk tier
+        self.path = path if path is not None else os.getenv("LLM_CACHE_PATH", "data/llm_cache.sqlite3")
+        self.prune_every = int(prune_every or os.getenv("LLM_CACHE_PRUNE_EVERY", "100"))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_ready = False
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.pruned = 0
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                if not self._disk_ready:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS responses ("
+                        " key TEXT PRIMARY KEY,"
+                        " prompt_version TEXT NOT NULL,"
+                        " created_at REAL NOT NULL,"
+                        " value TEXT NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_version ON responses (prompt_version)")
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_created ON responses (created_at)")
+                    self._disk_ready = True
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None and now - entry[0] <= self.ttl_seconds:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[2]
+
+        if self.path:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT created_at, prompt_version, value FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+            if row is not None and now - row[0] <= self.ttl_seconds:
+                value = json.loads(row[2])
+                self._remember(key, row[0], row[1], value)
+                with self._lock:
+                    self.disk_hits += 1
+                return value
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, value, prompt_version=""):
+        if not self.enabled:
+            return
+        now = time.time()
+        self._remember(key, now, prompt_version, value)
+        with self._lock:
+            self.stores += 1
+            # The first write and every prune_every-th after it also sweep expired rows
+            prune = self.stores % self.prune_every == 1 or self.prune_every == 1
+        if self.path:
+            with self._connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, prompt_version, created_at, value) VALUES (?, ?, ?, ?)",
+                    (key, prompt_version, now, json.dumps(value)),
+                )
+                if prune:
+                    removed = conn.execute(
+                        "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+                    ).rowcount
+                    with self._lock:
+                        self.pruned += removed
+
+    def _remember(self, key, created_at, prompt_version, value):
+        with self._lock:
+            self._memory[key] = (created_at, prompt_version, value)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+    def invalidate(self, keep_prompt_version=None):
+        """Drop every entry, or every entry not built with keep_prompt_version. Returns disk rows removed."""
+        with self._lock:
+            if keep_prompt_version is None:
+                self._memory.clear()
+            else:
+                for key in [k for k, v in self._memory.items() if v[1] != keep_prompt_version]:
+                    del self._memory[key]
+        if not self.path:
+            return 0
+        with self._connect() as conn:
+            if keep_prompt_version is None:
+                return conn.execute("DELETE FROM responses").rowcount
+            return conn.execute(
+                "DELETE FROM responses WHERE prompt_version != ?", (keep_prompt_version,)
+            ).rowcount
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "memory_entries": len(self._memory),
+                "memory_hits": self.memory_hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "stores": self.stores,
+                "pruned": self.pruned,
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+llm_cache = ResponseCache()
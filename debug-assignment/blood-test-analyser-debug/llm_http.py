@@ -0,0 +1,218 @@
+## HTTP transports (and callbacks, for SDKs without httpx) that route provider calls through the LLM scheduler
+import json
+import time
+import asyncio
+
+try:
+    import httpx  # type: ignore
+except ImportError:
+    # Installed with the OpenAI client; without it there are no HTTP calls to schedule
+    httpx = None
+
+from rate_limit import llm_scheduler, estimate_tokens
+from metrics import span, record_llm_call
+from http_clients import http_clients
+
+# Responses that mean the provider wants us to slow down
+RETRY_STATUSES = (429, 502, 503, 504)
+
+
+def _usage(content):
+    """The usage block of a chat completion response, or {}"""
+    try:
+        return json.loads(content).get("usage") or {}
+    except (ValueError, AttributeError):
+        return {}
+
+
+def _is_json(response):
+    # Streamed (text/event-stream) responses are left for the client to read
+    return "json" in response.headers.get("content-type", "")
+
+
+def _retry_after(response):
+    value = response.headers.get("retry-after")
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+if httpx is not None:
+    class ScheduledTransport(httpx.BaseTransport):
+        """Wraps an httpx transport so every request waits for budget and retries throttling with backoff"""
+
+        def __init__(self, scheduler, transport=None):
+            self.scheduler = scheduler
+            self.transport = transport or httpx.HTTPTransport()
+
+        def handle_request(self, request):
+            body = request.read()
+            estimated = estimate_tokens(body)
+            for attempt in range(self.scheduler.max_retries + 1):
+                with span("llm.wait"):
+                    self.scheduler.acquire(estimated)
+                with span("llm", attempt=attempt) as current:
+                    response = self.transport.handle_request(request)
+                    current.set(status_code=response.status_code)
+                    if _is_json(response):
+                        response.read()
+                if response.status_code not in RETRY_STATUSES or attempt == self.scheduler.max_retries:
+                    break
+                record_llm_call(response.status_code)
+                delay = self.scheduler.backoff(attempt, _retry_after(response))
+                response.close()
+                # Refund the tokens; the request itself still counted against the quota
+                self.scheduler.settle(estimated, 0)
+                self.scheduler.record_retry(response.status_code, delay)
+                time.sleep(delay)
+
+            usage = {}
+            if _is_json(response):
+                usage = _usage(response.content)
+                self.scheduler.settle(estimated, usage.get("total_tokens"))
+            record_llm_call(response.status_code, usage)
+            return response
+
+        def close(self):
+            self.transport.close()
+
+    class AsyncScheduledTransport(httpx.AsyncBaseTransport):
+        """Async counterpart of ScheduledTransport; waiting happens on a worker thread"""
+
+        def __init__(self, scheduler, transport=None):
+            self.scheduler = scheduler
+            self.transport = transport or httpx.AsyncHTTPTransport()
+
+        async def handle_async_request(self, request):
+            body = await request.aread()
+            estimated = estimate_tokens(body)
+            for attempt in range(self.scheduler.max_retries + 1):
+                with span("llm.wait"):
+                    # to_thread copies the context, so the caller's priority and flow go with it
+                    await asyncio.to_thread(self.scheduler.acquire, estimated)
+                with span("llm", attempt=attempt) as current:
+                    response = await self.transport.handle_async_request(request)
+                    current.set(status_code=response.status_code)
+                    if _is_json(response):
+                        await response.aread()
+                if response.status_code not in RETRY_STATUSES or attempt == self.scheduler.max_retries:
+                    break
+                record_llm_call(response.status_code)
+                delay = self.scheduler.backoff(attempt, _retry_after(response))
+                await response.aclose()
+                self.scheduler.settle(estimated, 0)
+                self.scheduler.record_retry(response.status_code, delay)
+                await asyncio.sleep(delay)
+
+            usage = {}
+            if _is_json(response):
+                usage = _usage(response.content)
+                self.scheduler.settle(estimated, usage.get("total_tokens"))
+            record_llm_call(response.status_code, usage)
+            return response
+
+        async def aclose(self):
+            await self.transport.aclose()
+
+
+def scheduled_http_client(scheduler=None, timeout=120.0):
+    """httpx client whose requests all go through the shared scheduler, or None without httpx"""
+    if httpx is None:
+        return None
+    # Provider calls share this process's keep-alive pool for the LLM service
+    transport = ScheduledTransport(scheduler or llm_scheduler, http_clients.transport("llm"))
+    return httpx.Client(transport=transport, timeout=http_clients.timeout(timeout))
+
+
+def scheduled_async_http_client(scheduler=None, timeout=120.0):
+    if httpx is None:
+        return None
+    transport = AsyncScheduledTransport(scheduler or llm_scheduler, http_clients.async_transport("llm"))
+    return httpx.AsyncClient(transport=transport, timeout=http_clients.timeout(timeout))
+
+
+## Providers that do not call over httpx
+def _prompt_bytes(prompts):
+    texts = []
+    for prompt in prompts:
+        if isinstance(prompt, (list, tuple)):
+            texts.extend(str(getattr(message, "content", message)) for message in prompt)
+        else:
+            texts.append(str(prompt))
+    return "\n".join(texts).encode("utf-8")
+
+
+def _callback_usage(response):
+    """prompt/completion/total token counts from a LangChain LLMResult, or {}"""
+    usage = dict((getattr(response, "llm_output", None) or {}).get("token_usage") or {})
+    if usage:
+        return usage
+    for generations in getattr(response, "generations", None) or []:
+        for generation in generations:
+            metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+            if metadata:
+                return {
+                    "prompt_tokens": metadata.get("input_tokens"),
+                    "completion_tokens": metadata.get("output_tokens"),
+                    "total_tokens": metadata.get("total_tokens"),
+                }
+    return {}
+
+
+def _is_throttled(error):
+    # Gemini raises google.api_core's ResourceExhausted for 429s
+    return 429 in (getattr(error, "status_code", None), getattr(error, "code", None)) or \
+        type(error).__name__ in ("ResourceExhausted", "TooManyRequests")
+
+
+def scheduler_callbacks(scheduler=None):
+    """LangChain callback handlers that admit each call through the scheduler, or [] without langchain_core.
+
+    For SDKs such as Gemini's that call their API over gRPC rather than
+    httpx: the call waits for budget when it starts, settles the tokens it
+    reports when it ends, and a throttling error pauses the shared budget.
+    Retries stay with the SDK.
+    """
+    try:
+        from langchain_core.callbacks import BaseCallbackHandler  # type: ignore
+    except ImportError:
+        return []
+
+    scheduler = scheduler or llm_scheduler
+
+    class SchedulerCallback(BaseCallbackHandler):
+        # Waiting for budget must hold up the call, so errors are not swallowed
+        raise_error = True
+
+        def __init__(self):
+            self._estimates = {}
+
+        def _start(self, prompts, run_id):
+            estimated = estimate_tokens(_prompt_bytes(prompts))
+            with span("llm.wait"):
+                scheduler.acquire(estimated)
+            self._estimates[run_id] = estimated
+
+        def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+            self._start(prompts, run_id)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+            self._start(messages, run_id)
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            estimated = self._estimates.pop(run_id, 0)
+            usage = _callback_usage(response)
+            scheduler.settle(estimated, usage.get("total_tokens"))
+            record_llm_call(200, usage)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            estimated = self._estimates.pop(run_id, 0)
+            if _is_throttled(error):
+                record_llm_call(429)
+                scheduler.settle(estimated, 0)
+                scheduler.record_retry(429, scheduler.backoff(0))
+            else:
+                record_llm_call("error")
+
+    return [SchedulerCallback()]
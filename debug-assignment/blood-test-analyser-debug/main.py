@@ -1,115 +1,560 @@
-from fastapi import FastAPI, File, UploadFile, Form, HTTPException
+from fastapi import FastAPI, File, UploadFile, Form, HTTPException, Request
+from fastapi.responses import StreamingResponse, JSONResponse, PlainTextResponse
+from typing import List
+from contextlib import asynccontextmanager, aclosing
 import os
-import uuid
+import json
 import asyncio
+import datetime
 
-try:
-    from crewai import Crew, Process  # type: ignore
-except ImportError:
-    print("Warning: crewai package not available. Please install it with: pip install crewai")
-    # Create mock classes
-    class Crew:
-        def __init__(self, **kwargs):
-            self.agents = kwargs.get('agents', [])
-            self.tasks = kwargs.get('tasks', [])
-            self.process = kwargs.get('process', 'sequential')
-        def kickoff(self, inputs):
-            return f"Mock crew analysis for: {inputs}"
-    
-    class Process:
-        sequential = "sequential"
-
-try:
-    from agents import doctor, verifier, nutritionist, exercise_specialist
-except ImportError:
-    print("Warning: agents module not available. Creating mock agents.")
-    class MockAgent:
-        def __init__(self, name):
-            self.name = name
-    doctor = MockAgent("doctor")
-    verifier = MockAgent("verifier")
-    nutritionist = MockAgent("nutritionist")
-    exercise_specialist = MockAgent("exercise_specialist")
-
-try:
-    from task import help_patients, nutrition_analysis, exercise_planning, verification
-except ImportError:
-    print("Warning: task module not available. Creating mock tasks.")
-    class MockTask:
-        def __init__(self, name):
-            self.name = name
-    help_patients = MockTask("help_patients")
-    nutrition_analysis = MockTask("nutrition_analysis")
-    exercise_planning = MockTask("exercise_planning")
-    verification = MockTask("verification")
-
-app = FastAPI(title="Blood Test Report Analyser")
-
-def run_crew(query: str, file_path: str="data/sample.pdf"):
-    """To run the whole crew with all specialists"""
-    medical_crew = Crew(
-        agents=[verifier, doctor, nutritionist, exercise_specialist],
-        tasks=[verification, help_patients, nutrition_analysis, exercise_planning],
-        process=Process.sequential,
-        verbose=True
-    )
-    
-    result = medical_crew.kickoff({'query': query, 'file_path': file_path})
-    return result
+from worker_pool import CrewExecutor, PoolSaturated
+from document import load_uploaded_report, document_cache
+from screening import ReportRejected
+from ocr import ocr_pool
+from fast_path import route, answer, ROUTING_MODES, DEFAULT_ANALYZE_MODE
+from singleflight import make_single_flight, flight_key, COALESCED, REMOTE
+from streaming import AnalysisStream, use_stream, stream_events, STREAM_MEDIA_TYPES
+from crew import run_crew, crew_pool, crew_parts, prompt_version, PIPELINES, DEFAULT_MODE, VerificationFailed
+from llm_cache import llm_cache
+from history import history_store, HISTORY_ENABLED, AmbiguousDate, report_date
+from rate_limit import llm_scheduler
+from http_clients import http_clients
+from metrics import registry, span, record_bytes
+from batch import BatchRunner, BatchStats, iter_zip_reports
+from uploads import spool_upload, UploadRejected, MAX_UPLOAD_BYTES, CHUNK_SIZE
+from jobs import (
+    new_job, make_job_store, task_output_to_dict, job_events, JobSweeper,
+    RUNNING, SUCCEEDED, FAILED,
+)
+
+# Crew runs are blocking, so they go to a bounded pool instead of the event loop
+crew_executor = CrewExecutor()
+
+# Concurrent duplicate analyses (retries, resubmitted files) share one crew run
+single_flight = make_single_flight()
+
+# Bulk uploads fan out over their own process pool, started on first use
+batch_runner = BatchRunner()
+BATCH_MAX_UPLOAD_BYTES = int(os.getenv("BATCH_MAX_UPLOAD_BYTES", str(200 * 1024 * 1024)))
+
+# Submitted jobs and the sweeper that expires finished ones
+job_store = make_job_store()
+job_sweeper = JobSweeper(job_store)
+_background_jobs = set()
+
+# eager: load crewai, the LLM and the crews before serving; background: serve
+# straight away and load them alongside; off: load on the first request
+WARMUP = os.getenv("WARMUP", "background").lower()
+
+def warm_up():
+    """Load the agents, tasks and LLM client, build the pooled crews and open provider connections"""
+    crew_parts()
+    # TLS handshakes to the providers happen now rather than on the first requests
+    http_clients.warm()
+    # Responses cached under an older prompt version can never be hit again
+    if llm_cache.enabled:
+        llm_cache.invalidate(prompt_version())
+    # Thread workers share this process's crews, so build them before traffic arrives
+    if crew_executor.kind == "thread":
+        crew_pool.warm()
+
+async def warm_up_async():
+    await asyncio.to_thread(warm_up)
+    # The async pools belong to this event loop, so they are warmed here rather than in the thread
+    await http_clients.awarm()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    job_sweeper.start()
+    warming = None
+    if WARMUP == "eager":
+        await warm_up_async()
+    elif WARMUP == "background":
+        warming = asyncio.create_task(warm_up_async())
+    try:
+        yield
+    finally:
+        if warming is not None:
+            await asyncio.gather(warming, return_exceptions=True)
+        await job_sweeper.stop()
+        crew_executor.shutdown(wait=False)
+        batch_runner.shutdown(wait=False)
+        ocr_pool.shutdown(wait=False)
+        await http_clients.aclose()
+
+app = FastAPI(title="Blood Test Report Analyser", lifespan=lifespan)
 
 @app.get("/")
 async def root():
     """Health check endpoint"""
     return {"message": "Blood Test Report Analyser API is running"}
 
+@app.get("/pool/stats")
+async def pool_stats():
+    """Queue depth, wait time and run time of the crew worker pool, plus LLM rate limiting and connection reuse"""
+    return {
+        **crew_executor.stats(),
+        "crew_pool": crew_pool.stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "single_flight": single_flight.stats(),
+        "http": http_clients.to_dict(),
+    }
+
+@app.get("/metrics")
+async def metrics():
+    """Per-stage latency histograms, error, byte and token counters in Prometheus format"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats")
+async def cache_stats():
+    """Hit/miss counters of the parsed document, OCR and LLM response caches"""
+    return {
+        "documents": document_cache.stats(),
+        "ocr": ocr_pool.stats(),
+        "llm": {**llm_cache.stats(), "prompt_version": await asyncio.to_thread(prompt_version)},
+    }
+
+@app.delete("/cache/llm")
+async def clear_llm_cache(stale_only: bool = False):
+    """Drop cached agent responses; with stale_only, only those from older prompt versions"""
+    keep = await asyncio.to_thread(prompt_version) if stale_only else None
+    removed = await asyncio.to_thread(llm_cache.invalidate, keep)
+    return {"status": "success", "removed": removed}
+
+def validate_date(value):
+    try:
+        return datetime.date.fromisoformat(value).isoformat()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid date '{value}', expected YYYY-MM-DD")
+
+def require_history():
+    if not HISTORY_ENABLED:
+        raise HTTPException(status_code=404, detail="Patient history is disabled; set HISTORY=1 to enable it")
+
+@app.get("/patients/{patient_id}/trends")
+async def patient_trends(patient_id: str, markers: str = None, since: str = None):
+    """Trend of each marker (or a comma-separated list of markers) across a patient's reports"""
+    require_history()
+    if since is not None:
+        since = validate_date(since)
+    keys = [key.strip() for key in markers.split(",") if key.strip()] if markers else None
+    trends = await asyncio.to_thread(history_store.trends, patient_id, keys, since)
+    if not trends:
+        raise HTTPException(status_code=404, detail="No history for this patient")
+    reports = await asyncio.to_thread(history_store.reports, patient_id)
+    return {"patient_id": patient_id, "reports": reports, "trends": trends}
+
+@app.get("/patients/{patient_id}/markers/{key}")
+async def patient_marker_series(patient_id: str, key: str, since: str = None):
+    """Every stored value of one marker for a patient, with the change between reports"""
+    require_history()
+    if since is not None:
+        since = validate_date(since)
+    series = await asyncio.to_thread(history_store.series, patient_id, key, since)
+    if not series:
+        raise HTTPException(status_code=404, detail="No history for this patient and marker")
+    return {"patient_id": patient_id, "key": key, "series": series}
+
+@app.delete("/patients/{patient_id}")
+async def delete_patient(patient_id: str):
+    """Forget everything stored about a patient"""
+    require_history()
+    removed = await asyncio.to_thread(history_store.delete, patient_id)
+    return {"status": "success", "removed": removed}
+
+def body_limit(path):
+    # One chunk of slack for the multipart boundaries and form fields
+    return (BATCH_MAX_UPLOAD_BYTES if path == "/analyze/batch" else MAX_UPLOAD_BYTES) + CHUNK_SIZE
+
+class LimitReceivedBody:
+    """Enforce the upload limit on the bytes actually received.
+
+    Chunked requests carry no Content-Length, and Starlette spools the whole
+    multipart body before the endpoint's per-chunk check runs, so the count
+    is kept here, in the ASGI receive path, and the request fails with 413
+    as soon as it goes over.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "POST":
+            return await self.app(scope, receive, send)
+        limit = body_limit(scope["path"])
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > limit:
+                    # An HTTPException passes through FastAPI's form parsing unchanged
+                    raise HTTPException(status_code=413, detail=f"Upload exceeds the {limit - CHUNK_SIZE} byte limit")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+# Added before the middlewares below so it is the innermost one: they would wrap its
+# 413 in an exception group on the way out
+app.add_middleware(LimitReceivedBody)
+
+# Requests whose upload, parse and crew spans are grouped under one trace
+TRACED_PATHS = ("/analyze", "/analyze/batch", "/jobs")
+
+@app.middleware("http")
+async def trace_analysis_requests(request: Request, call_next):
+    if request.method != "POST" or request.url.path not in TRACED_PATHS:
+        return await call_next(request)
+    with span(f"request {request.url.path}") as current:
+        response = await call_next(request)
+        current.set(status_code=response.status_code)
+        return response
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Refuse bodies whose declared size is over the limit before they are read"""
+    length = request.headers.get("content-length")
+    limit = body_limit(request.url.path)
+    if length and length.isdigit() and int(length) > limit:
+        return JSONResponse(
+            status_code=413,
+            content={"detail": f"Upload exceeds the {limit - CHUNK_SIZE} byte limit"}
+        )
+    return await call_next(request)
+
+def validate_mode(mode, extra=()):
+    if mode not in PIPELINES and mode not in extra:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown mode '{mode}'. Choose one of: {', '.join((*extra, *PIPELINES))}"
+        )
+    return mode
+
+async def receive_upload(file: UploadFile):
+    """Stream an uploaded PDF into a spooled buffer, rejecting bad files early"""
+    try:
+        with span("upload") as current:
+            upload = await spool_upload(file)
+            current.set(bytes=upload.size)
+        record_bytes("upload", upload.size)
+        return upload
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=e.detail)
+
+def validate_stream(stream):
+    if stream is not None and stream not in STREAM_MEDIA_TYPES:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown stream format '{stream}'. Choose one of: {', '.join(STREAM_MEDIA_TYPES)}"
+        )
+    return stream
+
+def analysis_error(e):
+    """The HTTPException an /analyze failure is reported as"""
+    if isinstance(e, HTTPException):
+        return e
+    if isinstance(e, UploadRejected):
+        return HTTPException(status_code=e.status_code, detail=e.detail)
+    if isinstance(e, VerificationFailed):
+        return HTTPException(
+            status_code=422,
+            detail={"message": str(e), "verification": e.output}
+        )
+    if isinstance(e, ReportRejected):
+        return HTTPException(
+            status_code=422,
+            detail={"message": str(e), "verification": e.output, "screen": e.screen.to_dict()}
+        )
+    if isinstance(e, AmbiguousDate):
+        return HTTPException(status_code=422, detail=str(e))
+    if isinstance(e, PoolSaturated):
+        return HTTPException(
+            status_code=503,
+            detail="Analysis capacity exhausted, please retry later",
+            headers={"Retry-After": str(e.retry_after)}
+        )
+    return HTTPException(status_code=500, detail=f"Error processing blood report: {str(e)}")
+
 @app.post("/analyze")
 async def analyze_blood_report(
+    request: Request,
     file: UploadFile = File(...),
-    query: str = Form(default="Summarise my Blood Test Report")
+    query: str = Form(default="Summarise my Blood Test Report"),
+    mode: str = Form(default=DEFAULT_ANALYZE_MODE),
+    patient_id: str = Form(default=None),
+    collected_on: str = Form(default=None),
+    stream: str = Form(default=None)
 ):
-    """Analyze blood test report and provide comprehensive health recommendations"""
+    """Analyze blood test report and provide comprehensive health recommendations
+
+    mode "auto" answers summaries and "is my X normal?" questions from the
+    extracted markers in milliseconds and sends anything else to the crew;
+    "rules" always uses the rules and a pipeline mode always uses the crew.
+    With HISTORY=1, pass patient_id to keep the report's marker values and
+    give the agents the patient's trends across earlier reports.
+    With stream=ndjson or stream=sse, agent tokens and finished tasks are
+    sent as they happen, and disconnecting cancels the rest of the run.
+    """
     
-    # Generate unique filename to avoid conflicts
-    file_id = str(uuid.uuid4())
-    file_path = f"data/blood_test_report_{file_id}.pdf"
+    upload = None
     
     try:
-        # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
-        
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are supported")
+        validate_mode(mode, ROUTING_MODES)
+        validate_stream(stream)
+        if collected_on is not None:
+            validate_date(collected_on)
         
-        # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Validate and stream the uploaded file into memory/temp storage
+        upload = await receive_upload(file)
         
         # Validate query
         if query == "" or query is None:
             query = "Summarise my Blood Test Report"
             
-        # Process the blood report with all specialists
-        response = run_crew(query=query.strip(), file_path=file_path)
+        # Parse straight from the upload buffer, then run all specialists on the worker pool
+        report = await asyncio.to_thread(load_uploaded_report, upload)
         
-        return {
+        # Summarise the patient's trends including this report; its markers are stored once the analysis succeeds
+        history = None
+        keep_history = bool(patient_id and HISTORY_ENABLED)
+        if keep_history:
+            # Resolved once so the summary and the stored rows agree; an ambiguous date is rejected up front
+            collected_on = collected_on or report_date(report.text) or datetime.date.today().isoformat()
+            history = await asyncio.to_thread(
+                history_store.summary, patient_id, report=report, collected_on=collected_on
+            )
+        
+        routed = await asyncio.to_thread(route, mode, query, report)
+        summary = {
             "status": "success",
             "query": query,
-            "analysis": str(response),
+            "mode": mode,
+            "route": "rules" if routed == "rules" else "crew",
             "file_processed": file.filename
         }
         
+        async def store_history():
+            if keep_history:
+                stored = await asyncio.to_thread(history_store.record, patient_id, report, collected_on)
+                summary["history"] = {"patient_id": patient_id, "markers_stored": stored}
+        
+        if stream is not None:
+            events = AnalysisStream()
+            
+            async def run_streamed():
+                if routed == "rules":
+                    response = await asyncio.to_thread(answer, query, report, history)
+                    await store_history()
+                    return {"event": "result", **summary, "intent": response.intent, "analysis": str(response)}
+                # Process workers cannot reach this stream, so their tasks are sent at the end instead
+                task_callback = events.task_callback if crew_executor.kind == "thread" else None
+                with use_stream(events):
+                    response = await crew_executor.run(
+                        run_crew, query=query.strip(), file_path=None, task_callback=task_callback, report=report,
+                        mode=routed or DEFAULT_MODE, history=history
+                    )
+                if task_callback is None:
+                    for output in getattr(response, "tasks_output", None) or []:
+                        events.put("task", **task_output_to_dict(output))
+                await store_history()
+                return {
+                    "event": "result", **summary, "intent": None, "analysis": str(response),
+                    "report_tokens": getattr(response, "compaction", None)
+                }
+            
+            # Streams are not coalesced: every client gets its own run's tokens
+            return StreamingResponse(
+                stream_events(stream, events, run_streamed(), analysis_error, request.is_disconnected),
+                media_type=STREAM_MEDIA_TYPES[stream],
+                headers={"Cache-Control": "no-cache"}
+            )
+        
+        shared = False
+        if routed == "rules":
+            response = await asyncio.to_thread(answer, query, report, history)
+            analysis = {"analysis": str(response), "intent": response.intent, "report_tokens": None}
+        else:
+            crew_mode = routed or DEFAULT_MODE
+            
+            async def run_analysis():
+                response = await crew_executor.run(
+                    run_crew, query=query.strip(), file_path=None, report=report, mode=crew_mode, history=history
+                )
+                return {"analysis": str(response), "intent": None, "report_tokens": getattr(response, "compaction", None)}
+            
+            # An identical analysis already running here (or in another worker) is awaited, not repeated
+            key = flight_key(report.content_hash, query, crew_mode, history)
+            analysis, outcome = await single_flight.run(key, run_analysis)
+            shared = outcome in (COALESCED, REMOTE)
+        
+        await store_history()
+        return {
+            **summary,
+            "intent": analysis["intent"],
+            "analysis": analysis["analysis"],
+            "report_tokens": analysis["report_tokens"],
+            "coalesced": shared
+        }
+        
     except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error processing blood report: {str(e)}")
+        raise analysis_error(e)
     
     finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
+        # Release the upload buffer
+        if upload is not None:
+            upload.close()
+
+@app.post("/analyze/batch")
+async def analyze_batch(
+    files: List[UploadFile] = File(...),
+    query: str = Form(default="Summarise my Blood Test Report"),
+    agents: bool = Form(default=False)
+):
+    """Analyze many reports (PDFs and/or ZIP archives of PDFs) across all cores.
+
+    Streams one JSON line per report as it completes, then a summary line
+    with throughput and per-stage timings.
+    """
+    if query == "" or query is None:
+        query = "Summarise my Blood Test Report"
+
+    spooled = []
+
+    async def batch_items():
+        # Uploads are spooled to disk one at a time as the batch window asks for more,
+        # and workers are given the file path rather than the bytes
+        for file in files:
+            archive = (file.filename or "").lower().endswith(".zip")
             try:
-                os.remove(file_path)
-            except:
-                pass  # Ignore cleanup errors
+                upload = await spool_upload(
+                    file, max_bytes=BATCH_MAX_UPLOAD_BYTES if archive else None, archive=archive, on_disk=True
+                )
+            except UploadRejected as e:
+                yield file.filename, e
+                continue
+            spooled.append(upload)
+            if not archive:
+                yield file.filename, upload.path
+                continue
+            # ZIP members are read one at a time off the event loop
+            members = iter_zip_reports(upload.path)
+            while True:
+                try:
+                    member = await asyncio.to_thread(next, members, None)
+                except Exception as e:
+                    yield file.filename, e
+                    break
+                if member is None:
+                    break
+                name, data = member
+                yield f"{file.filename}:{name}", data
+
+    async def stream_results():
+        stats = BatchStats()
+        try:
+            # aclosing cancels the queued reports as soon as the response is closed
+            async with aclosing(batch_runner.aiter_results(batch_items(), query.strip(), agents)) as records:
+                async for record in records:
+                    stats.add(record)
+                    yield json.dumps(record) + "\n"
+            yield json.dumps({"summary": stats.summary()}) + "\n"
+        finally:
+            for upload in spooled:
+                upload.close()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+async def run_job(job_id: str, query: str, upload, mode: str, slot):
+    """Run a submitted job in its reserved worker pool slot, recording each task as it finishes"""
+    task_callback = None
+    if crew_executor.kind == "thread":
+        # Process workers cannot reach this store, so they report at the end instead
+        def task_callback(output):
+            job_store.append_task(job_id, task_output_to_dict(output))
+
+    try:
+        await asyncio.to_thread(job_store.update, job_id, status=RUNNING)
+        report = await asyncio.to_thread(load_uploaded_report, upload)
+        response = await slot.run(
+            run_crew, query=query, file_path=None, task_callback=task_callback, report=report, mode=mode,
+            flow=job_id
+        )
+        if task_callback is None:
+            for output in getattr(response, "tasks_output", None) or []:
+                await asyncio.to_thread(job_store.append_task, job_id, task_output_to_dict(output))
+        await asyncio.to_thread(job_store.update, job_id, status=SUCCEEDED, result=str(response))
+
+    except (VerificationFailed, ReportRejected) as e:
+        await asyncio.to_thread(job_store.update, job_id, status=FAILED, error=f"{e}: {e.output}")
+
+    except Exception as e:
+        await asyncio.to_thread(job_store.update, job_id, status=FAILED, error=str(e))
+
+    finally:
+        # Frees the slot if the job failed before reaching the pool
+        slot.release()
+        upload.close()
+
+@app.post("/jobs", status_code=202)
+async def submit_job(
+    file: UploadFile = File(...),
+    query: str = Form(default="Summarise my Blood Test Report"),
+    mode: str = Form(default=DEFAULT_MODE)
+):
+    """Submit a blood test report for background analysis and return a job id"""
+    validate_mode(mode)
+    # The slot is reserved before the job is accepted, so a 202 job is never turned away by the pool later
+    try:
+        slot = crew_executor.reserve()
+    except PoolSaturated as e:
+        raise analysis_error(e)
+
+    upload = None
+    try:
+        upload = await receive_upload(file)
+        if query == "" or query is None:
+            query = "Summarise my Blood Test Report"
+
+        job = new_job(query.strip(), file.filename)
+        await asyncio.to_thread(job_store.create, job)
+    except BaseException:
+        slot.release()
+        if upload is not None:
+            upload.close()
+        raise
+
+    # Keep a reference so the task is not garbage collected mid-run
+    background = asyncio.create_task(run_job(job["id"], job["query"], upload, mode, slot))
+    _background_jobs.add(background)
+    background.add_done_callback(_background_jobs.discard)
+
+    return {
+        "id": job["id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['id']}",
+        "events_url": f"/jobs/{job['id']}/events"
+    }
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    """Status and per-task partial results of a submitted job"""
+    job = await asyncio.to_thread(job_store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """Server-Sent Events stream with one event per finished task"""
+    if await asyncio.to_thread(job_store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return StreamingResponse(
+        job_events(job_store, job_id, is_disconnected=request.is_disconnected),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
 
 if __name__ == "__main__":
     import uvicorn
@@ -1,8 +1,9 @@
 from fastapi import FastAPI, File, UploadFile, Form, HTTPException
-import os
 import uuid
 import json
 
+from uploads import spool_upload, UploadRejected
+
 app = FastAPI(title="Blood Test Report Analyser - Simple Version")
 
 @app.get("/")
@@ -17,22 +18,16 @@ async def analyze_blood_report(
 ):
     """Analyze blood test report and provide comprehensive health recommendations"""
     
-    # Generate unique filename to avoid conflicts
+    # Generate unique analysis id
     file_id = str(uuid.uuid4())
-    file_path = f"data/blood_test_report_{file_id}.pdf"
+    upload = None
     
     try:
-        # Ensure data directory exists
-        os.makedirs("data", exist_ok=True)
-        
-        # Validate file type
-        if not file.filename.lower().endswith('.pdf'):
-            raise HTTPException(status_code=400, detail="Only PDF files are supported")
-        
-        # Save uploaded file
-        with open(file_path, "wb") as f:
-            content = await file.read()
-            f.write(content)
+        # Validate and stream the uploaded file without buffering it all in memory
+        try:
+            upload = await spool_upload(file)
+        except UploadRejected as e:
+            raise HTTPException(status_code=e.status_code, detail=e.detail)
         
         # Validate query
         if query == "" or query is None:
@@ -67,16 +62,16 @@ async def analyze_blood_report(
         
         return analysis_response
         
+    except HTTPException:
+        raise
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing blood report: {str(e)}")
     
     finally:
-        # Clean up uploaded file
-        if os.path.exists(file_path):
-            try:
-                os.remove(file_path)
-            except:
-                pass  # Ignore cleanup errors
+        # Release the upload buffer
+        if upload is not None:
+            upload.close()
 
 @app.get("/health")
 async def health_check():
@@ -87,8 +82,8 @@ async def health_check():
         "features": [
             "PDF file upload",
             "Basic file validation",
-            "Simple analysis response",
-            "File cleanup"
+            "Streaming upload with size limit",
+            "Simple analysis response"
         ]
     }
 
@@ -0,0 +1,383 @@
+## Deterministic lab-marker extraction into a columnar table
+import re
+
+import numpy as np
+
+# Canonical analytes: key -> (display name, canonical unit, panel, aliases)
+# Aliases are matched case-insensitively against the start of the test name.
+ANALYTES = {
+    "hemoglobin": ("Hemoglobin", "g/dL", "cbc", ["hemoglobin", "haemoglobin", "hb", "hgb"]),
+    "pcv": ("Packed Cell Volume", "%", "cbc", ["packed cell volume", "pcv", "hematocrit", "haematocrit", "hct"]),
+    "rbc": ("RBC Count", "10^6/uL", "cbc", ["rbc count", "rbc", "red blood cell", "erythrocyte count"]),
+    "mcv": ("MCV", "fL", "cbc", ["mcv", "mean corpuscular volume"]),
+    "mchc": ("MCHC", "g/dL", "cbc", ["mchc"]),
+    "mch": ("MCH", "pg", "cbc", ["mch", "mean corpuscular hemoglobin"]),
+    "rdw": ("RDW", "%", "cbc", ["red cell distribution width", "rdw"]),
+    "wbc": ("Total Leukocyte Count", "10^3/uL", "cbc", ["total leukocyte count", "total leucocyte count", "tlc", "wbc", "white blood cell"]),
+    "neutrophils": ("Neutrophils", "%", "cbc", ["segmented neutrophils", "neutrophils"]),
+    "lymphocytes": ("Lymphocytes", "%", "cbc", ["lymphocytes"]),
+    "monocytes": ("Monocytes", "%", "cbc", ["monocytes"]),
+    "eosinophils": ("Eosinophils", "%", "cbc", ["eosinophils"]),
+    "basophils": ("Basophils", "%", "cbc", ["basophils"]),
+    # Absolute differential counts share their names with the percentages above
+    "neutrophils_abs": ("Absolute Neutrophils", "10^3/uL", "cbc", []),
+    "lymphocytes_abs": ("Absolute Lymphocytes", "10^3/uL", "cbc", []),
+    "monocytes_abs": ("Absolute Monocytes", "10^3/uL", "cbc", []),
+    "eosinophils_abs": ("Absolute Eosinophils", "10^3/uL", "cbc", []),
+    "basophils_abs": ("Absolute Basophils", "10^3/uL", "cbc", []),
+    "platelets": ("Platelet Count", "10^3/uL", "cbc", ["platelet count", "platelets", "plt"]),
+    "mpv": ("Mean Platelet Volume", "fL", "cbc", ["mean platelet volume", "mpv"]),
+    "esr": ("ESR", "mm/hr", "cbc", ["esr", "erythrocyte sedimentation rate"]),
+    "glucose_fasting": ("Fasting Glucose", "mg/dL", "glucose", ["fasting glucose", "glucose fasting", "fasting blood sugar", "fbs", "glucose"]),
+    "hba1c": ("HbA1c", "%", "glucose", ["hba1c", "glycated hemoglobin", "glycosylated hemoglobin"]),
+    "cholesterol_total": ("Total Cholesterol", "mg/dL", "lipids", ["cholesterol, total", "total cholesterol", "cholesterol total", "cholesterol"]),
+    "triglycerides": ("Triglycerides", "mg/dL", "lipids", ["triglycerides", "triglyceride"]),
+    "hdl": ("HDL Cholesterol", "mg/dL", "lipids", ["hdl cholesterol", "hdl"]),
+    "ldl": ("LDL Cholesterol", "mg/dL", "lipids", ["ldl cholesterol", "ldl"]),
+    "vldl": ("VLDL Cholesterol", "mg/dL", "lipids", ["vldl cholesterol", "vldl"]),
+    "non_hdl": ("Non-HDL Cholesterol", "mg/dL", "lipids", ["non-hdl cholesterol", "non hdl cholesterol"]),
+    "creatinine": ("Creatinine", "mg/dL", "kidney", ["creatinine"]),
+    "egfr": ("eGFR", "mL/min/1.73m2", "kidney", ["gfr estimated", "egfr", "estimated gfr"]),
+    "urea": ("Urea", "mg/dL", "kidney", ["urea"]),
+    "bun": ("Urea Nitrogen", "mg/dL", "kidney", ["urea nitrogen", "bun"]),
+    "uric_acid": ("Uric Acid", "mg/dL", "kidney", ["uric acid"]),
+    "ast": ("AST (SGOT)", "U/L", "liver", ["ast", "sgot", "aspartate aminotransferase"]),
+    "alt": ("ALT (SGPT)", "U/L", "liver", ["alt", "sgpt", "alanine aminotransferase"]),
+    "ggt": ("GGT", "U/L", "liver", ["ggtp", "ggt", "gamma gt", "gamma glutamyl"]),
+    "alp": ("Alkaline Phosphatase", "U/L", "liver", ["alkaline phosphatase", "alp"]),
+    "bilirubin_total": ("Bilirubin Total", "mg/dL", "liver", ["bilirubin total", "total bilirubin"]),
+    "bilirubin_direct": ("Bilirubin Direct", "mg/dL", "liver", ["bilirubin direct", "direct bilirubin"]),
+    "bilirubin_indirect": ("Bilirubin Indirect", "mg/dL", "liver", ["bilirubin indirect", "indirect bilirubin"]),
+    "protein_total": ("Total Protein", "g/dL", "liver", ["total protein", "protein total"]),
+    "albumin": ("Albumin", "g/dL", "liver", ["albumin"]),
+    "globulin": ("Globulin", "g/dL", "liver", ["globulin"]),
+    "calcium": ("Calcium", "mg/dL", "electrolytes", ["calcium"]),
+    "phosphorus": ("Phosphorus", "mg/dL", "electrolytes", ["phosphorus", "phosphate"]),
+    "sodium": ("Sodium", "mEq/L", "electrolytes", ["sodium"]),
+    "potassium": ("Potassium", "mEq/L", "electrolytes", ["potassium"]),
+    "chloride": ("Chloride", "mEq/L", "electrolytes", ["chloride"]),
+    "tsh": ("TSH", "uIU/mL", "thyroid", ["tsh", "thyroid stimulating hormone"]),
+    "t3": ("T3", "ng/dL", "thyroid", ["total t3", "t3"]),
+    "t4": ("T4", "ug/dL", "thyroid", ["total t4", "t4"]),
+    "vitamin_d": ("Vitamin D", "ng/mL", "vitamins", ["vitamin d", "25-oh vitamin d", "25 hydroxy"]),
+    "vitamin_b12": ("Vitamin B12", "pg/mL", "vitamins", ["vitamin b12", "cyanocobalamin", "b12"]),
+    "iron": ("Iron", "ug/dL", "iron", ["iron"]),
+    "ferritin": ("Ferritin", "ng/mL", "iron", ["ferritin"]),
+    "tibc": ("TIBC", "ug/dL", "iron", ["tibc", "total iron binding capacity"]),
+}
+
+# Spellings that mean the same unit
+UNIT_ALIASES = {
+    "gm/dl": "g/dL",
+    "g/dl": "g/dL",
+    "mg/dl": "mg/dL",
+    "ug/dl": "ug/dL",
+    "µg/dl": "ug/dL",
+    "mcg/dl": "ug/dL",
+    "thou/mm3": "10^3/uL",
+    "thou/ul": "10^3/uL",
+    "10^3/ul": "10^3/uL",
+    "10^3/µl": "10^3/uL",
+    "x10^9/l": "10^3/uL",
+    "10^9/l": "10^3/uL",
+    "mill/mm3": "10^6/uL",
+    "mill/ul": "10^6/uL",
+    "10^6/ul": "10^6/uL",
+    "10^6/µl": "10^6/uL",
+    "x10^12/l": "10^6/uL",
+    "10^12/l": "10^6/uL",
+    "fl": "fL",
+    "pg": "pg",
+    "%": "%",
+    "u/l": "U/L",
+    "iu/l": "U/L",
+    "meq/l": "mEq/L",
+    "mmol/l": "mmol/L",
+    "umol/l": "umol/L",
+    "µmol/l": "umol/L",
+    "g/l": "g/L",
+    "ng/ml": "ng/mL",
+    "ng/dl": "ng/dL",
+    "pg/ml": "pg/mL",
+    "nmol/l": "nmol/L",
+    "pmol/l": "pmol/L",
+    "uiu/ml": "uIU/mL",
+    "µiu/ml": "uIU/mL",
+    "miu/l": "uIU/mL",
+    "ml/min/1.73m2": "mL/min/1.73m2",
+    "mm/hr": "mm/hr",
+}
+
+# Multiplicative conversions into the canonical unit: (analyte, unit) -> factor
+CONVERSIONS = {
+    ("glucose_fasting", "mmol/L"): 18.016,
+    ("cholesterol_total", "mmol/L"): 38.67,
+    ("hdl", "mmol/L"): 38.67,
+    ("ldl", "mmol/L"): 38.67,
+    ("vldl", "mmol/L"): 38.67,
+    ("non_hdl", "mmol/L"): 38.67,
+    ("triglycerides", "mmol/L"): 88.57,
+    ("creatinine", "umol/L"): 1 / 88.4,
+    ("urea", "mmol/L"): 6.006,
+    ("bun", "mmol/L"): 2.801,
+    ("uric_acid", "umol/L"): 1 / 59.48,
+    ("calcium", "mmol/L"): 4.008,
+    ("phosphorus", "mmol/L"): 3.097,
+    ("sodium", "mmol/L"): 1.0,
+    ("potassium", "mmol/L"): 1.0,
+    ("chloride", "mmol/L"): 1.0,
+    ("hemoglobin", "g/L"): 0.1,
+    ("mchc", "g/L"): 0.1,
+    ("albumin", "g/L"): 0.1,
+    ("protein_total", "g/L"): 0.1,
+    ("globulin", "g/L"): 0.1,
+    ("bilirubin_total", "umol/L"): 1 / 17.1,
+    ("bilirubin_direct", "umol/L"): 1 / 17.1,
+    ("bilirubin_indirect", "umol/L"): 1 / 17.1,
+    ("t3", "ng/mL"): 100.0,
+    ("vitamin_d", "nmol/L"): 1 / 2.496,
+    ("vitamin_b12", "pmol/L"): 1.355,
+}
+
+PANELS = ("cbc", "glucose", "lipids", "kidney", "liver", "electrolytes", "thyroid", "vitamins", "iron", "other")
+
+LOW = -1
+NORMAL = 0
+HIGH = 1
+
+_NUM = r"\d+(?:\.\d+)?"
+_RANGE = rf"(?:{_NUM}\s*-\s*{_NUM}|[<>]=?\s*{_NUM})"
+# Longest spellings first so "mill/mm3" wins over "mm" and glued values split correctly
+_UNIT = "|".join(re.escape(unit) for unit in sorted(UNIT_ALIASES, key=len, reverse=True))
+_NAME = r"[A-Za-z][A-Za-z0-9 ,/&'+.\-]*?(?:\([A-Za-z0-9 ,\-]*\))?"
+
+# " 13.00 - 17.00 g/dL15.00" and " 40.00 - 80.00 Segmented Neutrophils %60.00"
+_RANGE_UNIT_VALUE = re.compile(
+    rf"^\s*(?P<range>{_RANGE})\s+(?:(?P<name>{_NAME})\s+)?(?P<unit>{_UNIT})\s*(?P<value>{_NUM})\s*$", re.I
+)
+# "105.00Cholesterol, Total" or "3.00Globulin(Calculated)  2.0 - 3.5 gm/dL"
+_VALUE_NAME = re.compile(
+    rf"^\s*(?P<value>{_NUM})(?P<name>[A-Za-z][^()]*?)\s*(?:\([^)]*\))?\s*(?:(?P<range>{_RANGE})\s*(?P<unit>{_UNIT})?)?\s*$", re.I
+)
+# " <200.00 mg/dL" following a value-first line
+_RANGE_UNIT = re.compile(rf"^\s*(?P<range>{_RANGE})?\s*(?P<unit>{_UNIT})?\s*$", re.I)
+# "Haemoglobin   13.5  g/dL   13.0 - 17.0"
+_TABULAR = re.compile(
+    rf"^\s*(?P<name>{_NAME})\s*[:\s]\s*(?P<flag>[HL]\s+)?(?P<value>{_NUM})\s*(?P<unit>{_UNIT})?"
+    rf"(?:\s+(?P<range>{_RANGE})\s*(?P<unit2>{_UNIT})?)?\s*$", re.I
+)
+_METHOD = re.compile(r"^\s*\(.*\)\s*$")
+
+
+def canonical_unit(unit):
+    if not unit:
+        return ""
+    return UNIT_ALIASES.get(unit.strip().lower(), unit.strip())
+
+
+_ALIAS_INDEX = sorted(
+    ((alias, key) for key, (_, _, _, aliases) in ANALYTES.items() for alias in aliases),
+    key=lambda item: len(item[0]),
+    reverse=True,
+)
+
+
+def canonical_analyte(name):
+    """Map a printed test name to an ANALYTES key, or a slug for unknown tests"""
+    cleaned = re.sub(r"\s+", " ", name.strip().lower())
+    for alias, key in _ALIAS_INDEX:
+        if cleaned == alias or cleaned.startswith(alias + " ") or cleaned.startswith(alias + ","):
+            return key
+    return re.sub(r"[^a-z0-9]+", "_", cleaned).strip("_")
+
+
+def parse_range(text):
+    """Turn "13.0 - 17.0", "<200" or ">40" into a (low, high) pair with NaN for open ends"""
+    if not text:
+        return np.nan, np.nan
+    text = text.replace(" ", "")
+    if text[0] in "<>":
+        bound = float(text.lstrip("<>="))
+        return (np.nan, bound) if text[0] == "<" else (bound, np.nan)
+    low, high = text.split("-", 1)
+    return float(low), float(high)
+
+
+## Columnar marker table
+class MarkerTable:
+    """Extracted markers stored as parallel NumPy arrays, one row per analyte result"""
+
+    COLUMNS = ("key", "name", "panel", "value", "unit", "low", "high", "flag")
+
+    def __init__(self, key, name, panel, value, unit, low, high, flag=None):
+        self.key = np.asarray(key, dtype=object)
+        self.name = np.asarray(name, dtype=object)
+        self.panel = np.asarray(panel, dtype=object)
+        self.value = np.asarray(value, dtype=np.float64)
+        self.unit = np.asarray(unit, dtype=object)
+        self.low = np.asarray(low, dtype=np.float64)
+        self.high = np.asarray(high, dtype=np.float64)
+        self.flag = compute_flags(self.value, self.low, self.high) if flag is None else np.asarray(flag, dtype=np.int8)
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [], [], [], [], [])
+
+    @classmethod
+    def from_records(cls, records):
+        columns = {column: [record[column] for record in records] for column in cls.COLUMNS[:-1]}
+        return cls(**columns)
+
+    @classmethod
+    def concat(cls, tables):
+        tables = list(tables)
+        if not tables:
+            return cls.empty()
+        return cls(*(np.concatenate([getattr(t, column) for t in tables]) for column in cls.COLUMNS))
+
+    def __len__(self):
+        return len(self.value)
+
+    def take(self, mask):
+        return MarkerTable(*(getattr(self, column)[mask] for column in self.COLUMNS))
+
+    def abnormal(self):
+        return self.take(self.flag != NORMAL)
+
+    def select(self, panels=None, keys=None):
+        mask = np.ones(len(self), dtype=bool)
+        if panels is not None:
+            mask &= np.isin(self.panel, list(panels))
+        if keys is not None:
+            mask &= np.isin(self.key, list(keys))
+        return self.take(mask)
+
+    def get(self, key):
+        """First row for key as a dict, or None"""
+        rows = np.flatnonzero(self.key == key)
+        return self.row(rows[0]) if len(rows) else None
+
+    def row(self, index):
+        record = {column: getattr(self, column)[index] for column in self.COLUMNS}
+        for column in ("value", "low", "high"):
+            number = float(record[column])
+            record[column] = None if np.isnan(number) else number
+        record["flag"] = int(record["flag"])
+        return record
+
+    def to_records(self):
+        return [self.row(index) for index in range(len(self))]
+
+    def to_text(self):
+        """Compact one-line-per-marker rendering for prompts and tool output"""
+        labels = {LOW: "LOW", NORMAL: "normal", HIGH: "HIGH"}
+        lines = []
+        for record in self.to_records():
+            low, high = record["low"], record["high"]
+            if low is not None and high is not None:
+                ref = f"{low:g}-{high:g}"
+            elif high is not None:
+                ref = f"<{high:g}"
+            elif low is not None:
+                ref = f">{low:g}"
+            else:
+                ref = "n/a"
+            lines.append(
+                f"{record['name']}: {record['value']:g} {record['unit']} (ref {ref}) {labels[record['flag']]}"
+            )
+        return "\n".join(lines)
+
+
+def compute_flags(value, low, high):
+    """Vectorized high/low flags; rows without a bound on a side are never flagged on that side"""
+    with np.errstate(invalid="ignore"):
+        flags = np.where(value < low, LOW, NORMAL)
+        flags = np.where(value > high, HIGH, flags)
+    return flags.astype(np.int8)
+
+
+def normalise_units(keys, units, values, lows, highs):
+    """Convert rows into each analyte's canonical unit where a conversion is known"""
+    factors = np.ones(len(values), dtype=np.float64)
+    for index, (key, unit) in enumerate(zip(keys, units)):
+        factor = CONVERSIONS.get((key, unit))
+        if factor is not None:
+            factors[index] = factor
+            units[index] = ANALYTES[key][1]
+    return values * factors, lows * factors, highs * factors
+
+
+## Text extraction
+def _record(name, value, unit, range_text):
+    key = canonical_analyte(name)
+    unit = canonical_unit(unit)
+    if unit == "10^3/uL" and f"{key}_abs" in ANALYTES:
+        key = f"{key}_abs"
+    display, _, panel, _ = ANALYTES.get(key, (re.sub(r"\s+", " ", name.strip()), "", "other", []))
+    low, high = parse_range(range_text)
+    return key, display, panel, float(value), unit, low, high
+
+
+def iter_marker_rows(text):
+    """Yield raw (key, name, panel, value, unit, low, high) rows from report text"""
+    pending_name = None
+    pending_value = None
+    for line in text.splitlines():
+        if not line.strip() or _METHOD.match(line):
+            continue
+
+        match = _RANGE_UNIT_VALUE.match(line)
+        if match and (match.group("name") or pending_name):
+            yield _record(match.group("name") or pending_name, match.group("value"),
+                          match.group("unit"), match.group("range"))
+            continue
+
+        if pending_value is not None:
+            match = _RANGE_UNIT.match(line)
+            name, value = pending_value
+            pending_value = None
+            if match and (match.group("range") or match.group("unit")):
+                yield _record(name, value, match.group("unit"), match.group("range"))
+                continue
+            yield _record(name, value, "", None)
+
+        match = _VALUE_NAME.match(line)
+        if match:
+            if match.group("range"):
+                yield _record(match.group("name"), match.group("value"), match.group("unit"), match.group("range"))
+            else:
+                pending_value = (match.group("name"), match.group("value"))
+            pending_name = None
+            continue
+
+        match = _TABULAR.match(line)
+        if match:
+            yield _record(match.group("name"), match.group("value"),
+                          match.group("unit") or match.group("unit2"), match.group("range"))
+            pending_name = None
+            continue
+
+        pending_name = line.strip() if re.match(r"^[A-Za-z]", line.strip()) else None
+
+
+def extract_markers(text):
+    """Extract a MarkerTable from report text.
+
+    Only rows whose name maps to a known analyte are kept, so page
+    furniture that happens to contain numbers does not pollute the table.
+    Repeated results for an analyte (e.g. reprinted pages) keep the first.
+    """
+    seen = set()
+    rows = []
+    for row in iter_marker_rows(text):
+        if row[0] in ANALYTES and row[0] not in seen:
+            seen.add(row[0])
+            rows.append(row)
+    if not rows:
+        return MarkerTable.empty()
+
+    keys, names, panels, values, units, lows, highs = (list(column) for column in zip(*rows))
+    values, lows, highs = normalise_units(
+        keys, units, np.array(values, dtype=np.float64), np.array(lows, dtype=np.float64), np.array(highs, dtype=np.float64)
+    )
+    return MarkerTable(keys, names, panels, values, units, lows, highs)
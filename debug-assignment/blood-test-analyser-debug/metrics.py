@@ -0,0 +1,250 @@
+## Per-stage metrics and tracing spans
+import os
+import json
+import time
+import uuid
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import trace as otel_trace  # type: ignore
+except ImportError:
+    # Optional: spans are still timed, counted and (with TRACE_LOG=1) logged without it
+    otel_trace = None
+
+METRICS_ENABLED = os.getenv("METRICS", "1") != "0"
+# Log every finished span as one JSON line on the "analysis.trace" logger
+TRACE_LOG = os.getenv("TRACE_LOG", "0") == "1"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+logger = logging.getLogger("analysis.trace")
+if TRACE_LOG and not logger.handlers:
+    _handler = logging.StreamHandler()
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(_handler)
+    logger.setLevel(logging.INFO)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _label_text(names, values, extra=None):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+## Metric types
+class Counter:
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_label_text(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [bucket counts..., sum, count]
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, state in sorted(self._values.items()):
+                for bound, count in zip(self.buckets + ("+Inf",), state[:-2] + [state[-1]]):
+                    le = 'le="%s"' % bound
+                    lines.append(f"{self.name}_bucket{_label_text(self.labels, key, le)} {count}")
+                lines.append(f"{self.name}_sum{_label_text(self.labels, key)} {state[-2]}")
+                lines.append(f"{self.name}_count{_label_text(self.labels, key)} {state[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+STAGE_SECONDS = registry.register(Histogram(
+    "analysis_stage_seconds", "Latency of each analysis stage", ("stage", "agent_role")))
+STAGE_ERRORS = registry.register(Counter(
+    "analysis_stage_errors_total", "Stages that raised, by exception type", ("stage", "agent_role", "error")))
+BYTES_PROCESSED = registry.register(Counter(
+    "analysis_bytes_processed_total", "Bytes read by each stage", ("stage",)))
+LLM_REQUESTS = registry.register(Counter(
+    "llm_requests_total", "Provider calls by agent role and HTTP status", ("agent_role", "status")))
+LLM_TOKENS = registry.register(Counter(
+    "llm_tokens_total", "Tokens reported by the provider", ("agent_role", "kind")))
+REPORT_TOKENS = registry.register(Counter(
+    "analysis_report_tokens_total", "Report tokens before and after compaction", ("agent_role", "kind")))
+HTTP_REQUESTS = registry.register(Counter(
+    "http_client_requests_total", "Outbound requests by pool and whether they opened a connection", ("pool", "connection")))
+SINGLE_FLIGHT = registry.register(Counter(
+    "analysis_single_flight_total", "Analyses run, coalesced onto a running duplicate, or cancelled", ("outcome",)))
+
+
+## Spans
+_current_span = contextvars.ContextVar("analysis_span", default=None)
+
+
+class Span:
+    """One timed stage; nested spans share the trace id and inherit the agent role"""
+
+    def __init__(self, name, parent=None, attributes=None):
+        self.name = name
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent else None
+        self.attributes = dict(attributes or {})
+        if "agent_role" not in self.attributes and parent is not None and parent.agent_role:
+            self.attributes["agent_role"] = parent.agent_role
+        self.status = "ok"
+        self.started = time.perf_counter()
+        self.duration = None
+
+    @property
+    def agent_role(self):
+        return self.attributes.get("agent_role") or ""
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "duration_ms": round(self.duration * 1000, 3) if self.duration is not None else None,
+            "status": self.status,
+            "attributes": self.attributes,
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """Time a stage, record it in the metrics and emit it as a span.
+
+    The span is also started in OpenTelemetry when that package is installed.
+    Pass agent_role to label the stage; nested spans inherit it.
+    """
+    current = Span(name, _current_span.get(), attributes)
+    token = _current_span.set(current)
+    otel_context = (
+        otel_trace.get_tracer("blood-test-analyser").start_as_current_span(name)
+        if otel_trace is not None else None
+    )
+    otel_span = otel_context.__enter__() if otel_context is not None else None
+    error = None
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        error = e
+        raise
+    finally:
+        current.duration = time.perf_counter() - current.started
+        _current_span.reset(token)
+        if METRICS_ENABLED:
+            STAGE_SECONDS.observe(current.duration, stage=name, agent_role=current.agent_role)
+            if error is not None:
+                STAGE_ERRORS.inc(stage=name, agent_role=current.agent_role, error=type(error).__name__)
+        if otel_span is not None:
+            for key, value in current.attributes.items():
+                if value is not None:
+                    otel_span.set_attribute(key, value if isinstance(value, (str, bool, int, float)) else str(value))
+            otel_context.__exit__(type(error) if error else None, error, error.__traceback__ if error else None)
+        if TRACE_LOG:
+            logger.info(json.dumps(current.to_dict(), default=str))
+
+
+def current_span():
+    return _current_span.get()
+
+
+def current_agent_role():
+    active = _current_span.get()
+    return active.agent_role if active is not None else ""
+
+
+def record_bytes(stage, size):
+    if METRICS_ENABLED:
+        BYTES_PROCESSED.inc(size, stage=stage)
+
+
+def record_llm_call(status, usage=None):
+    """Count one provider call and the tokens it reports, under the active span's agent role"""
+    if not METRICS_ENABLED:
+        return
+    role = current_agent_role()
+    LLM_REQUESTS.inc(agent_role=role, status=status)
+    for kind in ("prompt_tokens", "completion_tokens"):
+        if usage and usage.get(kind):
+            LLM_TOKENS.inc(usage[kind], agent_role=role, kind=kind.split("_")[0])
+
+
+def record_compaction(original, sent):
+    """Count report tokens a tool call would have sent and did send, under the active span's agent role"""
+    if not METRICS_ENABLED:
+        return
+    role = current_agent_role()
+    REPORT_TOKENS.inc(original, agent_role=role, kind="original")
+    REPORT_TOKENS.inc(sent, agent_role=role, kind="sent")
+
+
+def record_single_flight(outcome):
+    if METRICS_ENABLED:
+        SINGLE_FLIGHT.inc(outcome=outcome)
+
+
+def record_http_request(pool, opened):
+    if METRICS_ENABLED:
+        HTTP_REQUESTS.inc(pool=pool, connection="new" if opened else "reused")
@@ -0,0 +1,48 @@
+## Single-pass text normalisation shared by every tool
+import re
+
+# Runs of two or more newlines or of two or more spaces
+_BLANK_LINES = re.compile(r"\n{2,}")
+_SPACES = re.compile(r" {2,}")
+_BLANK_LINES_OR_SPACES = re.compile(r"\n{2,}| {2,}")
+
+
+def _first_char(match):
+    return match.group()[0]
+
+
+def collapse_blank_lines(text):
+    """Collapse every run of blank lines into a single newline"""
+    return _BLANK_LINES.sub("\n", text)
+
+
+def collapse_spaces(text):
+    """Collapse every run of spaces into a single space"""
+    return _SPACES.sub(" ", text)
+
+
+def normalise_text(text, blank_lines=True, spaces=True):
+    """Collapse blank lines and/or repeated spaces in one linear pass over text"""
+    if blank_lines and spaces:
+        return _BLANK_LINES_OR_SPACES.sub(_first_char, text)
+    if blank_lines:
+        return collapse_blank_lines(text)
+    if spaces:
+        return collapse_spaces(text)
+    return text
+
+
+def iter_normalised_pages(pages, blank_lines=True, spaces=False):
+    """Yield normalised text one page at a time.
+
+    pages may be strings or document objects with a ``page_content``
+    attribute, so large reports never need to be joined before cleaning.
+    """
+    for page in pages:
+        content = getattr(page, "page_content", page)
+        yield normalise_text(content, blank_lines=blank_lines, spaces=spaces)
+
+
+def normalise_report(pages, blank_lines=True, spaces=False):
+    """Normalise each page and join them into the full report, one page per block"""
+    return "".join(page + "\n" for page in iter_normalised_pages(pages, blank_lines, spaces))
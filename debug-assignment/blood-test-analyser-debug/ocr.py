@@ -0,0 +1,281 @@
+## OCR fallback for scanned pages, run in its own process pool
+import io
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from functools import lru_cache
+
+from metrics import span, record_bytes
+
+OCR_ENABLED = os.getenv("OCR", "1") != "0"
+# Pages with fewer extracted characters than this are treated as scanned
+OCR_MIN_CHARS = int(os.getenv("OCR_MIN_CHARS", "20"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Seconds one page may take before it is given up on
+OCR_TIMEOUT = float(os.getenv("OCR_TIMEOUT", "60"))
+
+
+# Set in processes that are themselves CPU-bound workers (see run_ocr_inline)
+_inline = False
+
+
+def run_ocr_inline():
+    """Worker initializer: OCR pages in this process instead of handing them to the OCR pool"""
+    global _inline
+    _inline = True
+
+
+def needs_ocr(text):
+    return len((text or "").strip()) < OCR_MIN_CHARS
+
+
+@lru_cache(maxsize=None)
+def ocr_available():
+    """True when pytesseract, Pillow and the tesseract binary can all be used"""
+    try:
+        import pytesseract  # type: ignore
+        import PIL.Image  # type: ignore  # noqa: F401
+        pytesseract.get_tesseract_version()
+    except Exception:
+        print("Warning: OCR not available, scanned pages will stay empty. "
+              "Please install it with: pip install pytesseract pillow (and the tesseract binary)")
+        return False
+    return True
+
+
+def page_images(page):
+    """Encoded images embedded in a pypdf page; a scanned page is usually one full-page image"""
+    try:
+        return [image.data for image in page.images]
+    except Exception:
+        # Extracting images needs Pillow for most encodings
+        return []
+
+
+def _ocr_images(images, lang, timeout):
+    """Worker: OCR each image of a page and join the text"""
+    import pytesseract  # type: ignore
+    from PIL import Image  # type: ignore
+
+    texts = []
+    for data in images:
+        with Image.open(io.BytesIO(data)) as image:
+            texts.append(pytesseract.image_to_string(image, lang=lang, timeout=timeout))
+    return "\n".join(texts)
+
+
+## Creating the OCR cache
+class OCRCache:
+    """OCR text keyed by page image hash: an in-process LRU in front of an optional SQLite file.
+
+    The disk tier holds patient report text, so it is opt-in (OCR_CACHE_PATH)
+    and its rows expire after ttl_seconds; expired rows are deleted every
+    prune_every writes.
+    """
+
+    def __init__(self, max_entries=None, path=None, ttl_seconds=None, prune_every=None):
+        self.max_entries = int(max_entries or os.getenv("OCR_CACHE_MAX_ENTRIES", "512"))
+        # Unset or empty keeps the cache in memory only
+        self.path = path if path is not None else os.getenv("OCR_CACHE_PATH", "")
+        self.ttl_seconds = float(ttl_seconds or os.getenv("OCR_CACHE_TTL", "604800"))
+        self.prune_every = int(prune_every or os.getenv("OCR_CACHE_PRUNE_EVERY", "100"))
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_ready = False
+        self._writes = 0
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                if not self._disk_ready:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS pages ("
+                        " key TEXT PRIMARY KEY,"
+                        " created_at REAL NOT NULL,"
+                        " text TEXT NOT NULL)"
+                    )
+                    conn.execute("CREATE INDEX IF NOT EXISTS idx_pages_created ON pages (created_at)")
+                    self._disk_ready = True
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                return self._memory[key]
+        if not self.path:
+            return None
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT text FROM pages WHERE key = ? AND created_at >= ?", (key, time.time() - self.ttl_seconds)
+            ).fetchone()
+        if row is not None:
+            self._remember(key, row[0])
+            return row[0]
+        return None
+
+    def put(self, key, text):
+        self._remember(key, text)
+        if not self.path:
+            return
+        now = time.time()
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.prune_every == 1 or self.prune_every == 1
+        with self._connect() as conn:
+            conn.execute("INSERT OR REPLACE INTO pages (key, created_at, text) VALUES (?, ?, ?)", (key, now, text))
+            if prune:
+                conn.execute("DELETE FROM pages WHERE created_at < ?", (now - self.ttl_seconds,))
+
+    def _remember(self, key, text):
+        with self._lock:
+            self._memory[key] = text
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+
+
+## Creating the OCR pool
+class OCRPool:
+    """Process pool that OCRs pages in parallel, started on first scanned page.
+
+    In processes set up with run_ocr_inline (the batch workers) pages are
+    OCRed inline, since those processes are already the CPU-bound workers.
+    """
+
+    def __init__(self, workers=None, cache=None, timeout=None, lang=None):
+        self.workers = int(workers or os.getenv("OCR_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+        self.cache = cache or OCRCache()
+        self.timeout = float(timeout or OCR_TIMEOUT)
+        self.lang = lang or OCR_LANG
+        self._executor = None
+        self._lock = threading.Lock()
+        self.pages = 0
+        self.cache_hits = 0
+        self.timeouts = 0
+        self.failures = 0
+
+    @property
+    def executor(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            return self._executor
+
+    def submit(self, images):
+        """Future of the text of a page made of images, resolved from the cache when seen before"""
+        key = hashlib.sha256(self.lang.encode("utf-8") + b"\x00" + b"".join(images)).hexdigest()
+        with self._lock:
+            self.pages += 1
+        cached = self.cache.get(key)
+        if cached is not None:
+            with self._lock:
+                self.cache_hits += 1
+            future = Future()
+            future.set_result(cached)
+            return future
+
+        record_bytes("ocr", sum(len(data) for data in images))
+        if _inline:
+            future = Future()
+            try:
+                future.set_result(_ocr_images(images, self.lang, self.timeout))
+            except Exception as e:
+                future.set_exception(e)
+        else:
+            future = self.executor.submit(_ocr_images, images, self.lang, self.timeout)
+
+        def remember(done):
+            if not done.cancelled() and done.exception() is None:
+                self.cache.put(key, done.result())
+        future.add_done_callback(remember)
+        return future
+
+    def result(self, future, deadline):
+        """Text of a submitted page, or "" if it failed or ran past its deadline"""
+        try:
+            return future.result(timeout=max(0.0, deadline - time.monotonic()))
+        except FutureTimeout:
+            future.cancel()
+            with self._lock:
+                self.timeouts += 1
+        except Exception:
+            with self._lock:
+                self.failures += 1
+        return ""
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait, cancel_futures=True)
+                self._executor = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": OCR_ENABLED,
+                "workers": self.workers,
+                "pages": self.pages,
+                "cache_hits": self.cache_hits,
+                "timeouts": self.timeouts,
+                "failures": self.failures,
+            }
+
+
+ocr_pool = OCRPool()
+
+
+def ocr_missing_text(pages, images_for):
+    """Yield pages in order, filling in text-less ones by OCR.
+
+    Scanned pages are submitted to the pool as soon as they are reached, so
+    several are OCRed in parallel while later pages are still being read;
+    each is yielded once every page before it is ready. images_for(number)
+    returns the encoded images of page number.
+    """
+    pending = deque()
+    try:
+        for number, page in enumerate(pages):
+            future = None
+            if OCR_ENABLED and needs_ocr(page.page_content) and ocr_available():
+                images = images_for(number)
+                if images:
+                    future = ocr_pool.submit(images)
+            pending.append((number, page, future, time.monotonic() + ocr_pool.timeout))
+            while pending and (pending[0][2] is None or pending[0][2].done()):
+                yield _finish(*pending.popleft())
+        while pending:
+            yield _finish(*pending.popleft())
+    finally:
+        # The consumer stopped early (e.g. the report was rejected): drop queued pages
+        for _, _, future, _ in pending:
+            if future is not None:
+                future.cancel()
+
+
+def _finish(number, page, future, deadline):
+    if future is None:
+        return page
+    with span("ocr", page=number):
+        text = ocr_pool.result(future, deadline)
+    # A failed or timed-out page keeps the little text it was extracted with
+    if not text.strip():
+        return page
+    page.page_content = text
+    metadata = getattr(page, "metadata", None)
+    if isinstance(metadata, dict):
+        metadata["ocr"] = True
+    return page
@@ -0,0 +1,283 @@
+## Shared rate limit and token budget for every LLM call
+import os
+import json
+import time
+import random
+import sqlite3
+import threading
+import itertools
+import contextvars
+from contextlib import contextmanager
+
+# Priority classes; lower values are served first
+INTERACTIVE = 0
+BATCH = 1
+PRIORITIES = {"interactive": INTERACTIVE, "batch": BATCH}
+
+_priority = contextvars.ContextVar("llm_priority", default=INTERACTIVE)
+_flow = contextvars.ContextVar("llm_flow", default=None)
+
+
+@contextmanager
+def llm_context(priority=INTERACTIVE, flow=None):
+    """Tag every LLM call made inside the block with a priority class and a flow.
+
+    Flows (one per request, job or batch) share the budget fairly within a
+    priority class. The tags follow contextvars into worker threads.
+    """
+    priority_token = _priority.set(PRIORITIES.get(priority, priority))
+    flow_token = _flow.set(flow)
+    try:
+        yield
+    finally:
+        _flow.reset(flow_token)
+        _priority.reset(priority_token)
+
+
+def estimate_tokens(body, completion_tokens=None):
+    """Rough token cost of a chat completion request: ~4 bytes per prompt token plus the completion"""
+    completion_tokens = completion_tokens or int(os.getenv("LLM_COMPLETION_TOKENS", "512"))
+    try:
+        payload = json.loads(body or b"{}")
+        completion_tokens = int(payload.get("max_tokens") or payload.get("max_completion_tokens") or completion_tokens)
+    except (ValueError, TypeError, AttributeError):
+        pass
+    return len(body or b"") // 4 + completion_tokens
+
+
+## Token buckets
+class MemoryBudget:
+    """Requests-per-minute and tokens-per-minute buckets for a single process"""
+
+    def __init__(self, rpm, tpm, burst=1.0):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        # Bucket capacity as a fraction of a minute's budget
+        self.capacity = {"requests": max(1.0, self.rpm * burst), "tokens": max(1.0, self.tpm * burst)}
+        self._levels = dict(self.capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        elapsed = now - self._updated
+        self._updated = now
+        self._levels["requests"] = min(self.capacity["requests"], self._levels["requests"] + elapsed * self.rpm / 60)
+        self._levels["tokens"] = min(self.capacity["tokens"], self._levels["tokens"] + elapsed * self.tpm / 60)
+
+    def try_acquire(self, tokens):
+        """Take one request and tokens from the buckets. Returns 0 on success, else seconds to wait."""
+        tokens = min(tokens, self.capacity["tokens"])
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            if now < self._paused_until:
+                return self._paused_until - now
+            wait = max(
+                (1 - self._levels["requests"]) * 60 / self.rpm,
+                (tokens - self._levels["tokens"]) * 60 / self.tpm,
+            )
+            if wait > 0:
+                return wait
+            self._levels["requests"] -= 1
+            self._levels["tokens"] -= tokens
+            return 0.0
+
+    def adjust(self, tokens):
+        """Charge extra tokens (or refund, if negative) once the real usage is known"""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._levels["tokens"] = min(self.capacity["tokens"], self._levels["tokens"] - tokens)
+
+    def pause(self, seconds):
+        """Hold every caller back, e.g. after the provider returned 429"""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+
+
+class SQLiteBudget:
+    """The same buckets kept in a SQLite file, so every worker on the host shares one budget"""
+
+    def __init__(self, rpm, tpm, burst=1.0, path="data/rate_limit.sqlite3"):
+        self.rpm = float(rpm)
+        self.tpm = float(tpm)
+        self.capacity = {"requests": max(1.0, self.rpm * burst), "tokens": max(1.0, self.tpm * burst)}
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS budget ("
+                " name TEXT PRIMARY KEY,"
+                " level REAL NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO budget (name, level, updated_at) VALUES (?, ?, ?)",
+                [("requests", self.capacity["requests"], now), ("tokens", self.capacity["tokens"], now),
+                 ("paused_until", 0.0, now)],
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def _read(self, conn, now):
+        # BEGIN IMMEDIATE takes the write lock up front so other workers wait
+        conn.execute("BEGIN IMMEDIATE")
+        rows = dict((name, (level, updated)) for name, level, updated in conn.execute("SELECT name, level, updated_at FROM budget"))
+        levels = {}
+        for name, rate in (("requests", self.rpm), ("tokens", self.tpm)):
+            level, updated = rows[name]
+            levels[name] = min(self.capacity[name], level + max(0.0, now - updated) * rate / 60)
+        return levels, rows["paused_until"][0]
+
+    def _write(self, conn, levels, now):
+        conn.executemany(
+            "UPDATE budget SET level = ?, updated_at = ? WHERE name = ?",
+            [(levels["requests"], now, "requests"), (levels["tokens"], now, "tokens")],
+        )
+
+    def try_acquire(self, tokens):
+        tokens = min(tokens, self.capacity["tokens"])
+        with self._connect() as conn:
+            now = time.time()
+            levels, paused_until = self._read(conn, now)
+            if now < paused_until:
+                return paused_until - now
+            wait = max(
+                (1 - levels["requests"]) * 60 / self.rpm,
+                (tokens - levels["tokens"]) * 60 / self.tpm,
+            )
+            if wait > 0:
+                return wait
+            levels["requests"] -= 1
+            levels["tokens"] -= tokens
+            self._write(conn, levels, now)
+            return 0.0
+
+    def adjust(self, tokens):
+        with self._connect() as conn:
+            now = time.time()
+            levels, _ = self._read(conn, now)
+            levels["tokens"] = min(self.capacity["tokens"], levels["tokens"] - tokens)
+            self._write(conn, levels, now)
+
+    def pause(self, seconds):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE budget SET level = MAX(level, ?) WHERE name = 'paused_until'",
+                (time.time() + seconds,),
+            )
+
+
+def make_budget(kind=None, path=None, rpm=None, tpm=None, burst=None):
+    """Build the budget selected by LLM_RATE_STORE (memory or sqlite)"""
+    kind = (kind or os.getenv("LLM_RATE_STORE", "memory")).lower()
+    rpm = rpm or float(os.getenv("LLM_RPM", "60"))
+    tpm = tpm or float(os.getenv("LLM_TPM", "90000"))
+    burst = burst or float(os.getenv("LLM_BURST", "1.0"))
+    if kind == "memory":
+        return MemoryBudget(rpm, tpm, burst)
+    if kind == "sqlite":
+        return SQLiteBudget(rpm, tpm, burst, path or os.getenv("LLM_RATE_PATH", "data/rate_limit.sqlite3"))
+    raise ValueError(f"Unknown rate limit store: {kind}")
+
+
+## Creating the scheduler
+class LLMScheduler:
+    """Admits LLM calls against a shared budget in priority and fair-queue order.
+
+    Waiting callers are ordered by priority class, then by a start-time fair
+    queueing tag per flow, so one large batch cannot crowd out other flows of
+    the same class. Only the head of the queue polls the budget; it sleeps
+    for the refill time plus jitter so workers sharing a SQLite budget do not
+    wake in lockstep.
+    """
+
+    def __init__(self, budget=None, max_retries=None, backoff_base=None, backoff_max=None):
+        self.budget = budget or make_budget()
+        self.max_retries = int(max_retries if max_retries is not None else os.getenv("LLM_MAX_RETRIES", "5"))
+        self.backoff_base = float(backoff_base or os.getenv("LLM_BACKOFF_BASE", "1.0"))
+        self.backoff_max = float(backoff_max or os.getenv("LLM_BACKOFF_MAX", "60"))
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._flow_tags = {}
+        self._virtual_time = 0
+        self._seq = itertools.count()
+        self.granted = {INTERACTIVE: 0, BATCH: 0}
+        self.wait_seconds = {INTERACTIVE: 0.0, BATCH: 0.0}
+        self.retries = 0
+        self.throttled = 0
+
+    def _head(self):
+        return min(self._waiting)
+
+    def acquire(self, tokens, priority=None, flow=None):
+        """Block until one request and tokens are available for this caller"""
+        priority = _priority.get() if priority is None else priority
+        flow = flow if flow is not None else (_flow.get() or threading.get_ident())
+        started = time.monotonic()
+        with self._cond:
+            tag = max(self._virtual_time, self._flow_tags.get(flow, 0)) + 1
+            self._flow_tags[flow] = tag
+            entry = (priority, tag, next(self._seq))
+            self._waiting.append(entry)
+            try:
+                while True:
+                    if self._head() != entry:
+                        self._cond.wait()
+                        continue
+                    wait = self.budget.try_acquire(tokens)
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait + random.uniform(0, min(wait, 1.0)))
+            finally:
+                self._waiting.remove(entry)
+                self._cond.notify_all()
+            self._virtual_time = max(self._virtual_time, tag)
+            # Flows that are not ahead of the clock no longer need their tag
+            if len(self._flow_tags) > 1024:
+                self._flow_tags = {f: t for f, t in self._flow_tags.items() if t > self._virtual_time}
+            self.granted[priority] = self.granted.get(priority, 0) + 1
+            self.wait_seconds[priority] = self.wait_seconds.get(priority, 0.0) + time.monotonic() - started
+
+    def backoff(self, attempt, retry_after=None):
+        """Seconds to wait before retry number attempt: Retry-After if given, else full-jitter exponential"""
+        if retry_after is not None:
+            return retry_after + random.uniform(0, self.backoff_base)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    def record_retry(self, status_code, delay):
+        """Count a retry; on 429 pause the shared budget so every worker backs off, not just this caller"""
+        with self._cond:
+            self.retries += 1
+            if status_code == 429:
+                self.throttled += 1
+        if status_code == 429:
+            self.budget.pause(delay)
+
+    def settle(self, estimated, actual):
+        if actual is not None and actual != estimated:
+            self.budget.adjust(actual - estimated)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "waiting": len(self._waiting),
+                "granted": {name: self.granted.get(p, 0) for name, p in PRIORITIES.items()},
+                "wait_seconds": {name: round(self.wait_seconds.get(p, 0.0), 3) for name, p in PRIORITIES.items()},
+                "throttled": self.throttled,
+                "retries": self.retries,
+            }
+
+
+llm_scheduler = LLMScheduler()
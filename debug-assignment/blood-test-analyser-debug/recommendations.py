@@ -0,0 +1,90 @@
+## Rule-based recommendations from a MarkerTable
+from markers import HIGH, LOW
+
+# (analyte key, flag) -> dietary guidance
+NUTRITION_RULES = {
+    ("cholesterol_total", HIGH): "Cut saturated and trans fats and add soluble fibre (oats, legumes, fruit) to lower total cholesterol.",
+    ("ldl", HIGH): "Favour unsaturated fats (olive oil, nuts, oily fish) over butter and fatty meats to bring LDL down.",
+    ("non_hdl", HIGH): "Reduce processed and fried foods; plant sterols and fibre help lower non-HDL cholesterol.",
+    ("triglycerides", HIGH): "Limit refined carbohydrates, added sugar and alcohol; include omega-3 rich fish twice a week.",
+    ("hdl", LOW): "Replace refined carbohydrates with healthy fats such as nuts, seeds and olive oil to support HDL.",
+    ("glucose_fasting", HIGH): "Choose low glycaemic index carbohydrates, pair them with protein and fibre, and control portions.",
+    ("hba1c", HIGH): "Keep carbohydrate intake consistent across meals and avoid sugary drinks to improve long-term glucose control.",
+    ("hemoglobin", LOW): "Eat iron-rich foods (legumes, leafy greens, lean red meat) with vitamin C to improve absorption.",
+    ("iron", LOW): "Increase dietary iron and avoid tea or coffee with meals, which reduce iron absorption.",
+    ("ferritin", LOW): "Iron stores are low; iron-rich foods and a discussion about supplementation are advised.",
+    ("vitamin_d", LOW): "Include fatty fish, eggs and fortified foods; ask your doctor whether vitamin D supplements are needed.",
+    ("vitamin_b12", LOW): "Include eggs, dairy, fish or B12-fortified foods, especially on a vegetarian diet.",
+    ("uric_acid", HIGH): "Limit purine-rich foods (organ meats, red meat, shellfish), sugary drinks and alcohol; stay well hydrated.",
+    ("calcium", LOW): "Include dairy or fortified alternatives, leafy greens and almonds for calcium.",
+    ("potassium", LOW): "Add potassium-rich foods such as bananas, potatoes, beans and spinach.",
+    ("potassium", HIGH): "Check with your doctor before eating many high-potassium foods or using salt substitutes.",
+    ("sodium", HIGH): "Ensure adequate water intake and review salt in processed foods.",
+    ("alt", HIGH): "Avoid alcohol and limit sugary and fried foods to reduce strain on the liver.",
+    ("ast", HIGH): "Avoid alcohol and aim for gradual weight loss if overweight to support liver health.",
+    ("ggt", HIGH): "Reduce or stop alcohol; a raised GGT is often linked to alcohol intake.",
+    ("creatinine", HIGH): "Avoid very high protein intake and creatine supplements until kidney function is reviewed.",
+    ("urea", HIGH): "Stay well hydrated and keep protein intake moderate.",
+    ("albumin", LOW): "Make sure each meal has a good protein source (eggs, dairy, legumes, fish).",
+    ("protein_total", LOW): "Increase overall protein intake with lean meats, dairy, legumes and eggs.",
+}
+
+# (analyte key, flag) -> exercise guidance
+EXERCISE_RULES = {
+    ("hemoglobin", LOW): "Low hemoglobin reduces exercise tolerance; start at low intensity and stop if dizzy or breathless.",
+    ("glucose_fasting", HIGH): "Combine regular aerobic activity with resistance training; a 10-15 minute walk after meals helps glucose control.",
+    ("hba1c", HIGH): "Aim for at least 150 minutes of moderate activity a week and avoid more than two days without exercise.",
+    ("cholesterol_total", HIGH): "Build up to 150 minutes a week of moderate aerobic exercise such as brisk walking or cycling.",
+    ("ldl", HIGH): "Regular moderate aerobic exercise helps lower LDL; add two resistance sessions a week.",
+    ("triglycerides", HIGH): "Consistent aerobic exercise is one of the most effective ways to lower triglycerides.",
+    ("hdl", LOW): "Higher-volume aerobic exercise and interval training can raise HDL over time.",
+    ("potassium", HIGH): "Avoid strenuous exercise until the potassium level has been reviewed by your doctor.",
+    ("potassium", LOW): "Low potassium can cause cramps and heart rhythm problems; avoid intense exercise until corrected.",
+    ("sodium", LOW): "Avoid long endurance sessions and excessive water intake until sodium is back in range.",
+    ("calcium", LOW): "Weight-bearing exercise supports bone health; progress gradually and watch for muscle cramps.",
+    ("creatinine", HIGH): "Avoid very intense training in the 48 hours before a repeat kidney test, as it can raise creatinine.",
+    ("ast", HIGH): "Strenuous exercise can raise AST; rest for 48 hours before a repeat test.",
+    ("alt", HIGH): "Moderate aerobic exercise supports liver health; avoid extreme sessions until levels are reviewed.",
+    ("platelets", LOW): "Avoid contact sports and activities with a high risk of falls or bruising.",
+    ("tsh", HIGH): "An underactive thyroid can limit energy; build up intensity slowly.",
+    ("tsh", LOW): "An overactive thyroid raises heart rate; avoid high-intensity training until reviewed.",
+    ("vitamin_d", LOW): "Outdoor activity and weight-bearing exercise support vitamin D and bone health.",
+}
+
+GENERAL_NUTRITION = (
+    "No nutrition-related markers are outside their reference range. Keep a balanced diet rich in "
+    "vegetables, fruit, whole grains, lean protein and healthy fats."
+)
+GENERAL_EXERCISE = (
+    "No markers suggest exercise restrictions. Aim for 150 minutes of moderate aerobic activity and "
+    "two strength sessions a week, progressing gradually."
+)
+
+
+def _matching(table, rules):
+    abnormal = table.abnormal()
+    findings = []
+    for key, flag, name in zip(abnormal.key, abnormal.flag, abnormal.name):
+        advice = rules.get((key, int(flag)))
+        if advice:
+            findings.append((name, "high" if flag == HIGH else "low", advice))
+    return findings
+
+
+def nutrition_recommendations(table):
+    """List of (marker name, direction, advice) for nutrition-relevant abnormal markers"""
+    return _matching(table, NUTRITION_RULES)
+
+
+def exercise_recommendations(table):
+    """List of (marker name, direction, advice) for exercise-relevant abnormal markers"""
+    return _matching(table, EXERCISE_RULES)
+
+
+def format_recommendations(title, findings, general):
+    if not findings:
+        return f"{title}\n- {general}"
+    lines = [title]
+    for name, direction, advice in findings:
+        lines.append(f"- {name} is {direction}: {advice}")
+    return "\n".join(lines)
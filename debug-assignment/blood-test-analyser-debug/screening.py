@@ -0,0 +1,120 @@
+## Cheap heuristic check that an upload is a lab report, run while its first pages are parsed
+import os
+import re
+from functools import lru_cache
+
+from normalise import normalise_text
+
+SCREEN_ENABLED = os.getenv("SCREEN_REPORTS", "1") != "0"
+# Pages read before a document with no lab content is rejected
+SCREEN_PAGES = int(os.getenv("SCREEN_PAGES", "2"))
+# Known analytes with a value that accept a document on their own
+SCREEN_MIN_MARKERS = int(os.getenv("SCREEN_MIN_MARKERS", "3"))
+
+# Wording found on lab reports but rarely elsewhere
+_LAB_KEYWORDS = re.compile(
+    r"\b(bio\.? ?ref(erence)?\.? (range|interval)|reference (range|interval|value)s?|test name|"
+    r"specimen|sample (type|collected)|collected (at|on)|lab(oratory)? no|laboratory|pathology|"
+    r"ha?ematology|biochemistry|blood test|serum|plasma|complete blood count|lipid profile|"
+    r"report status)\b",
+    re.I,
+)
+
+
+@lru_cache(maxsize=None)
+def _marker_parser():
+    # markers pulls in numpy, so it is imported on the first screened page
+    try:
+        from markers import ANALYTES, iter_marker_rows
+    except ImportError:
+        # Without numpy the screen falls back to keywords alone
+        return None
+    return lambda text: {row[0] for row in iter_marker_rows(text) if row[0] in ANALYTES}
+
+
+class ReportRejected(Exception):
+    """Raised when the screen decides an upload is not a lab report"""
+
+    def __init__(self, screen):
+        super().__init__("The uploaded document did not pass verification")
+        self.screen = screen
+        self.output = screen.reason
+
+
+class ReportScreen:
+    """Scores pages as they are parsed and decides as early as it can.
+
+    feed() returns True once the document is accepted, False once it is
+    rejected and None while undecided. A document is accepted on
+    SCREEN_MIN_MARKERS known analytes, or on one analyte plus two lab
+    keywords; it is rejected when SCREEN_PAGES pages (or the whole
+    document, if shorter) show neither. Pages still without text (scans
+    that OCR is unavailable for or could not read) are not held against it.
+    """
+
+    def __init__(self, max_pages=None, min_markers=None):
+        self.max_pages = max_pages or SCREEN_PAGES
+        self.min_markers = min_markers or SCREEN_MIN_MARKERS
+        self.pages = 0
+        self.text_pages = 0
+        self.keywords = set()
+        self.markers = set()
+        self.accepted = None
+
+    @property
+    def reason(self):
+        if self.accepted is None:
+            return "undecided"
+        if self.accepted:
+            return f"accepted: {len(self.markers)} lab markers, {len(self.keywords)} lab keywords"
+        return (f"not a blood test report: {len(self.markers)} lab markers and "
+                f"{len(self.keywords)} lab keywords in the first {self.pages} page(s)")
+
+    def feed(self, text):
+        if self.accepted is not None:
+            return self.accepted
+        self.pages += 1
+        text = normalise_text(text or "", blank_lines=True, spaces=True)
+        if text.strip():
+            self.text_pages += 1
+            self.keywords.update(match.group().lower() for match in _LAB_KEYWORDS.finditer(text))
+            if _marker_parser() is not None:
+                self.markers.update(_marker_parser()(text))
+
+        if len(self.markers) >= self.min_markers or (self.markers and len(self.keywords) >= 2):
+            self.accepted = True
+        elif _marker_parser() is None and len(self.keywords) >= 3:
+            self.accepted = True
+        elif self.text_pages >= self.max_pages:
+            self.accepted = False
+        return self.accepted
+
+    def finish(self):
+        """Decide a document that ended before the screen did"""
+        if self.accepted is None and self.text_pages:
+            self.accepted = False
+        return self.accepted
+
+    def to_dict(self):
+        return {
+            "accepted": self.accepted,
+            "pages_screened": self.pages,
+            "markers": sorted(self.markers),
+            "keywords": sorted(self.keywords),
+            "reason": self.reason,
+        }
+
+
+def screen_pages(pages, screen=None):
+    """Yield pages through a screen, raising ReportRejected as soon as it rejects.
+
+    pages may be strings or document objects with a ``page_content``
+    attribute. Pages after the decision pass straight through.
+    """
+    screen = screen or ReportScreen()
+    for page in pages:
+        if screen.accepted is None and screen.feed(getattr(page, "page_content", page)) is False:
+            raise ReportRejected(screen)
+        yield page
+    if screen.finish() is False:
+        raise ReportRejected(screen)
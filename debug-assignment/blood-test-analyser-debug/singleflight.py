@@ -0,0 +1,258 @@
+## Coalescing of concurrent identical analyses (single-flight)
+import os
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from llm_cache import normalise_query
+from metrics import record_single_flight
+
+# Outcomes of SingleFlight.run
+LEADER = "leader"
+COALESCED = "coalesced"
+REMOTE = "remote"
+
+
+def flight_key(report_hash, query, mode, history=None):
+    """Identity of an analysis: the same report, query, pipeline and patient trends give the same answer"""
+    parts = [report_hash, normalise_query(query), mode or "", history or ""]
+    return hashlib.sha256("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task):
+        self.task = task
+        self.waiters = 0
+        self.cancelled = False
+
+
+## Creating the in-process single-flight group
+class SingleFlight:
+    """Runs one analysis per key at a time within this process.
+
+    The first caller for a key starts the work as its own task; callers
+    arriving while it runs await the same task instead of starting another.
+    A waiter that is cancelled (e.g. its client went away) only stops
+    waiting; the work itself is cancelled when its last waiter is.
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.coalesced = 0
+        self.remote = 0
+        self.cancelled = 0
+
+    async def run(self, key, work):
+        """(result, outcome) of work() for key, where outcome is LEADER, COALESCED or REMOTE.
+
+        work is a coroutine function; its result must be JSON-serialisable
+        for the SQLite variant.
+        """
+        if not self.enabled:
+            return await work(), LEADER
+
+        flight = self._flights.get(key)
+        if flight is None or flight.cancelled:
+            flight = _Flight(asyncio.ensure_future(self._lead(key, work)))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _, key=key, flight=flight: self._landed(key, flight))
+            outcome = None
+        else:
+            outcome = COALESCED
+            self._count(COALESCED)
+
+        flight.waiters += 1
+        try:
+            result, lead_outcome = await asyncio.shield(flight.task)
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.cancelled = True
+                flight.task.cancel()
+                self._count("cancelled")
+            raise
+        finally:
+            flight.waiters -= 1
+        return result, outcome or lead_outcome
+
+    async def _lead(self, key, work):
+        return await work(), LEADER
+
+    def _landed(self, key, flight):
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+        if not flight.task.cancelled() and flight.task.exception() is None:
+            self._count(flight.task.result()[1])
+
+    def _count(self, outcome):
+        with self._lock:
+            if outcome == LEADER:
+                self.leaders += 1
+            elif outcome == COALESCED:
+                self.coalesced += 1
+            elif outcome == REMOTE:
+                self.remote += 1
+            else:
+                self.cancelled += 1
+        record_single_flight(outcome)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "backend": "memory",
+                "in_flight": len(self._flights),
+                "leaders": self.leaders,
+                "coalesced": self.coalesced,
+                "remote": self.remote,
+                "cancelled": self.cancelled,
+            }
+
+
+## Creating the cross-worker variant
+class SQLiteSingleFlight(SingleFlight):
+    """Single-flight shared by every worker on the host through a SQLite lease table.
+
+    Duplicates within a process are coalesced as above. The process that
+    leads a key then claims it in SQLite; a worker that finds the key
+    already claimed polls until the owner stores its result and returns
+    that instead. The owner renews its lease while it runs, so a key whose
+    owner died is taken over once the lease lapses, and a key whose owner
+    failed or was cancelled is released for the next worker to run.
+    """
+
+    def __init__(self, path=None, lease_seconds=None, poll_seconds=None, result_ttl=None):
+        super().__init__()
+        self.path = path or os.getenv("SINGLE_FLIGHT_PATH", "data/single_flight.sqlite3")
+        self.lease_seconds = float(lease_seconds or os.getenv("SINGLE_FLIGHT_LEASE", "30"))
+        self.poll_seconds = float(poll_seconds or os.getenv("SINGLE_FLIGHT_POLL", "0.25"))
+        # How long a finished result stays readable by workers that were waiting on it
+        self.result_ttl = float(result_ttl or os.getenv("SINGLE_FLIGHT_RESULT_TTL", "60"))
+        self.owner = uuid.uuid4().hex
+        self._ready = False
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                if not self._ready:
+                    directory = os.path.dirname(self.path)
+                    if directory:
+                        os.makedirs(directory, exist_ok=True)
+                    conn.execute("PRAGMA journal_mode=WAL")
+                    conn.execute(
+                        "CREATE TABLE IF NOT EXISTS flights ("
+                        " key TEXT PRIMARY KEY,"
+                        " owner TEXT NOT NULL,"
+                        " started_at REAL NOT NULL,"
+                        " expires_at REAL NOT NULL,"
+                        " finished_at REAL,"
+                        " result TEXT)"
+                    )
+                    self._ready = True
+                yield conn
+        finally:
+            conn.close()
+
+    def _claim(self, key):
+        """True if this process now owns key; otherwise the running owner's start time"""
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM flights WHERE finished_at < ?", (now - self.result_ttl,))
+            row = conn.execute(
+                "SELECT started_at, expires_at, finished_at FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and row[2] is None and row[1] > now:
+                return row[0]
+            conn.execute(
+                "INSERT OR REPLACE INTO flights (key, owner, started_at, expires_at, finished_at, result) "
+                "VALUES (?, ?, ?, ?, NULL, NULL)",
+                (key, self.owner, now, now + self.lease_seconds),
+            )
+        return True
+
+    def _renew(self, key):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE flights SET expires_at = ? WHERE key = ? AND owner = ? AND finished_at IS NULL",
+                (time.time() + self.lease_seconds, key, self.owner),
+            )
+
+    def _finish(self, key, result):
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE flights SET finished_at = ?, result = ? WHERE key = ? AND owner = ?",
+                (time.time(), json.dumps(result), key, self.owner),
+            )
+
+    def _release(self, key):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM flights WHERE key = ? AND owner = ? AND finished_at IS NULL", (key, self.owner))
+
+    def _poll(self, key, started_at):
+        """("done", result) once the run we waited on finished, ("gone", None) if it was abandoned"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT started_at, expires_at, finished_at, result FROM flights WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None or row[0] != started_at:
+            return "gone", None
+        if row[2] is not None:
+            return "done", json.loads(row[3])
+        if row[1] <= time.time():
+            return "gone", None
+        return "running", None
+
+    async def _lead(self, key, work):
+        while True:
+            claimed = await asyncio.to_thread(self._claim, key)
+            if claimed is True:
+                break
+            # Another worker is running this analysis: wait for its result
+            while True:
+                await asyncio.sleep(self.poll_seconds)
+                state, result = await asyncio.to_thread(self._poll, key, claimed)
+                if state == "done":
+                    return result, REMOTE
+                if state == "gone":
+                    break
+
+        renewing = asyncio.ensure_future(self._keep_lease(key))
+        try:
+            result = await work()
+        except BaseException:
+            renewing.cancel()
+            await asyncio.shield(asyncio.to_thread(self._release, key))
+            raise
+        renewing.cancel()
+        await asyncio.to_thread(self._finish, key, result)
+        return result, LEADER
+
+    async def _keep_lease(self, key):
+        while True:
+            await asyncio.sleep(self.lease_seconds / 3)
+            await asyncio.to_thread(self._renew, key)
+
+    def stats(self):
+        return {**super().stats(), "backend": "sqlite"}
+
+
+def make_single_flight(kind=None):
+    """Build the single-flight group selected by SINGLE_FLIGHT (memory, sqlite or off)"""
+    kind = (kind or os.getenv("SINGLE_FLIGHT", "memory")).lower()
+    if kind == "memory":
+        return SingleFlight()
+    if kind == "sqlite":
+        return SQLiteSingleFlight()
+    if kind == "off":
+        return SingleFlight(enabled=False)
+    raise ValueError(f"Unknown single-flight backend: {kind}")
@@ -0,0 +1,138 @@
+## Streaming of agent tokens and task events to /analyze clients
+import os
+import json
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from metrics import current_agent_role
+
+# Ask the provider clients for token streams (the mock LLM streams its reply word by word)
+STREAM_TOKENS = os.getenv("STREAM_TOKENS", "1") != "0"
+
+STREAM_MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "sse": "text/event-stream",
+}
+
+# Seconds between checks that the client is still connected while no events arrive
+DISCONNECT_POLL_SECONDS = float(os.getenv("STREAM_DISCONNECT_POLL", "1"))
+
+
+class AnalysisCancelled(Exception):
+    """Raised inside a crew run whose streaming client has gone away"""
+
+
+class AnalysisStream:
+    """Events of one crew run, handed from the worker threads to the response on the event loop.
+
+    Cancelling the stream makes the run's next token or stage raise
+    AnalysisCancelled, so a run nobody is reading stops early.
+    """
+
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue()
+        self.cancelled = threading.Event()
+
+    def put(self, event, **data):
+        if self.cancelled.is_set():
+            raise AnalysisCancelled()
+        self.loop.call_soon_threadsafe(self.queue.put_nowait, {"event": event, **data})
+
+    def task_callback(self, output):
+        from jobs import task_output_to_dict
+        self.put("task", **task_output_to_dict(output))
+
+    def cancel(self):
+        self.cancelled.set()
+
+
+_current_stream = contextvars.ContextVar("analysis_stream", default=None)
+
+
+@contextmanager
+def use_stream(stream):
+    """Send the tokens of LLM calls made in this context to stream"""
+    token = _current_stream.set(stream)
+    try:
+        yield stream
+    finally:
+        _current_stream.reset(token)
+
+
+def emit_token(text):
+    """Forward one generated token to the current request's stream, if it has one"""
+    stream = _current_stream.get()
+    if stream is not None and text:
+        stream.put("token", agent=current_agent_role() or None, text=text)
+
+
+def check_cancelled():
+    stream = _current_stream.get()
+    if stream is not None and stream.cancelled.is_set():
+        raise AnalysisCancelled()
+
+
+def token_callbacks():
+    """LangChain callback handlers that forward streamed tokens, or [] without langchain_core"""
+    try:
+        from langchain_core.callbacks import BaseCallbackHandler  # type: ignore
+    except ImportError:
+        return []
+
+    class TokenForwarder(BaseCallbackHandler):
+        # Let AnalysisCancelled abort the generation instead of being logged and ignored
+        raise_error = True
+
+        def on_llm_new_token(self, token, **kwargs):
+            # Gemini chunks may carry a list of content parts
+            emit_token(token if isinstance(token, str) else str(token))
+
+    return [TokenForwarder()]
+
+
+## Encoding the response
+def encode(fmt, event):
+    if fmt == "sse":
+        data = {key: value for key, value in event.items() if key != "event"}
+        return f"event: {event['event']}\ndata: {json.dumps(data)}\n\n"
+    return json.dumps(event) + "\n"
+
+
+async def stream_events(fmt, stream, work, on_error, is_disconnected=None):
+    """Encoded events of the coroutine work as they happen, then the event it returns.
+
+    on_error(exception) gives the HTTPException for a failure, sent as an
+    "error" event since the status line has already gone out. If the client
+    disconnects (or the response is closed), the run is cancelled.
+    """
+    task = asyncio.ensure_future(work)
+    getter = None
+    try:
+        while not task.done():
+            getter = asyncio.ensure_future(stream.queue.get())
+            done, _ = await asyncio.wait(
+                {getter, task}, timeout=DISCONNECT_POLL_SECONDS, return_when=asyncio.FIRST_COMPLETED
+            )
+            if getter in done:
+                yield encode(fmt, getter.result())
+                continue
+            getter.cancel()
+            if is_disconnected is not None and not task.done() and await is_disconnected():
+                return
+        while not stream.queue.empty():
+            yield encode(fmt, stream.queue.get_nowait())
+        try:
+            final = task.result()
+        except Exception as e:
+            error = on_error(e)
+            final = {"event": "error", "status_code": error.status_code, "detail": error.detail}
+        yield encode(fmt, final)
+    finally:
+        # Closing the response can interrupt the wait above, leaving a queue read behind
+        if getter is not None:
+            getter.cancel()
+        stream.cancel()
+        task.cancel()
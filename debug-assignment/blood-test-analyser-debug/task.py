@@ -1,55 +1,83 @@
 ## Importing libraries and files
-try:
-    from crewai import Task  # type: ignore
-except ImportError:
-    print("Warning: crewai package not available. Please install it with: pip install crewai")
-    # Create a mock Task class for development
-    class Task:
-        def __init__(self, **kwargs):
-            self.description = kwargs.get('description', 'Mock Task')
-            self.expected_output = kwargs.get('expected_output', 'Mock Output')
-            self.agent = kwargs.get('agent', None)
-            self.tools = kwargs.get('tools', [])
-            self.async_execution = kwargs.get('async_execution', False)
-            print(f"Mock Task created: {self.description[:50]}...")
-
-try:
-    from agents import doctor, verifier, nutritionist, exercise_specialist
-except ImportError:
-    print("Warning: agents module not available. Creating mock agents.")
-    # Create mock agents
-    class MockAgent:
-        def __init__(self, name):
-            self.name = name
-    doctor = MockAgent("doctor")
-    verifier = MockAgent("verifier")
-    nutritionist = MockAgent("nutritionist")
-    exercise_specialist = MockAgent("exercise_specialist")
-
-try:
-    from tools import blood_test_tool, nutrition_tool, exercise_tool
-except ImportError:
-    print("Warning: tools module not available. Creating mock tools.")
-    # Create mock tools
-    class MockTool:
-        def __init__(self, name):
-            self.name = name
-        def __call__(self, *args, **kwargs):
-            return f"Mock {self.name} tool called"
-        def __getattr__(self, name):
-            return self
-    
-    blood_test_tool = MockTool("blood_test")
-    nutrition_tool = MockTool("nutrition")
-    exercise_tool = MockTool("exercise")
-
-## Creating a task to help solve user's query - Fixed to be professional
-help_patients = Task(
-    description="Analyze the blood test report and provide comprehensive medical insights for the user's query: {query}. "
-    "Review the blood test data carefully, identify any abnormalities, and provide evidence-based recommendations. "
-    "Focus on the specific concerns raised in the user's query while providing a complete health assessment.",
-
-    expected_output="""Provide a comprehensive blood test analysis including:
+# Tasks are built on first use, together with the agents they are assigned to
+import threading
+
+TASK_NAMES = ("help_patients", "nutrition_analysis", "exercise_planning", "verification")
+
+_lock = threading.RLock()
+_tasks = None
+
+
+def _task_class():
+    from agents import LLM_PROVIDER
+    try:
+        if LLM_PROVIDER == "mock":
+            raise ImportError("mock LLM mode")
+        from crewai import Task  # type: ignore
+    except ImportError:
+        if LLM_PROVIDER != "mock":
+            print("Warning: crewai package not available. Please install it with: pip install crewai")
+        # Create a mock Task class for development
+        class Task:
+            def __init__(self, **kwargs):
+                self.description = kwargs.get('description', 'Mock Task')
+                self.expected_output = kwargs.get('expected_output', 'Mock Output')
+                self.agent = kwargs.get('agent', None)
+                self.tools = kwargs.get('tools', [])
+                self.async_execution = kwargs.get('async_execution', False)
+                self.context = kwargs.get('context', None)
+                print(f"Mock Task created: {self.description[:50]}...")
+    return Task
+
+
+def _agents():
+    try:
+        from agents import get_agents
+        return get_agents()
+    except ImportError:
+        print("Warning: agents module not available. Creating mock agents.")
+        # Create mock agents
+        class MockAgent:
+            def __init__(self, name):
+                self.name = name
+        return {name: MockAgent(name) for name in ("doctor", "verifier", "nutritionist", "exercise_specialist")}
+
+
+def _tools():
+    try:
+        from tools import blood_test_tool, nutrition_tool, exercise_tool
+    except ImportError:
+        print("Warning: tools module not available. Creating mock tools.")
+        # Create mock tools
+        class MockTool:
+            def __init__(self, name):
+                self.name = name
+            def __call__(self, *args, **kwargs):
+                return f"Mock {self.name} tool called"
+            def __getattr__(self, name):
+                return self
+
+        blood_test_tool = MockTool("blood_test")
+        nutrition_tool = MockTool("nutrition")
+        exercise_tool = MockTool("exercise")
+    return blood_test_tool, nutrition_tool, exercise_tool
+
+
+def build_tasks(agents=None):
+    """Create the four tasks, returned by name"""
+    Task = _task_class()
+    agents = agents or _agents()
+    doctor, verifier = agents["doctor"], agents["verifier"]
+    nutritionist, exercise_specialist = agents["nutritionist"], agents["exercise_specialist"]
+    blood_test_tool, nutrition_tool, exercise_tool = _tools()
+
+    ## Creating a task to help solve user's query - Fixed to be professional
+    help_patients = Task(
+        description="Analyze the blood test report and provide comprehensive medical insights for the user's query: {query}. "
+        "Review the blood test data carefully, identify any abnormalities, and provide evidence-based recommendations. "
+        "Focus on the specific concerns raised in the user's query while providing a complete health assessment.",
+
+        expected_output="""Provide a comprehensive blood test analysis including:
 - Summary of key findings and normal/abnormal values
 - Interpretation of results in relation to the user's query
 - Evidence-based medical recommendations
@@ -57,17 +85,17 @@ help_patients = Task(
 - General health insights and lifestyle recommendations
 - Clear, professional language suitable for patient communication""",
 
-    agent=doctor,
-    tools=[blood_test_tool.read_data_tool],
-    async_execution=False,
-)
+        agent=doctor,
+        tools=[blood_test_tool.read_data_tool, blood_test_tool.read_markers_tool],
+        async_execution=False,
+    )
 
-## Creating a nutrition analysis task - Fixed to be professional
-nutrition_analysis = Task(
-    description="Analyze the blood test results and provide evidence-based nutritional recommendations for: {query}. "
-    "Focus on how specific blood markers relate to dietary needs and provide practical nutrition advice.",
+    ## Creating a nutrition analysis task - Fixed to be professional
+    nutrition_analysis = Task(
+        description="Analyze the blood test results and provide evidence-based nutritional recommendations for: {query}. "
+        "Focus on how specific blood markers relate to dietary needs and provide practical nutrition advice.",
 
-    expected_output="""Provide detailed nutrition recommendations including:
+        expected_output="""Provide detailed nutrition recommendations including:
 - Analysis of blood markers relevant to nutrition (glucose, cholesterol, vitamins, etc.)
 - Specific dietary recommendations based on test results
 - Foods to include or avoid based on blood values
@@ -75,17 +103,17 @@ nutrition_analysis = Task(
 - Meal planning suggestions
 - Evidence-based advice with scientific backing""",
 
-    agent=nutritionist,
-    tools=[blood_test_tool.read_data_tool, nutrition_tool.analyze_nutrition_tool],
-    async_execution=False,
-)
+        agent=nutritionist,
+        tools=[blood_test_tool.read_markers_tool, nutrition_tool.analyze_nutrition_tool],
+        async_execution=False,
+    )
 
-## Creating an exercise planning task - Fixed to be professional
-exercise_planning = Task(
-    description="Create a safe and effective exercise plan based on the blood test results for: {query}. "
-    "Consider the individual's health status and design appropriate physical activity recommendations.",
+    ## Creating an exercise planning task - Fixed to be professional
+    exercise_planning = Task(
+        description="Create a safe and effective exercise plan based on the blood test results for: {query}. "
+        "Consider the individual's health status and design appropriate physical activity recommendations.",
 
-    expected_output="""Create a comprehensive exercise plan including:
+        expected_output="""Create a comprehensive exercise plan including:
 - Assessment of fitness level based on blood markers
 - Safe exercise recommendations appropriate for health status
 - Specific workout routines and intensity guidelines
@@ -94,17 +122,18 @@ exercise_planning = Task(
 - Progressive training approach
 - Monitoring and adjustment guidelines""",
 
-    agent=exercise_specialist,
-    tools=[blood_test_tool.read_data_tool, exercise_tool.create_exercise_plan_tool],
-    async_execution=False,
-)
+        agent=exercise_specialist,
+        tools=[blood_test_tool.read_markers_tool, exercise_tool.create_exercise_plan_tool],
+        async_execution=False,
+    )
 
-## Creating a verification task - Fixed to be professional
-verification = Task(
-    description="Verify that the uploaded document is a valid blood test report and contains the necessary information "
-    "for medical analysis. Check for completeness and authenticity of the medical data.",
+    ## Creating a verification task - Fixed to be professional
+    verification = Task(
+        description="Verify that the uploaded document is a valid blood test report and contains the necessary information "
+        "for medical analysis. Check for completeness and authenticity of the medical data.",
 
-    expected_output="""Provide verification results including:
+        expected_output="""Start with a line that is exactly "VERDICT: VALID" if the document is a blood test report
+that can be analysed, or exactly "VERDICT: INVALID" if it is not. Then provide verification results including:
 - Confirmation of document type (blood test report)
 - Assessment of report completeness
 - Identification of key blood markers present
@@ -112,7 +141,30 @@ verification = Task(
 - Any missing or unclear information
 - Overall assessment of report quality for analysis""",
 
-    agent=verifier,
-    tools=[blood_test_tool.read_data_tool],
-    async_execution=False
-)
\ No newline at end of file
+        agent=verifier,
+        tools=[blood_test_tool.read_data_tool],
+        async_execution=False
+    )
+
+    return {
+        "help_patients": help_patients,
+        "nutrition_analysis": nutrition_analysis,
+        "exercise_planning": exercise_planning,
+        "verification": verification,
+    }
+
+
+def get_tasks():
+    """The shared tasks, built on first call"""
+    global _tasks
+    with _lock:
+        if _tasks is None:
+            _tasks = build_tasks()
+        return _tasks
+
+
+def __getattr__(name):
+    # Keeps `from task import help_patients` working while deferring construction
+    if name in TASK_NAMES:
+        return get_tasks()[name]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Run the app modules offline, without the provider SDKs or warm-up traffic
+os.environ.setdefault("LLM_PROVIDER", "mock")
+os.environ.setdefault("WARMUP", "off")
+os.environ.setdefault("LLM_CACHE", "0")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,103 @@
+import os
+import asyncio
+from concurrent.futures import Future
+
+import crew
+from batch import BatchRunner, process_report
+from crew import VerificationFailed
+from rate_limit import BATCH
+
+REPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "blood_test_report.pdf")
+
+
+class FakeRunner(BatchRunner):
+    """BatchRunner whose submissions return futures the test resolves by hand"""
+
+    def __init__(self, done=()):
+        super().__init__(workers=1)
+        self.done = set(done)
+        self.futures = []
+
+    def submit(self, name, source, query=None, run_agents=False):
+        future = Future()
+        if name in self.done:
+            future.set_result({"file": name, "status": "success", "error": None, "timings": {}})
+        self.futures.append(future)
+        return future
+
+
+def reports(count, read):
+    for index in range(count):
+        read.append(index)
+        yield f"r{index}.pdf", b"%PDF-"
+
+
+def test_iter_results_reads_at_most_window_reports_ahead():
+    read = []
+    runner = FakeRunner(done={f"r{index}.pdf" for index in range(6)})
+    results = runner.iter_results(reports(6, read), window=2)
+    assert next(results)["file"] in ("r0.pdf", "r1.pdf")
+    assert len(read) == 2
+    assert len(list(results)) == 5
+
+
+def test_iter_results_cancels_queued_reports_when_the_caller_stops():
+    runner = FakeRunner(done={"r0.pdf"})
+    results = runner.iter_results(reports(4, []), window=4)
+    assert next(results)["file"] == "r0.pdf"
+    results.close()
+    assert all(future.cancelled() for future in runner.futures[1:])
+
+
+def test_errors_in_the_input_become_error_records():
+    runner = FakeRunner()
+    records = list(runner.iter_results([("big.pdf", ValueError("too large"))]))
+    assert records == [{"file": "big.pdf", "status": "error", "error": "too large", "timings": {}}]
+
+
+def test_aiter_results_bounds_and_cancels():
+    read = []
+    runner = FakeRunner(done={"r0.pdf"})
+
+    async def items():
+        for item in reports(5, read):
+            yield item
+
+    async def scenario():
+        results = runner.aiter_results(items(), window=3)
+        first = await anext(results)
+        await results.aclose()
+        return first
+
+    assert asyncio.run(scenario())["file"] == "r0.pdf"
+    assert len(read) == 3
+    assert all(future.cancelled() for future in runner.futures[1:])
+
+
+def test_agents_run_through_run_crew_at_batch_priority(monkeypatch):
+    calls = []
+    original = crew.run_crew
+
+    def recording_run_crew(query, **kwargs):
+        calls.append(kwargs)
+        return original(query, **kwargs)
+
+    monkeypatch.setattr(crew, "run_crew", recording_run_crew)
+    record = process_report("report.pdf", REPORT, run_agents=True)
+    assert record["status"] == "success"
+    assert record["analysis"]
+    assert record["report_tokens"]["sent_tokens"] > 0
+    assert calls[0]["priority"] == BATCH
+    assert calls[0]["flow"] == record["content_hash"]
+
+
+def test_reports_that_fail_verification_are_rejected(monkeypatch):
+    def rejecting_run_crew(query, **kwargs):
+        raise VerificationFailed("VERDICT: INVALID\nNot a blood test report.")
+
+    monkeypatch.setattr(crew, "run_crew", rejecting_run_crew)
+    record = process_report("report.pdf", REPORT, run_agents=True)
+    assert record["status"] == "rejected"
+    assert "VERDICT: INVALID" in record["error"]
+    assert "analysis" not in record
+    assert record["markers"]
@@ -0,0 +1,73 @@
+import pytest
+
+from agents import AGENT_ROLES
+from compaction import (
+    PROFILES, count_tokens, fit_to_budget, markers_for_agent, strip_boilerplate, text_for_agent, track_compaction,
+)
+from document import ParsedReport, PageDocument, content_hash
+
+
+def make_report(pages):
+    text = "\n".join(pages)
+    return ParsedReport(content_hash(text.encode("utf-8")), [PageDocument(page, i) for i, page in enumerate(pages)], text)
+
+
+def test_fit_to_budget_keeps_whole_lines_within_budget():
+    lines = [f"line {i} " + "word " * 20 for i in range(50)]
+    text = fit_to_budget(lines, 200)
+    kept = text.splitlines()
+    assert kept[-1].endswith("more lines omitted to fit the 200-token budget]")
+    assert sum(count_tokens(line) + 1 for line in kept[:-1]) <= 200
+    assert kept[:-1] == lines[:len(kept) - 1]
+    assert fit_to_budget(lines[:2], 200) == "\n".join(lines[:2])
+
+
+def test_strip_boilerplate_drops_repeated_furniture():
+    header = "City Diagnostics Lab, 12 Main Street"
+    pages = [
+        f"{header}\nPage 1 of 3\nHemoglobin 13.5 g/dL 13.0 - 17.0\n-----",
+        f"{header}\nPage 2 of 3\nTSH   2.1 uIU/mL 0.4 - 4.0",
+        f"{header}\nPage 3 of 3\nGlucose 95 mg/dL 70 - 100\n*** End of Report ***\nDr. Signature",
+    ]
+    assert strip_boilerplate(pages).splitlines() == [
+        header,
+        "Hemoglobin 13.5 g/dL 13.0 - 17.0",
+        "TSH 2.1 uIU/mL 0.4 - 4.0",
+        "Glucose 95 mg/dL 70 - 100",
+    ]
+
+
+def test_single_page_lines_are_not_treated_as_repeated():
+    assert strip_boilerplate(["A\nA\nB"]) == "A\nA\nB\n"
+
+
+def test_each_agent_gets_its_text_budget():
+    report = make_report([f"Result line {i}: " + "value " * 30 for i in range(400)])
+    with track_compaction() as stats:
+        doctor = text_for_agent(report, AGENT_ROLES["doctor"])
+        verifier = text_for_agent(report, AGENT_ROLES["verifier"])
+    assert count_tokens(doctor) <= PROFILES["doctor"]["text_budget"] + 20
+    assert count_tokens(verifier) <= PROFILES["verifier"]["text_budget"] + 20
+    assert count_tokens(verifier) < count_tokens(doctor) < count_tokens(report.text)
+    summary = stats.to_dict()
+    assert set(summary["by_agent"]) == {"doctor", "verifier"}
+    assert summary["saved_tokens"] == summary["original_tokens"] - summary["sent_tokens"] > 0
+
+
+def test_specialists_see_their_panels_and_other_abnormal_results():
+    pytest.importorskip("numpy")
+    report = make_report([
+        "Hemoglobin 11.2 g/dL 13.0 - 17.0\n"
+        "Glucose, Fasting 95 mg/dL 70 - 100\n"
+        "TSH 5.6 uIU/mL 0.4 - 4.0\n"
+        "Ferritin 150 ng/mL 30 - 400\n"
+    ])
+    nutrition = markers_for_agent(report, AGENT_ROLES["nutritionist"]).splitlines()
+    assert nutrition[0] == "Abnormal results outside this specialty:"
+    assert {line.split(":")[0] for line in nutrition[1:3]} == {"Hemoglobin", "TSH"}
+    assert nutrition[3] == "Other results for this specialty:"
+    assert [line.split(":")[0] for line in nutrition[4:]] == ["Fasting Glucose", "Ferritin"]
+
+    doctor = markers_for_agent(report, AGENT_ROLES["doctor"]).splitlines()
+    assert [line.split(":")[0] for line in doctor[:2]] == ["Hemoglobin", "TSH"]
+    assert len(doctor) == 4
@@ -0,0 +1,140 @@
+import os
+
+import pytest
+
+import crew
+from crew import run_crew, verification_verdict
+from document import load_report
+from llm_cache import ResponseCache
+
+REPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "blood_test_report.pdf")
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = ResponseCache(enabled=True, path="")
+    monkeypatch.setattr(crew, "llm_cache", cache)
+    return cache
+
+
+def test_sequential_cache_hit_has_the_same_shape_as_a_run(cache):
+    report = load_report(REPORT)
+    miss = run_crew("Summarise my report", report=report, mode="sequential")
+    seen = []
+    hit = run_crew("Summarise my report", report=report, mode="sequential", task_callback=seen.append)
+
+    assert cache.memory_hits == 1
+    assert str(hit) == str(miss)
+    assert [output.raw for output in hit.tasks_output] == [output.raw for output in miss.tasks_output]
+    assert hit.compaction.keys() == miss.compaction.keys()
+    # Task events still reach streaming clients and jobs on a hit
+    assert len(seen) == len(hit.tasks_output) == 4
+
+
+def test_unreadable_cache_entry_is_a_miss(cache):
+    report = load_report(REPORT)
+    miss = run_crew("Summarise my report", report=report, mode="sequential")
+    for key in list(cache._memory):
+        created, version, _ = cache._memory[key]
+        cache._memory[key] = (created, version, "plain text from an older release")
+    again = run_crew("Summarise my report", report=report, mode="sequential")
+    assert len(again.tasks_output) == 4 and str(again) == str(miss)
+
+
+@pytest.mark.parametrize("text, verdict", [
+    ("VERDICT: INVALID\nThis is not a blood test report.", "INVALID"),
+    ("**VERDICT: valid**\nAll panels present.", "VALID"),
+    ("\n  VERDICT:INVALID  \n", "INVALID"),
+    # Free text is never interpreted, however it is phrased
+    ("Verification failed to find any issues. VERDICT: INVALID", None),
+    ("This is not a valid blood test report", None),
+    ("", None),
+])
+def test_verification_verdict_reads_only_the_first_line(text, verdict):
+    assert verification_verdict(text) == verdict
+
+
+def test_pooled_crews_carry_a_single_task_crew_per_task():
+    pool = crew.CrewPool(size=1)
+    with pool.checkout() as pooled:
+        assert set(pooled.task_crews) == set(crew.TASK_NAMES)
+        for name, task in zip(crew.TASK_NAMES, pooled.tasks):
+            assert pooled.task_crews[name].tasks == [task]
+        pooled.task_crews["verification"].task_callback = print
+    with pool.checkout() as again:
+        assert again is pooled
+        assert all(single.task_callback is None for single in again.task_crews.values())
+
+
+def test_sequential_run_does_not_set_attributes_on_a_pydantic_crew_output(monkeypatch):
+    pydantic = pytest.importorskip("pydantic")
+
+    class TaskOutput(pydantic.BaseModel):
+        description: str
+        raw: str
+
+    class CrewOutput(pydantic.BaseModel):
+        """Stand-in for crewai's CrewOutput, which rejects unknown attributes"""
+        raw: str
+        tasks_output: list[TaskOutput]
+
+    class PydanticCrew(crew.MockCrew):
+        def kickoff(self, inputs):
+            output = super().kickoff(inputs)
+            return CrewOutput(
+                raw=output.raw,
+                tasks_output=[TaskOutput(description=t.description, raw=t.raw) for t in output.tasks_output],
+            )
+
+    def factory():
+        parts = crew.crew_parts()
+        return PydanticCrew(agents=parts.agents, tasks=parts.tasks, process=parts.process.sequential)
+
+    monkeypatch.setattr(crew, "crew_pool", crew.CrewPool(size=1, factory=factory))
+    with pytest.raises(ValueError):
+        CrewOutput(raw="", tasks_output=[]).compaction = {}
+
+    result = run_crew("Summarise my report", report=load_report(REPORT), mode="sequential")
+    assert len(result.tasks_output) == 4
+    assert str(result) == result.tasks_output[-1].raw
+    assert result.compaction["sent_tokens"] > 0
+
+
+def test_pooled_crews_do_not_share_task_objects():
+    pool = crew.CrewPool(size=2)
+    shared = crew.crew_parts().tasks
+    with pool.checkout() as first, pool.checkout() as second:
+        assert first is not second
+        for mine, theirs, original in zip(first.tasks, second.tasks, shared):
+            assert mine is not theirs and mine is not original
+        # Each single-task crew runs the pooled crew's own task
+        assert first.task_crews["help_patients"].tasks[0] is first.tasks[1]
+
+        snapshots = []
+
+        def record_context(output):
+            # Called after each task, while later tasks still hold the earlier ones as context
+            snapshots.append(([task.context for task in first.tasks], [task.context for task in second.tasks]))
+
+        crew.run_pipeline(first, "full", {"query": "Summarise", "file_path": "report"}, record_context)
+
+    assert len(snapshots) == 4
+    assert any(any(mine) for mine, _ in snapshots)
+    assert all(context is None for _, theirs in snapshots for context in theirs)
+    # Contexts are put back once the run ends
+    assert all(task.context is None for task in first.tasks)
+
+
+def test_checkout_reuses_idle_crews_and_builds_overflow():
+    pool = crew.CrewPool(size=1)
+    pool.warm()
+    with pool.checkout(task_callback=print) as first:
+        assert first.crew.task_callback is print
+        with pool.checkout() as extra:
+            assert extra is not first
+    # The crew checked in last is handed out first; the pool keeps only size idle crews
+    with pool.checkout() as again:
+        assert again is extra
+        assert again.crew.task_callback is None
+    stats = pool.stats()
+    assert (stats["created"], stats["checkouts"], stats["overflow"], stats["idle"]) == (2, 3, 1, 1)
@@ -0,0 +1,71 @@
+import os
+import time
+
+import pytest
+
+import document
+from document import DocumentCache, ParsedReport, load_report, load_uploaded_report
+from uploads import SpooledUpload
+
+REPORT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "blood_test_report.pdf")
+
+
+def report(digest, size=10):
+    return ParsedReport(digest, [], "x" * size)
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = DocumentCache(max_entries=8, max_bytes=10_000_000, ttl_seconds=60)
+    monkeypatch.setattr(document, "document_cache", cache)
+    return cache
+
+
+def test_cache_counts_hits_and_misses():
+    cache = DocumentCache(max_entries=2, max_bytes=1000, ttl_seconds=60)
+    assert cache.get("a") is None
+    cache.put(report("a"))
+    assert cache.get("a").content_hash == "a"
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"], stats["bytes"]) == (1, 1, 1, 10)
+
+
+def test_cache_evicts_least_recently_used_by_count_and_size():
+    cache = DocumentCache(max_entries=2, max_bytes=25, ttl_seconds=60)
+    cache.put(report("a"))
+    cache.put(report("b"))
+    cache.get("a")
+    cache.put(report("c"))
+    assert cache.get("b") is None and cache.get("a") is not None
+    cache.put(report("d", 20))
+    assert cache.stats()["entries"] == 1 and cache.stats()["evictions"] == 3
+    # A report larger than the whole cache is never stored
+    cache.put(report("huge", 100))
+    assert cache.get("huge") is None
+
+
+def test_expired_reports_are_misses():
+    cache = DocumentCache(max_entries=2, max_bytes=1000, ttl_seconds=60)
+    cache.put(report("a"))
+    cache._entries["a"] = (time.time() - 120, cache._entries["a"][1])
+    assert cache.get("a") is None
+    assert cache.stats()["entries"] == 0 and cache.stats()["bytes"] == 0
+
+
+def test_same_content_is_parsed_once(cache, monkeypatch):
+    parses = []
+    parse_report = document.parse_report
+
+    def counting_parse(path, digest, screen=None):
+        parses.append(path)
+        return parse_report(path, digest, screen)
+
+    monkeypatch.setattr(document, "parse_report", counting_parse)
+    first = load_report(REPORT)
+    assert load_report(REPORT) is first
+    assert len(parses) == 1
+
+    # An upload of the same bytes is served from the same parse
+    upload = SpooledUpload("copy.pdf", None, os.path.getsize(REPORT), first.content_hash)
+    assert load_uploaded_report(upload) is first
+    assert cache.stats()["hits"] == 2
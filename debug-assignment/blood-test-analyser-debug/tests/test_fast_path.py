@@ -0,0 +1,61 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from document import ParsedReport, content_hash
+from fast_path import COMPLEX, MARKER_STATUS, SUMMARY, answer, classify, route
+
+REPORT_TEXT = (
+    "Hemoglobin 11.2 g/dL 13.0 - 17.0\n"
+    "Glucose, Fasting 95 mg/dL 70 - 100\n"
+    "TSH 2.1 uIU/mL 0.4 - 4.0\n"
+)
+
+
+def make_report(text=REPORT_TEXT):
+    return ParsedReport(content_hash(text.encode("utf-8")), [], text)
+
+
+@pytest.mark.parametrize("query", ["", "Summarise my Blood Test Report", "Please give me a quick overview"])
+def test_summary_requests(query):
+    assert classify(query) == (SUMMARY, [])
+
+
+@pytest.mark.parametrize("query, keys", [
+    ("Is my hemoglobin normal?", ["hemoglobin"]),
+    ("what is my TSH and glucose", ["tsh", "glucose_fasting"]),
+    ("hemoglobin", ["hemoglobin"]),
+])
+def test_marker_lookups(query, keys):
+    assert classify(query) == (MARKER_STATUS, keys)
+
+
+@pytest.mark.parametrize("query", [
+    "Why is my hemoglobin low?",
+    "What foods lower cholesterol",
+    "Should I take iron supplements?",
+    "tell me a joke",
+])
+def test_anything_else_goes_to_the_crew(query):
+    assert classify(query) == (COMPLEX, [])
+
+
+def test_route_uses_rules_only_when_markers_were_extracted():
+    report = make_report()
+    assert route("auto", "Is my TSH normal?", report) == "rules"
+    assert route("auto", "Why is my hemoglobin low?", report) is None
+    assert route("auto", "Summarise my report", make_report("No lab values here")) is None
+    assert route("rules", "Why is my hemoglobin low?", report) == "rules"
+    assert route("fast", "Summarise my report", report) == "fast"
+
+
+def test_answers_come_from_the_marker_table():
+    report = make_report()
+    status = answer("Is my hemoglobin normal?", report)
+    assert status.intent == MARKER_STATUS
+    assert "Hemoglobin is 11.2 g/dL, below the reference range (13-17 g/dL)." in str(status)
+
+    summary = answer("Summarise my report", report, history="Hemoglobin: 14 -> 11.2 g/dL")
+    assert "1 result(s) are outside the reference range" in str(summary)
+    assert "Trends from previous reports:" in str(summary)
+    assert summary.tasks_output == []
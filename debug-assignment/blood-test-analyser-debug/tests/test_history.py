@@ -0,0 +1,114 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+from document import ParsedReport, content_hash
+from history import AmbiguousDate, HistoryStore, compute_trends, report_date
+
+
+def make_report(hemoglobin, glucose, date):
+    text = (
+        f"Collected: {date}\n"
+        f"Hemoglobin {hemoglobin} g/dL 13.0 - 17.0\n"
+        f"Glucose, Fasting {glucose} mg/dL 70 - 100\n"
+    )
+    return ParsedReport(content_hash(text.encode("utf-8")), [], text)
+
+
+def test_report_date_reads_day_month_year():
+    assert report_date("Sample collected 05/03/2024 at 9am") == "2024-03-05"
+    assert report_date("No date here") is None
+
+
+def test_compute_trends_groups_by_marker():
+    trends = compute_trends(
+        ["glucose", "glucose", "glucose", "tsh"],
+        ["2023-01-01", "2024-01-01", "2025-01-01", "2024-06-01"],
+        [90.0, 100.0, 110.0, 2.0],
+    )
+    glucose = trends["glucose"]
+    assert glucose["points"] == 3
+    assert (glucose["first"], glucose["last"]) == (90.0, 110.0)
+    assert glucose["change"] == 20.0
+    assert glucose["last_change"] == 10.0
+    assert glucose["direction"] == "rising"
+    assert glucose["slope_per_year"] == pytest.approx(10.0, rel=0.01)
+
+    tsh = trends["tsh"]
+    assert tsh["points"] == 1
+    assert tsh["direction"] == "stable"
+    assert tsh["slope_per_year"] is None
+
+
+def test_small_changes_are_stable():
+    trends = compute_trends(["hb", "hb"], ["2024-01-01", "2024-06-01"], [14.0, 14.2])
+    assert trends["hb"]["direction"] == "stable"
+    assert compute_trends([], [], []) == {}
+
+
+def test_store_records_and_summarises(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    assert store.record("p1", make_report(14.0, 90, "01/01/2024")) == 2
+    assert store.record("p1", make_report(11.5, 118, "01/01/2025")) == 2
+
+    assert [r["collected_on"] for r in store.reports("p1")] == ["2024-01-01", "2025-01-01"]
+    series = store.series("p1", "hemoglobin")
+    assert [point["change"] for point in series] == [None, -2.5]
+
+    summary = store.summary("p1")
+    assert "Hemoglobin: 14 -> 11.5 g/dL over 2 reports" in summary
+    assert "latest LOW" in summary
+    assert store.summary("someone-else") == ""
+
+    assert store.delete("p1") == 4
+    assert store.reports("p1") == []
+
+
+def test_summary_of_a_new_report_does_not_store_it(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.record("p1", make_report(14.0, 90, "01/01/2024"))
+
+    summary = store.summary("p1", report=make_report(12.0, 95, "01/01/2025"))
+    assert "Hemoglobin: 14 -> 12 g/dL over 2 reports" in summary
+    assert len(store.reports("p1")) == 1
+    assert store.stats()["marker_values"] == 2
+
+
+@pytest.mark.parametrize("order, expected", [("dmy", "2024-03-05"), ("mdy", "2024-05-03")])
+def test_report_date_order_is_configurable(order, expected):
+    assert report_date("Collected 05/03/2024", order) == expected
+    assert report_date("Collected 2024-03-05", order) == "2024-03-05"
+
+
+def test_strict_dates_reject_ambiguous_day_and_month():
+    with pytest.raises(AmbiguousDate):
+        report_date("Collected 05/03/2024", "strict")
+    assert report_date("Collected 25/03/2024", "strict") == "2024-03-25"
+    assert report_date("Collected 03/03/2024", "strict") == "2024-03-03"
+
+
+def test_summary_replaces_a_stored_copy_of_the_same_report(tmp_path):
+    store = HistoryStore(str(tmp_path / "history.sqlite3"))
+    store.record("p1", make_report(14.0, 90, "01/01/2024"))
+    report = make_report(12.0, 95, "01/01/2025")
+    store.record("p1", report)
+
+    summary = store.summary("p1", report=report, collected_on="2025-01-01")
+    assert "over 2 reports" in summary and "over 3 reports" not in summary
+
+
+def test_summary_does_not_take_the_write_lock(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "history.sqlite3")
+    store = HistoryStore(path)
+    store.record("p1", make_report(14.0, 90, "01/01/2024"))
+    # Another worker holds the write lock while this one reads trends
+    writer = sqlite3.connect(path, isolation_level=None)
+    writer.execute("BEGIN IMMEDIATE")
+    try:
+        summary = store.summary("p1", report=make_report(12.0, 95, "01/01/2025"))
+    finally:
+        writer.execute("ROLLBACK")
+        writer.close()
+    assert "Hemoglobin: 14 -> 12 g/dL over 2 reports" in summary
@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("httpx")
+
+from fake_llm import FakeLLMServer
+from http_clients import HTTPClients
+
+BODY = {"model": "fake-model", "messages": [{"role": "user", "content": "Summarise my report"}]}
+
+
+@pytest.fixture
+def server():
+    with FakeLLMServer(latency=0) as server:
+        yield server
+
+
+def test_warmed_pool_is_reused(server):
+    clients = HTTPClients()
+    warmed = clients.warm({"llm": server.base_url}, connections=2)
+    assert warmed["llm"]["connections"] == 2 and warmed["llm"]["error"] is None
+
+    client = clients.client("llm", timeout=10)
+    for _ in range(10):
+        client.post(f"{server.base_url}/chat/completions", json=BODY).raise_for_status()
+    clients.close()
+
+    stats = clients.stats.to_dict()["llm"]
+    # Only the warm-up opened connections; every completion reused one
+    assert stats["requests"] == 12
+    assert stats["new_connections"] == 2
+    assert stats["reused"] == 10
+
+
+def test_clients_share_one_pool(server):
+    clients = HTTPClients()
+    for _ in range(5):
+        # A new client per call still goes through the service's shared transport
+        clients.client("llm", timeout=10).post(f"{server.base_url}/chat/completions", json=BODY).raise_for_status()
+    clients.close()
+    assert clients.stats.to_dict()["llm"]["new_connections"] == 1
+
+
+def test_async_pool_is_warmed_and_reused(server):
+    clients = HTTPClients()
+
+    async def run():
+        await clients.awarm({"llm": server.base_url}, connections=2)
+        client = clients.async_client("llm", timeout=10)
+        for _ in range(5):
+            (await client.post(f"{server.base_url}/chat/completions", json=BODY)).raise_for_status()
+        await clients.aclose()
+
+    asyncio.run(run())
+    assert clients.warmed["llm:async"]["connections"] == 2
+    stats = clients.stats.to_dict()["llm"]
+    assert stats["requests"] == 7
+    assert stats["new_connections"] == 2
+    assert clients._async_transports == {}
+
+
+def test_warm_up_failures_are_reported_not_raised():
+    clients = HTTPClients()
+    warmed = clients.warm({"llm": "http://127.0.0.1:9"}, connections=1)
+    assert warmed["llm"]["connections"] == 0
+    assert warmed["llm"]["error"]
@@ -0,0 +1,26 @@
+import pytest
+
+from jobs import JobStore, InMemoryJobStore, SQLiteJobStore, new_job, SUCCEEDED
+
+
+def test_job_store_is_abstract():
+    with pytest.raises(TypeError):
+        JobStore()
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryJobStore()
+    return SQLiteJobStore(path=str(tmp_path / "jobs.sqlite3"))
+
+
+def test_job_lifecycle(store):
+    job = store.create(new_job("Summarise", "a.pdf"))
+    store.append_task(job["id"], {"name": "verification", "output": "VERDICT: VALID"})
+    store.update(job["id"], status=SUCCEEDED, result="done")
+    stored = store.get(job["id"])
+    assert stored["status"] == SUCCEEDED and stored["result"] == "done"
+    assert [task["name"] for task in stored["tasks"]] == ["verification"]
+    assert store.delete_expired(-1) == 1
+    assert store.get(job["id"]) is None
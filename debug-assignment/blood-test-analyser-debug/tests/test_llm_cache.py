@@ -0,0 +1,43 @@
+from llm_cache import ResponseCache, make_key
+
+
+def age_rows(cache, seconds):
+    with cache._connect() as conn:
+        conn.execute("UPDATE responses SET created_at = created_at - ?", (seconds,))
+
+
+def test_keys_ignore_query_formatting():
+    assert make_key("h", "Summarise my report?", "doctor", "gpt", "v1") == make_key("h", " summarise  MY report", "doctor", "gpt", "v1")
+    assert make_key("h", "q", "doctor", "gpt", "v1") != make_key("h", "q", "doctor", "gpt", "v2")
+
+
+def test_disk_tier_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "llm.sqlite3")
+    ResponseCache(enabled=True, path=path).put("k", ["analysis"], "v1")
+    other = ResponseCache(enabled=True, path=path)
+    assert other.get("k") == ["analysis"]
+    assert other.stats()["disk_hits"] == 1
+
+
+def test_expired_rows_are_deleted_on_write(tmp_path):
+    cache = ResponseCache(enabled=True, path=str(tmp_path / "llm.sqlite3"), ttl_seconds=60, prune_every=2)
+    cache.put("old", "stale answer", "v1")
+    age_rows(cache, 120)
+    assert ResponseCache(enabled=True, path=cache.path, ttl_seconds=60).get("old") is None
+
+    # The second write is not a pruning write, the third is
+    cache.put("a", "fresh", "v1")
+    with cache._connect() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0] == 2
+    cache.put("b", "fresh", "v1")
+    with cache._connect() as conn:
+        assert sorted(row[0] for row in conn.execute("SELECT key FROM responses")) == ["a", "b"]
+    assert cache.stats()["pruned"] == 1
+
+
+def test_invalidate_keeps_the_current_prompt_version(tmp_path):
+    cache = ResponseCache(enabled=True, path=str(tmp_path / "llm.sqlite3"))
+    cache.put("a", "old prompt", "v1")
+    cache.put("b", "new prompt", "v2")
+    assert cache.invalidate(keep_prompt_version="v2") == 1
+    assert cache.get("a") is None and cache.get("b") == "new prompt"
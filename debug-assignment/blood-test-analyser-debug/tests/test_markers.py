@@ -0,0 +1,63 @@
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from markers import HIGH, LOW, NORMAL, MarkerTable, canonical_analyte, compute_flags, extract_markers, parse_range
+
+
+def test_parse_range_handles_open_ends():
+    assert parse_range("13.0 - 17.0") == (13.0, 17.0)
+    low, high = parse_range("<200")
+    assert np.isnan(low) and high == 200.0
+    low, high = parse_range(">= 40")
+    assert low == 40.0 and np.isnan(high)
+
+
+def test_canonical_analyte_maps_spellings():
+    assert canonical_analyte("Haemoglobin") == "hemoglobin"
+    assert canonical_analyte("Cholesterol, Total") == "cholesterol_total"
+    assert canonical_analyte("Random Widget") == "random_widget"
+
+
+def test_flags_are_vectorized_and_ignore_missing_bounds():
+    flags = compute_flags(
+        np.array([5.0, 15.0, 25.0, 300.0]),
+        np.array([10.0, 10.0, 10.0, np.nan]),
+        np.array([20.0, 20.0, 20.0, 200.0]),
+    )
+    assert flags.tolist() == [LOW, NORMAL, HIGH, HIGH]
+
+
+def test_extracts_the_report_layouts():
+    table = extract_markers(
+        "Hemoglobin\n"
+        " 13.00 - 17.00 g/dL15.00\n"
+        "105.00Cholesterol, Total\n"
+        " <200.00 mg/dL\n"
+        "Haemoglobin 9.9 g/dL 13.0 - 17.0\n"
+        "TSH 5.6 uIU/mL 0.4 - 4.0\n"
+        "Random Widget 42 mg/dL 1 - 2\n"
+    )
+    assert table.key.tolist() == ["hemoglobin", "cholesterol_total", "tsh"]
+    # A repeated analyte keeps its first result
+    assert table.get("hemoglobin")["value"] == 15.0
+    cholesterol = table.get("cholesterol_total")
+    assert (cholesterol["low"], cholesterol["high"], cholesterol["flag"]) == (None, 200.0, NORMAL)
+    assert table.get("tsh")["flag"] == HIGH
+    assert table.get("random_widget") is None
+
+
+def test_units_are_converted_to_the_canonical_unit():
+    glucose = extract_markers("Glucose, Fasting 5.5 mmol/L 3.9 - 5.6").get("glucose_fasting")
+    assert glucose["unit"] == "mg/dL"
+    assert glucose["value"] == pytest.approx(99.09, abs=0.01)
+    assert glucose["low"] == pytest.approx(70.26, abs=0.01)
+
+
+def test_table_selection_and_text():
+    table = extract_markers("Hemoglobin 11.2 g/dL 13.0 - 17.0\nTSH 2.1 uIU/mL 0.4 - 4.0\n")
+    assert table.abnormal().key.tolist() == ["hemoglobin"]
+    assert table.select(panels=["thyroid"]).key.tolist() == ["tsh"]
+    assert table.to_text().splitlines()[0] == "Hemoglobin: 11.2 g/dL (ref 13-17) LOW"
+    assert len(MarkerTable.concat([table, table])) == 4
+    assert len(extract_markers("no results")) == 0
@@ -0,0 +1,69 @@
+import re
+
+import pytest
+
+import metrics
+from metrics import Counter, Histogram, Registry, span, current_agent_role
+
+
+def test_counter_renders_prometheus_text():
+    counter = Counter("requests_total", "Requests", ("role", "status"))
+    counter.inc(role="doctor", status=200)
+    counter.inc(2, role="doctor", status=200)
+    counter.inc(role='say "hi"\n', status=429)
+    assert counter.render() == [
+        "# HELP requests_total Requests",
+        "# TYPE requests_total counter",
+        'requests_total{role="doctor",status="200"} 3',
+        'requests_total{role="say \\"hi\\"\\n",status="429"} 1',
+    ]
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("stage_seconds", "Latency", ("stage",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage="parse")
+    assert histogram.render()[2:] == [
+        'stage_seconds_bucket{stage="parse",le="0.1"} 1',
+        'stage_seconds_bucket{stage="parse",le="1.0"} 2',
+        'stage_seconds_bucket{stage="parse",le="+Inf"} 3',
+        'stage_seconds_sum{stage="parse"} 5.55',
+        'stage_seconds_count{stage="parse"} 3',
+    ]
+
+
+def test_spans_time_stages_and_count_errors(monkeypatch):
+    registry = Registry()
+    seconds = registry.register(Histogram("analysis_stage_seconds", "Latency", ("stage", "agent_role")))
+    errors = registry.register(Counter("analysis_stage_errors_total", "Errors", ("stage", "agent_role", "error")))
+    monkeypatch.setattr(metrics, "STAGE_SECONDS", seconds)
+    monkeypatch.setattr(metrics, "STAGE_ERRORS", errors)
+    monkeypatch.setattr(metrics, "METRICS_ENABLED", True)
+
+    with span("crew") as outer:
+        with span("task.verification", agent_role="Verifier") as task:
+            # Nested spans inherit the agent role and share the trace
+            with span("llm") as call:
+                assert current_agent_role() == "Verifier"
+        with pytest.raises(ValueError):
+            with span("task.help_patients"):
+                raise ValueError("crew failed")
+
+    assert call.trace_id == task.trace_id == outer.trace_id
+    assert call.parent_id == task.span_id
+    text = registry.render()
+    assert 'analysis_stage_seconds_count{stage="llm",agent_role="Verifier"} 1' in text
+    assert 'analysis_stage_errors_total{stage="task.help_patients",agent_role="",error="ValueError"} 1' in text
+
+
+def test_metrics_endpoint_serves_the_exposition_format():
+    pytest.importorskip("httpx")
+    from fastapi.testclient import TestClient
+    import main
+
+    response = TestClient(main.app).get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    for line in response.text.splitlines():
+        assert line.startswith("# ") or re.match(r"^[a-z_]+(\{.*\})? \S+$", line), line
+    assert "# TYPE analysis_stage_seconds histogram" in response.text
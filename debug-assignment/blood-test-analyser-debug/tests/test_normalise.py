@@ -0,0 +1,57 @@
+import random
+
+import pytest
+
+from normalise import collapse_spaces, iter_normalised_pages, normalise_report, normalise_text
+
+
+def legacy_blank_lines(pages):
+    """The cleanup document.py did before normalise.py"""
+    full_report = ""
+    for content in pages:
+        while "\n\n" in content:
+            content = content.replace("\n\n", "\n")
+        full_report += content + "\n"
+    return full_report
+
+
+def legacy_spaces(processed_data):
+    """NutritionTool's old character-by-character double space removal"""
+    i = 0
+    while i < len(processed_data):
+        if processed_data[i:i+2] == "  ":
+            processed_data = processed_data[:i] + processed_data[i+1:]
+        else:
+            i += 1
+    return processed_data
+
+
+def random_pages(seed, count=5):
+    rng = random.Random(seed)
+    pieces = ["Hemoglobin", "13.5", "g/dL", " ", "  ", "    ", "\n", "\n\n", "\n\n\n\n", "\t", "x"]
+    return ["".join(rng.choice(pieces) for _ in range(rng.randint(0, 60))) for _ in range(count)]
+
+
+class Page:
+    def __init__(self, page_content):
+        self.page_content = page_content
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_matches_the_old_cleanup(seed):
+    pages = random_pages(seed)
+    assert normalise_report(pages) == legacy_blank_lines(pages)
+    text = "".join(pages)
+    assert collapse_spaces(text) == legacy_spaces(text)
+
+
+def test_blank_lines_and_spaces_in_one_pass():
+    text = "Hemoglobin    13.5\n\n\n  g/dL  \n"
+    assert normalise_text(text) == legacy_spaces(legacy_blank_lines([text])[:-1])
+    assert normalise_text(text, blank_lines=False, spaces=False) == text
+
+
+def test_pages_are_read_from_documents_one_at_a_time():
+    pages = [Page("a\n\n\nb"), "c  d"]
+    assert list(iter_normalised_pages(pages, spaces=True)) == ["a\nb", "c d"]
+    assert normalise_report([Page("")]) == "\n"
@@ -0,0 +1,98 @@
+import time
+from concurrent.futures import Future
+
+import pytest
+
+import ocr
+from document import PageDocument
+from ocr import OCRCache, OCRPool
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    pool = OCRPool(workers=1, cache=OCRCache(path=""), timeout=5)
+    monkeypatch.setattr(ocr, "ocr_pool", pool)
+    yield pool
+    pool.shutdown()
+
+
+def resolved(text=None, error=None):
+    future = Future()
+    if error is not None:
+        future.set_exception(error)
+    else:
+        future.set_result(text)
+    return future
+
+
+def test_disk_tier_is_opt_in(monkeypatch):
+    monkeypatch.delenv("OCR_CACHE_PATH", raising=False)
+    assert OCRCache().path == ""
+
+
+def test_disk_tier_expires_and_prunes_old_pages(tmp_path):
+    cache = OCRCache(path=str(tmp_path / "ocr.sqlite3"), ttl_seconds=60, prune_every=1)
+    cache.put("old", "Hemoglobin 13.5")
+    with cache._connect() as conn:
+        conn.execute("UPDATE pages SET created_at = ?", (time.time() - 120,))
+
+    # Expired pages are not served from disk, and the next write deletes them
+    assert OCRCache(path=cache.path, ttl_seconds=60).get("old") is None
+    cache.put("new", "TSH 2.1")
+    with cache._connect() as conn:
+        assert [row[0] for row in conn.execute("SELECT key FROM pages")] == ["new"]
+    assert OCRCache(path=cache.path).get("new") == "TSH 2.1"
+
+
+def test_inline_workers_ocr_in_process(pool, monkeypatch):
+    calls = []
+
+    def fake_ocr(images, lang, timeout):
+        calls.append(images)
+        return "Hemoglobin 13.5 g/dL"
+
+    monkeypatch.setattr(ocr, "_ocr_images", fake_ocr)
+    monkeypatch.setattr(ocr, "_inline", False)
+    ocr.run_ocr_inline()
+    assert ocr._inline
+
+    future = pool.submit([b"page image"])
+    assert future.done() and future.result() == "Hemoglobin 13.5 g/dL"
+    assert calls == [[b"page image"]]
+    # The pool's processes were never started
+    assert pool._executor is None
+    # A second copy of the page comes from the cache
+    assert pool.submit([b"page image"]).result() == "Hemoglobin 13.5 g/dL"
+    assert pool.stats()["cache_hits"] == 1 and len(calls) == 1
+
+
+def test_inline_failure_is_reported_through_the_future(pool, monkeypatch):
+    def broken(images, lang, timeout):
+        raise RuntimeError("tesseract crashed")
+
+    monkeypatch.setattr(ocr, "_ocr_images", broken)
+    monkeypatch.setattr(ocr, "_inline", True)
+    future = pool.submit([b"bad image"])
+    assert isinstance(future.exception(), RuntimeError)
+
+
+@pytest.mark.parametrize("future", [resolved(""), resolved("   \n"), resolved(error=RuntimeError("failed"))])
+def test_failed_ocr_keeps_the_extracted_text(pool, future):
+    page = PageDocument("Page 1 of 2", 0)
+    finished = ocr._finish(0, page, future, time.monotonic() + 5)
+    assert finished.page_content == "Page 1 of 2"
+    assert "ocr" not in finished.metadata
+
+
+def test_ocr_text_replaces_an_empty_page(pool):
+    page = PageDocument("", 0)
+    finished = ocr._finish(0, page, resolved("Glucose 95 mg/dL"), time.monotonic() + 5)
+    assert finished.page_content == "Glucose 95 mg/dL"
+    assert finished.metadata["ocr"] is True
+
+
+def test_page_past_its_deadline_is_given_up(pool):
+    page = PageDocument("", 0)
+    finished = ocr._finish(0, page, Future(), time.monotonic())
+    assert finished.page_content == ""
+    assert pool.stats()["timeouts"] == 1
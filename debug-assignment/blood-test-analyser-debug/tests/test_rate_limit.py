@@ -0,0 +1,133 @@
+import time
+
+import pytest
+
+from rate_limit import LLMScheduler, MemoryBudget, BATCH, INTERACTIVE
+
+
+def scheduler(rpm=600, tpm=1_000_000, **kwargs):
+    # A one-request bucket refilled 10 times a second
+    return LLMScheduler(budget=MemoryBudget(rpm, tpm, burst=1 / rpm), backoff_base=0.01, **kwargs)
+
+
+def test_scheduler_throttles_to_requests_per_minute():
+    limiter = scheduler()
+    started = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(10)
+    elapsed = time.monotonic() - started
+    # The first call is free, the other three each wait for a refill
+    assert elapsed >= 0.28
+    assert limiter.stats()["granted"]["interactive"] == 4
+
+
+def test_scheduler_throttles_to_tokens_per_minute():
+    limiter = LLMScheduler(budget=MemoryBudget(rpm=60_000, tpm=60_000, burst=0.001), backoff_base=0.01)
+    started = time.monotonic()
+    for _ in range(3):
+        limiter.acquire(60)
+    # 60 tokens refill in 60 ms
+    assert time.monotonic() - started >= 0.11
+
+
+def test_pause_holds_back_every_caller():
+    limiter = scheduler(rpm=60_000)
+    limiter.budget.pause(0.2)
+    started = time.monotonic()
+    limiter.acquire(1)
+    assert time.monotonic() - started >= 0.19
+
+
+def test_scheduler_counts_priority_classes():
+    limiter = scheduler(rpm=60_000)
+    limiter.acquire(1, priority=INTERACTIVE, flow="a")
+    limiter.acquire(1, priority=BATCH, flow="b")
+    assert limiter.stats()["granted"] == {"interactive": 1, "batch": 1}
+
+
+def test_scheduled_transport_throttles_and_retries_429():
+    httpx = pytest.importorskip("httpx")
+    from llm_http import ScheduledTransport
+
+    statuses = [429, 200, 200, 200]
+
+    def handler(request):
+        status = statuses.pop(0)
+        headers = {"retry-after": "0"} if status == 429 else {}
+        body = {"usage": {"total_tokens": 5}} if status == 200 else {"error": "slow down"}
+        return httpx.Response(status, json=body, headers=headers)
+
+    limiter = scheduler()
+    client = httpx.Client(transport=ScheduledTransport(limiter, httpx.MockTransport(handler)))
+    started = time.monotonic()
+    responses = [client.post("http://llm.test/chat/completions", json={"messages": []}) for _ in range(3)]
+    assert [response.status_code for response in responses] == [200, 200, 200]
+    # Four calls reached the provider, so three of them waited for the request bucket
+    assert time.monotonic() - started >= 0.28
+    stats = limiter.stats()
+    assert stats["retries"] == 1 and stats["throttled"] == 1
+    assert stats["granted"]["interactive"] == 4
+
+
+def test_scheduler_callbacks_admit_calls_without_httpx():
+    pytest.importorskip("langchain_core")
+    from uuid import uuid4
+    from llm_http import scheduler_callbacks
+
+    limiter = scheduler()
+    (callback,) = scheduler_callbacks(limiter)
+    started = time.monotonic()
+    for _ in range(3):
+        run_id = uuid4()
+        callback.on_llm_start({}, ["Summarise my report"], run_id=run_id)
+        callback.on_llm_error(RuntimeError("boom"), run_id=run_id)
+    assert time.monotonic() - started >= 0.18
+    assert limiter.stats()["granted"]["interactive"] == 3
+
+
+def test_throttling_errors_are_recognised():
+    from llm_http import _is_throttled
+
+    class ResourceExhausted(Exception):
+        code = 429
+
+    assert _is_throttled(ResourceExhausted())
+    assert not _is_throttled(ValueError("429 in the message is not enough"))
+
+
+def test_persistent_429_reaches_the_provider_max_retries_plus_one_times():
+    httpx = pytest.importorskip("httpx")
+    from llm_http import ScheduledTransport
+
+    attempts = []
+
+    def handler(request):
+        attempts.append(request)
+        return httpx.Response(429, json={"error": "slow down"}, headers={"retry-after": "0"})
+
+    limiter = scheduler(rpm=60_000, max_retries=3)
+    client = httpx.Client(transport=ScheduledTransport(limiter, httpx.MockTransport(handler)))
+    response = client.post("http://llm.test/chat/completions", json={"messages": []})
+    assert response.status_code == 429
+    assert len(attempts) == 4
+    assert limiter.stats()["retries"] == 3
+
+
+def test_openai_client_leaves_retries_to_the_scheduler(monkeypatch):
+    pytest.importorskip("httpx")
+    import sys
+    import types
+    import agents
+
+    built = {}
+
+    class ChatOpenAI:
+        def __init__(self, **kwargs):
+            built.update(kwargs)
+
+    monkeypatch.setitem(sys.modules, "langchain_openai", types.SimpleNamespace(ChatOpenAI=ChatOpenAI))
+    monkeypatch.setattr(agents, "LLM_PROVIDER", "openai")
+    assert isinstance(agents._build_llm(), ChatOpenAI)
+    # SDK retries on top of the transport's would multiply the attempts per call
+    assert built["max_retries"] == 0
+    assert type(built["http_client"]._transport).__name__ == "ScheduledTransport"
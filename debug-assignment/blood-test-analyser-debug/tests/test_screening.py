@@ -0,0 +1,68 @@
+import pytest
+
+pytest.importorskip("numpy")
+
+import document
+from document import ParsedReport, _collect
+from screening import ReportRejected, ReportScreen, screen_pages
+
+LAB_PAGE = (
+    "PATHOLOGY LABORATORY\n"
+    "Test Name  Result  Unit  Bio. Ref. Interval\n"
+    "Hemoglobin 11.2 g/dL 13.0 - 17.0\n"
+    "Glucose, Fasting 95 mg/dL 70 - 100\n"
+    "TSH 2.1 uIU/mL 0.4 - 4.0\n"
+)
+LETTER = "Dear tenant,\nThe rent for March is due on the first of the month.\nRegards, the landlord\n"
+
+
+def pulled(pages, read):
+    for page in pages:
+        read.append(page)
+        yield page
+
+
+def test_lab_report_is_accepted_on_its_first_page():
+    screen = ReportScreen(max_pages=2)
+    assert screen.feed(LAB_PAGE) is True
+    assert {"hemoglobin", "glucose_fasting", "tsh"} <= screen.markers
+    assert screen.to_dict()["pages_screened"] == 1
+
+
+def test_rejection_stops_reading_further_pages():
+    read = []
+    pages = pulled([LETTER, LETTER, LAB_PAGE, LAB_PAGE], read)
+    with pytest.raises(ReportRejected) as rejected:
+        list(screen_pages(pages, ReportScreen(max_pages=2)))
+    assert len(read) == 2
+    assert rejected.value.screen.accepted is False
+    assert "not a blood test report" in rejected.value.output
+
+
+def test_pages_without_text_are_not_held_against_a_document():
+    screen = ReportScreen(max_pages=2)
+    assert screen.feed("") is None and screen.feed("  \n") is None
+    assert screen.feed(LAB_PAGE) is True
+
+
+def test_short_documents_are_decided_at_the_end():
+    with pytest.raises(ReportRejected):
+        list(screen_pages([LETTER], ReportScreen(max_pages=2)))
+    # A document with no text at all (a scan OCR could not read) is left to the crew
+    assert list(screen_pages(["", ""], ReportScreen(max_pages=2))) == ["", ""]
+
+
+def test_accepted_pages_pass_straight_through():
+    pages = [LAB_PAGE, LETTER, LETTER, LETTER]
+    assert list(screen_pages(pages, ReportScreen(max_pages=2))) == pages
+
+
+def test_rejected_upload_is_never_fully_parsed():
+    read = []
+    pages = pulled([document.PageDocument(text, n) for n, text in enumerate([LETTER] * 10)], read)
+    with pytest.raises(ReportRejected):
+        _collect(pages, "digest", "test", ReportScreen(max_pages=2))
+    assert len(read) == 2
+
+    report = _collect(iter([document.PageDocument(LAB_PAGE, 0)]), "digest", "test", ReportScreen())
+    assert isinstance(report, ParsedReport) and report.screen["accepted"] is True
@@ -0,0 +1,168 @@
+import asyncio
+
+import pytest
+
+from singleflight import LEADER, COALESCED, REMOTE, SingleFlight, SQLiteSingleFlight, flight_key
+
+
+class Work:
+    """Coroutine function that counts its runs and waits for release"""
+
+    def __init__(self, result="done"):
+        self.result = result
+        self.runs = 0
+        self.cancelled = 0
+        self.release = None
+
+    async def __call__(self):
+        self.runs += 1
+        try:
+            await self.release.wait()
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        return self.result
+
+
+def test_flight_key_ignores_query_formatting():
+    assert flight_key("h", "Summarise  my report", "full") == flight_key("h", "summarise my report ", "full")
+    assert flight_key("h", "q", "full") != flight_key("h", "q", "fast")
+    assert flight_key("h", "q", "full", "Hemoglobin: 14 -> 12") != flight_key("h", "q", "full")
+
+
+def test_concurrent_callers_share_one_run():
+    group = SingleFlight()
+    work = Work()
+
+    async def scenario():
+        work.release = asyncio.Event()
+        callers = [asyncio.ensure_future(group.run("k", work)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        work.release.set()
+        return await asyncio.gather(*callers)
+
+    results = asyncio.run(scenario())
+    assert work.runs == 1
+    assert sorted(outcome for _, outcome in results) == [COALESCED, COALESCED, LEADER]
+    assert all(result == "done" for result, _ in results)
+    stats = group.stats()
+    assert (stats["leaders"], stats["coalesced"], stats["in_flight"]) == (1, 2, 0)
+
+
+def test_cancelling_one_of_several_waiters_keeps_the_work():
+    group = SingleFlight()
+    work = Work()
+
+    async def scenario():
+        work.release = asyncio.Event()
+        first = asyncio.ensure_future(group.run("k", work))
+        second = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        await asyncio.gather(first, return_exceptions=True)
+        work.release.set()
+        return first, await second
+
+    first, (result, outcome) = asyncio.run(scenario())
+    assert first.cancelled()
+    assert (result, outcome) == ("done", COALESCED)
+    assert work.cancelled == 0
+    assert group.stats()["cancelled"] == 0
+
+
+def test_cancelling_the_last_waiter_cancels_the_work():
+    group = SingleFlight()
+    work = Work()
+
+    async def scenario():
+        work.release = asyncio.Event()
+        caller = asyncio.ensure_future(group.run("k", work))
+        await asyncio.sleep(0.01)
+        caller.cancel()
+        await asyncio.gather(caller, return_exceptions=True)
+        await asyncio.sleep(0.01)
+        # A caller arriving after the cancellation starts a fresh run
+        work.release.set()
+        return await group.run("k", work)
+
+    result, outcome = asyncio.run(scenario())
+    assert work.cancelled == 1
+    assert work.runs == 2
+    assert (result, outcome) == ("done", LEADER)
+    assert group.stats()["cancelled"] == 1
+
+
+def test_failure_reaches_every_waiter_and_is_not_kept():
+    group = SingleFlight()
+    runs = []
+
+    async def failing():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        raise ValueError("crew failed")
+
+    async def scenario():
+        callers = [asyncio.ensure_future(group.run("k", failing)) for _ in range(2)]
+        return await asyncio.gather(*callers, return_exceptions=True)
+
+    results = asyncio.run(scenario())
+    assert len(runs) == 1
+    assert all(isinstance(result, ValueError) for result in results)
+    assert group.stats()["in_flight"] == 0
+    assert group.stats()["leaders"] == 0
+
+
+def test_disabled_group_runs_every_caller():
+    group = SingleFlight(enabled=False)
+    work = Work()
+
+    async def scenario():
+        work.release = asyncio.Event()
+        work.release.set()
+        return await asyncio.gather(group.run("k", work), group.run("k", work))
+
+    results = asyncio.run(scenario())
+    assert work.runs == 2
+    assert [outcome for _, outcome in results] == [LEADER, LEADER]
+
+
+def test_sqlite_waiter_returns_the_other_workers_result(tmp_path):
+    path = str(tmp_path / "flights.sqlite3")
+    owner = SQLiteSingleFlight(path, lease_seconds=5, poll_seconds=0.01)
+    other = SQLiteSingleFlight(path, lease_seconds=5, poll_seconds=0.01)
+    work = Work({"analysis": "done"})
+    duplicate = Work({"analysis": "not used"})
+
+    async def scenario():
+        work.release = asyncio.Event()
+        duplicate.release = asyncio.Event()
+        leading = asyncio.ensure_future(owner.run("k", work))
+        await asyncio.sleep(0.05)
+        waiting = asyncio.ensure_future(other.run("k", duplicate))
+        await asyncio.sleep(0.05)
+        work.release.set()
+        return await leading, await waiting
+
+    (lead, lead_outcome), (waited, waited_outcome) = asyncio.run(scenario())
+    assert (lead, lead_outcome) == ({"analysis": "done"}, LEADER)
+    assert (waited, waited_outcome) == ({"analysis": "done"}, REMOTE)
+    assert duplicate.runs == 0
+
+
+def test_sqlite_key_is_released_when_the_owner_fails(tmp_path):
+    path = str(tmp_path / "flights.sqlite3")
+    owner = SQLiteSingleFlight(path, lease_seconds=5, poll_seconds=0.01)
+    other = SQLiteSingleFlight(path, lease_seconds=5, poll_seconds=0.01)
+    work = Work()
+
+    async def failing():
+        raise ValueError("crew failed")
+
+    async def scenario():
+        with pytest.raises(ValueError):
+            await owner.run("k", failing)
+        work.release = asyncio.Event()
+        work.release.set()
+        return await other.run("k", work)
+
+    assert asyncio.run(scenario()) == ("done", LEADER)
@@ -0,0 +1,135 @@
+import json
+import asyncio
+
+import pytest
+from fastapi import HTTPException
+
+import streaming
+from streaming import AnalysisCancelled, AnalysisStream, check_cancelled, emit_token, stream_events, use_stream
+
+
+def on_error(error):
+    return HTTPException(status_code=500, detail=str(error))
+
+
+async def collect(events):
+    return [event async for event in events]
+
+
+def test_events_then_result_as_ndjson():
+    async def scenario():
+        stream = AnalysisStream()
+
+        async def work():
+            stream.put("task", name="verify")
+            await asyncio.sleep(0)
+            stream.put("task", name="doctor")
+            return {"event": "result", "analysis": "All normal"}
+
+        return await collect(stream_events("ndjson", stream, work(), on_error))
+
+    lines = [json.loads(line) for line in asyncio.run(scenario())]
+    assert lines == [
+        {"event": "task", "name": "verify"},
+        {"event": "task", "name": "doctor"},
+        {"event": "result", "analysis": "All normal"},
+    ]
+
+
+def test_sse_framing():
+    async def scenario():
+        stream = AnalysisStream()
+
+        async def work():
+            with use_stream(stream):
+                emit_token("Hemoglobin")
+            return {"event": "result", "analysis": "ok"}
+
+        return await collect(stream_events("sse", stream, work(), on_error))
+
+    token, result = asyncio.run(scenario())
+    assert token == 'event: token\ndata: {"agent": null, "text": "Hemoglobin"}\n\n'
+    assert result == 'event: result\ndata: {"analysis": "ok"}\n\n'
+
+
+def test_failures_become_error_events():
+    async def scenario():
+        stream = AnalysisStream()
+
+        async def work():
+            raise ValueError("crew failed")
+
+        return await collect(stream_events("ndjson", stream, work(), on_error))
+
+    (line,) = asyncio.run(scenario())
+    assert json.loads(line) == {"event": "error", "status_code": 500, "detail": "crew failed"}
+
+
+def test_disconnected_client_cancels_the_run(monkeypatch):
+    monkeypatch.setattr(streaming, "DISCONNECT_POLL_SECONDS", 0.01)
+
+    async def scenario():
+        stream = AnalysisStream()
+        started = asyncio.Event()
+
+        async def work():
+            started.set()
+            await asyncio.sleep(60)
+
+        async def is_disconnected():
+            return started.is_set()
+
+        run = work()
+        events = await collect(stream_events("ndjson", stream, run, on_error, is_disconnected))
+        await asyncio.sleep(0)
+        return stream, events, run
+
+    stream, events, run = asyncio.run(scenario())
+    assert events == []
+    assert stream.cancelled.is_set()
+    assert run.cr_frame is None
+    # The worker thread's next token or stage stops the crew
+    with pytest.raises(AnalysisCancelled):
+        stream.put("token", text="late")
+
+
+def test_closing_the_response_cancels_the_run_and_the_queue_read():
+    async def scenario():
+        stream = AnalysisStream()
+
+        async def work():
+            stream.put("task", name="verify")
+            await asyncio.sleep(60)
+
+        events = stream_events("ndjson", stream, work(), on_error)
+        first = await anext(events)
+        # The generator is now waiting on the next queue read
+        pending = asyncio.ensure_future(anext(events))
+        await asyncio.sleep(0.01)
+        pending.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await pending
+        await events.aclose()
+        await asyncio.sleep(0)
+        others = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+        return stream, first, others
+
+    stream, first, others = asyncio.run(scenario())
+    assert json.loads(first) == {"event": "task", "name": "verify"}
+    assert stream.cancelled.is_set()
+    # Neither the run nor a queue getter is left pending
+    assert others == []
+
+
+def test_check_cancelled_only_inside_a_cancelled_stream():
+    async def scenario():
+        stream = AnalysisStream()
+        check_cancelled()
+        with use_stream(stream):
+            check_cancelled()
+            stream.cancel()
+            with pytest.raises(AnalysisCancelled):
+                check_cancelled()
+        check_cancelled()
+
+    asyncio.run(scenario())
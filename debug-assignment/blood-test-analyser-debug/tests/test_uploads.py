@@ -0,0 +1,94 @@
+import io
+import asyncio
+
+import pytest
+
+from uploads import UploadRejected, spool_upload, MAX_UPLOAD_BYTES, CHUNK_SIZE
+
+
+class FakeUpload:
+    """The parts of FastAPI's UploadFile that spool_upload reads"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self._data = io.BytesIO(data)
+
+    async def read(self, size=-1):
+        return self._data.read(size)
+
+
+def spool(filename, data, **kwargs):
+    return asyncio.run(spool_upload(FakeUpload(filename, data), **kwargs))
+
+
+def test_spooled_upload_keeps_content_and_hash():
+    upload = spool("a.pdf", b"%PDF-1.4\n" + b"x" * 5000)
+    assert upload.size == 5009
+    assert upload.file.read(5) == b"%PDF-"
+    assert len(upload.content_hash) == 64
+    upload.close()
+
+
+@pytest.mark.parametrize("filename, data, status", [
+    ("a.txt", b"%PDF-1.4", 400),
+    ("a.pdf", b"not a pdf" * 200, 400),
+    ("a.pdf", b"%PDF-1.4" + b"x" * 3 * CHUNK_SIZE, 413),
+])
+def test_bad_uploads_are_rejected(filename, data, status):
+    with pytest.raises(UploadRejected) as rejected:
+        spool(filename, data, max_bytes=2 * CHUNK_SIZE)
+    assert rejected.value.status_code == status
+
+
+def test_on_disk_upload_is_removed_on_close():
+    import os
+
+    upload = spool("a.pdf", b"%PDF-1.4\n", on_disk=True)
+    assert os.path.exists(upload.path)
+    upload.close()
+    assert not os.path.exists(upload.path)
+
+
+def test_malformed_pdf_is_rejected_not_500():
+    pytest.importorskip("pypdf")
+    from document import parse_stream
+
+    with pytest.raises(UploadRejected) as rejected:
+        parse_stream(io.BytesIO(b"%PDF-1.4\n" + b"garbage" * 300), "digest", screen=False)
+    assert rejected.value.status_code == 400
+
+
+def post_chunked(app, chunks, path="/analyze"):
+    """Send chunks to app as a chunked body without Content-Length; returns (status, chunks left unread)"""
+    chunks = list(chunks)
+    sent = []
+
+    async def receive():
+        if chunks:
+            return {"type": "http.request", "body": chunks.pop(0), "more_body": bool(chunks)}
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+        "path": path, "raw_path": path.encode(), "query_string": b"", "root_path": "", "scheme": "http",
+        "server": ("test", 80), "client": ("test", 1),
+        "headers": [(b"content-type", b"multipart/form-data; boundary=XyZ"), (b"transfer-encoding", b"chunked")],
+    }
+    asyncio.run(app(scope, receive, send))
+    return next(m["status"] for m in sent if m["type"] == "http.response.start"), len(chunks)
+
+
+def test_chunked_body_over_the_limit_is_cut_off():
+    pytest.importorskip("fastapi")
+    import main
+
+    head = b'--XyZ\r\nContent-Disposition: form-data; name="file"; filename="a.pdf"\r\n\r\n'
+    chunk = b"%PDF-1.4 " + b"x" * (1024 * 1024)
+    count = MAX_UPLOAD_BYTES // len(chunk) + 10
+    status, unread = post_chunked(main.app, [head] + [chunk] * count + [b"\r\n--XyZ--\r\n"])
+    assert status == 413
+    # Rejected once the limit was passed, not after the whole body was read
+    assert unread >= 5
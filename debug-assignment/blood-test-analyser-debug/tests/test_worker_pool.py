@@ -0,0 +1,94 @@
+import time
+import asyncio
+import threading
+
+import pytest
+
+from worker_pool import CrewExecutor, PoolSaturated
+
+
+def test_cancelled_caller_keeps_slot_until_work_ends():
+    executor = CrewExecutor(max_workers=1, max_queue=0, kind="thread")
+    release = threading.Event()
+
+    async def scenario():
+        waiter = asyncio.ensure_future(executor.run(release.wait, 5))
+        await asyncio.sleep(0.05)
+        waiter.cancel()
+        await asyncio.gather(waiter, return_exceptions=True)
+        # The worker thread is still running, so the pool is still full
+        assert executor.stats()["in_flight"] == 1
+        assert not executor.has_capacity()
+        with pytest.raises(PoolSaturated):
+            await executor.run(time.sleep, 0)
+        release.set()
+        for _ in range(100):
+            if executor.has_capacity():
+                break
+            await asyncio.sleep(0.01)
+        assert executor.stats()["in_flight"] == 0
+
+    asyncio.run(scenario())
+    executor.shutdown()
+
+
+def test_cancelled_queued_work_releases_its_slot():
+    executor = CrewExecutor(max_workers=1, max_queue=1, kind="thread")
+    release = threading.Event()
+
+    async def scenario():
+        running = asyncio.ensure_future(executor.run(release.wait, 5))
+        queued = asyncio.ensure_future(executor.run(time.sleep, 0))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        await asyncio.gather(queued, return_exceptions=True)
+        # Work that never started is dropped, so its slot frees straight away
+        assert executor.stats()["in_flight"] == 1
+        release.set()
+        assert await running is True
+
+    asyncio.run(scenario())
+    stats = executor.stats()
+    assert stats["in_flight"] == 0 and stats["completed"] == 1 and stats["failed"] == 1
+    executor.shutdown()
+
+
+def test_reserved_slot_counts_against_admission():
+    executor = CrewExecutor(max_workers=1, max_queue=0, kind="thread")
+    slot = executor.reserve()
+    with pytest.raises(PoolSaturated):
+        executor.reserve()
+
+    async def scenario():
+        assert await slot.run(sum, [1, 2]) == 3
+
+    asyncio.run(scenario())
+    assert executor.has_capacity()
+    # Releasing after the run is a no-op
+    slot.release()
+    assert executor.stats()["in_flight"] == 0
+    executor.shutdown()
+
+
+def test_released_slot_frees_admission():
+    executor = CrewExecutor(max_workers=1, max_queue=0, kind="thread")
+    slot = executor.reserve()
+    slot.release()
+    slot.release()
+    assert executor.has_capacity()
+    # Giving back an unused slot is not a failure
+    stats = executor.stats()
+    assert (stats["released"], stats["failed"], stats["completed"], stats["in_flight"]) == (1, 0, 0, 0)
+
+
+def test_failed_work_is_counted_as_failed():
+    executor = CrewExecutor(max_workers=1, max_queue=0, kind="thread")
+
+    def broken():
+        raise ValueError("crew failed")
+
+    with pytest.raises(ValueError):
+        asyncio.run(executor.run(broken))
+    stats = executor.stats()
+    assert (stats["failed"], stats["released"], stats["in_flight"]) == (1, 0, 0)
+    executor.shutdown()
@@ -1,38 +1,47 @@
 ## Importing libraries and files
-import os
-from dotenv import load_dotenv
-load_dotenv()
+# .env is loaded once by agents.py, which imports this module
+import sys
 
-try:
-    from crewai_tools import tools  # type: ignore
-except ImportError:
-    print("Warning: crewai_tools package not available. Please install it with: pip install crewai-tools")
-    tools = None
+from document import load_report, current_report
+from normalise import collapse_spaces
+from compaction import text_for_agent, markers_for_agent
+from history import current_history
 
 try:
-    from crewai_tools.tools.serper_dev_tool import SerperDevTool  # type: ignore
+    from markers import extract_markers
+    from recommendations import (
+        nutrition_recommendations, exercise_recommendations, format_recommendations,
+        GENERAL_NUTRITION, GENERAL_EXERCISE,
+    )
 except ImportError:
-    print("Warning: SerperDevTool not available. Creating mock search tool.")
-    class SerperDevTool:
-        def __call__(self, *args, **kwargs):
-            return "Mock search results"
+    print("Warning: numpy not available, marker extraction disabled. Please install it with: pip install numpy")
+    extract_markers = None
 
-try:
-    from langchain_community.document_loaders import PDFLoader  # type: ignore
-except ImportError:
-    print("Warning: PDFLoader not available. Creating mock PDF loader.")
-    class PDFLoader:
-        def __init__(self, file_path):
-            self.file_path = file_path
-        def load(self):
-            return [MockDocument("Mock PDF content")]
+## Creating search tool
+_search_tool = None
 
-class MockDocument:
-    def __init__(self, content):
-        self.page_content = content
+def get_search_tool():
+    """Build the search tool on first use; crewai_tools is slow to import"""
+    global _search_tool
+    if _search_tool is None:
+        try:
+            from crewai_tools.tools.serper_dev_tool import SerperDevTool  # type: ignore
+        except ImportError:
+            print("Warning: SerperDevTool not available. Creating mock search tool.")
+            class SerperDevTool:
+                def __call__(self, *args, **kwargs):
+                    return "Mock search results"
+        else:
+            # The tool calls requests.post() per search; reuse one keep-alive session instead
+            from http_clients import http_clients
+            http_clients.share_requests_session(sys.modules.get(SerperDevTool.__module__), "search")
+        _search_tool = SerperDevTool()
+    return _search_tool
 
-## Creating search tool
-search_tool = SerperDevTool()
+def __getattr__(name):
+    if name == "search_tool":
+        return get_search_tool()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 ## Creating custom pdf reader tool
 class BloodTestReportTool():
@@ -43,46 +52,72 @@ class BloodTestReportTool():
             path (str, optional): Path of the pdf file. Defaults to 'data/sample.pdf'.
 
         Returns:
-            str: Full Blood Test report file
+            str: Blood Test report text, compacted for the calling agent
         """
         
-        docs = PDFLoader(file_path=path).load()
-
-        full_report = ""
-        for data in docs:
-            # Clean and format the report data
-            content = data.page_content
+        # The report for this request is parsed once and shared by every agent
+        report = current_report()
+        if report is None:
+            report = load_report(path)
             
-            # Remove extra whitespaces and format properly
-            while "\n\n" in content:
-                content = content.replace("\n\n", "\n")
-                
-            full_report += content + "\n"
+        # Repeated page furniture is dropped and the text cut to the calling agent's token budget
+        return text_for_agent(report)
+
+    async def read_markers_tool(self, path='data/sample.pdf'):
+        """Tool to read the extracted lab markers of a blood test report
+
+        Args:
+            path (str, optional): Path of the pdf file. Defaults to 'data/sample.pdf'.
+
+        Returns:
+            str: One line per marker with value, unit, reference range and high/low flag
+        """
+        
+        report = current_report()
+        if report is None:
+            report = load_report(path)
             
-        return full_report
+        # Only the panels the calling agent needs, abnormal results first
+        text = markers_for_agent(report)
+        if text is None:
+            text = "No structured lab markers could be extracted from this report"
+        
+        # Trends from the patient's earlier reports, when history is enabled for this request
+        history = current_history()
+        if history:
+            text += "\n\nTrends from the patient's previous reports:\n" + history
+        return text
+
+def marker_table(blood_report_data):
+    """Markers for the given report text, reusing the request's parsed table when possible"""
+    report = current_report()
+    if report is not None and blood_report_data in (None, "", report.text):
+        return report.markers
+    if extract_markers is None:
+        return None
+    # Clean up the data format (remove repeated spaces)
+    return extract_markers(collapse_spaces(blood_report_data or ""))
 
 ## Creating Nutrition Analysis Tool
 class NutritionTool:
     async def analyze_nutrition_tool(self, blood_report_data):
         # Process and analyze the blood report data
-        processed_data = blood_report_data
+        table = marker_table(blood_report_data)
+        if table is None:
+            return "Nutrition analysis needs marker extraction, which requires numpy"
         
-        # Clean up the data format
-        i = 0
-        while i < len(processed_data):
-            if processed_data[i:i+2] == "  ":  # Remove double spaces
-                processed_data = processed_data[:i] + processed_data[i+1:]
-            else:
-                i += 1
-                
-        # TODO: Implement nutrition analysis logic here
-        return "Nutrition analysis functionality to be implemented"
+        findings = nutrition_recommendations(table)
+        return format_recommendations("Nutrition analysis:", findings, GENERAL_NUTRITION)
 
 ## Creating Exercise Planning Tool
 class ExerciseTool:
     async def create_exercise_plan_tool(self, blood_report_data):        
-        # TODO: Implement exercise planning logic here
-        return "Exercise planning functionality to be implemented"
+        table = marker_table(blood_report_data)
+        if table is None:
+            return "Exercise planning needs marker extraction, which requires numpy"
+        
+        findings = exercise_recommendations(table)
+        return format_recommendations("Exercise plan considerations:", findings, GENERAL_EXERCISE)
 
 # Create instances of the tools
 blood_test_tool = BloodTestReportTool()
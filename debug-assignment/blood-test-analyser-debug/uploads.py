@@ -0,0 +1,102 @@
+## Streaming upload ingestion
+import os
+import hashlib
+import tempfile
+
+PDF_MAGIC = b"%PDF-"
+ZIP_MAGIC = b"PK\x03\x04"
+# The PDF header may be preceded by junk bytes, but must start within the first 1 KiB
+PDF_HEADER_WINDOW = 1024
+CHUNK_SIZE = 64 * 1024
+
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(20 * 1024 * 1024)))
+# Uploads larger than this spill from memory to a temporary file on disk
+SPOOL_MEMORY_BYTES = int(os.getenv("UPLOAD_SPOOL_MEMORY_BYTES", str(1024 * 1024)))
+
+
+class UploadRejected(Exception):
+    """Raised when an upload is refused before any analysis work starts"""
+
+    def __init__(self, status_code, detail):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+class SpooledUpload:
+    """An upload copied into a spooled temporary file, with its size and content hash"""
+
+    def __init__(self, filename, spool, size, digest, path=None):
+        self.filename = filename
+        self.file = spool
+        self.size = size
+        self.content_hash = digest
+        # Set when the upload was spooled to a named file other processes can open
+        self.path = path
+
+    def close(self):
+        self.file.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+
+def looks_like_pdf(head):
+    return PDF_MAGIC in head[:PDF_HEADER_WINDOW]
+
+
+def looks_like_zip(head):
+    return head.startswith(ZIP_MAGIC)
+
+
+async def spool_upload(file, max_bytes=None, chunk_size=CHUNK_SIZE, archive=False, on_disk=False):
+    """Stream an UploadFile into a SpooledTemporaryFile chunk by chunk.
+
+    The PDF header (or ZIP header when archive is true) is checked on the
+    first chunk and the size limit on every chunk, so bad or oversized
+    uploads are rejected as soon as possible without the whole body ever
+    being held in memory. With on_disk the upload goes to a named temporary
+    file instead, whose path can be handed to worker processes.
+    """
+    max_bytes = max_bytes or MAX_UPLOAD_BYTES
+    suffix, looks_valid, kind = (".zip", looks_like_zip, "ZIP") if archive else (".pdf", looks_like_pdf, "PDF")
+    if not file.filename or not file.filename.lower().endswith(suffix):
+        raise UploadRejected(400, f"Only {kind} files are supported")
+
+    if on_disk:
+        spool = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+    else:
+        spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MEMORY_BYTES)
+    path = spool.name if on_disk else None
+    digest = hashlib.sha256()
+    size = 0
+    head = b""
+    try:
+        while True:
+            chunk = await file.read(chunk_size)
+            if not chunk:
+                break
+
+            if len(head) < PDF_HEADER_WINDOW:
+                head += chunk[:PDF_HEADER_WINDOW - len(head)]
+                if len(head) >= PDF_HEADER_WINDOW and not looks_valid(head):
+                    raise UploadRejected(400, f"Uploaded file is not a valid {kind}")
+
+            size += len(chunk)
+            if size > max_bytes:
+                raise UploadRejected(413, f"File exceeds the {max_bytes} byte upload limit")
+
+            digest.update(chunk)
+            spool.write(chunk)
+
+        if not looks_valid(head):
+            raise UploadRejected(400, f"Uploaded file is not a valid {kind}")
+    except BaseException:
+        SpooledUpload(file.filename, spool, size, None, path).close()
+        raise
+
+    spool.flush()
+    spool.seek(0)
+    return SpooledUpload(file.filename, spool, size, digest.hexdigest(), path)
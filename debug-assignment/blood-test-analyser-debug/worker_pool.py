@@ -0,0 +1,205 @@
+## Importing libraries and files
+import os
+import math
+import time
+import asyncio
+import threading
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+
+class PoolSaturated(Exception):
+    """Raised when the crew pool cannot admit another request"""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Crew pool is saturated, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def _timed_call(fn, args, kwargs):
+    """Run fn in the worker and report wall-clock start/end times.
+
+    Module level so it can be pickled into a process pool worker.
+    """
+    started = time.time()
+    result = fn(*args, **kwargs)
+    return started, time.time(), result
+
+
+class Slot:
+    """A place in a CrewExecutor admitted by reserve(), used by one run() or given back by release()"""
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._lock = threading.Lock()
+        self._used = False
+
+    def _take(self):
+        with self._lock:
+            if self._used:
+                return False
+            self._used = True
+            return True
+
+    async def run(self, fn, *args, **kwargs):
+        if not self._take():
+            raise RuntimeError("This slot has already been used")
+        return await self._executor._submit(fn, args, kwargs)
+
+    def release(self):
+        """Give the slot back if its work never started; a no-op once run() was called"""
+        if self._take():
+            self._executor._give_back()
+
+
+## Creating the bounded crew executor
+class CrewExecutor:
+    """Runs blocking crew work on a thread or process pool with admission control.
+
+    At most ``max_workers`` jobs run at once and at most ``max_queue`` more
+    wait for a free worker. Anything beyond that is rejected immediately with
+    :class:`PoolSaturated` so the event loop never piles up unbounded work.
+    """
+
+    def __init__(self, max_workers=None, max_queue=None, kind=None, retry_after=None):
+        self.max_workers = int(max_workers or os.getenv("CREW_MAX_WORKERS", "4"))
+        self.max_queue = int(max_queue if max_queue is not None else os.getenv("CREW_MAX_QUEUE", "16"))
+        self.kind = (kind or os.getenv("CREW_POOL_KIND", "thread")).lower()
+        self.default_retry_after = int(retry_after or os.getenv("CREW_RETRY_AFTER", "5"))
+
+        if self.kind not in ("thread", "process"):
+            raise ValueError(f"Unknown pool kind: {self.kind}")
+
+        self._executor = None
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._rejected = 0
+        self._released = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+        self._run_max = 0.0
+
+    @property
+    def executor(self):
+        # Created on first use so importing main.py does not spawn workers
+        if self._executor is None:
+            if self.kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="crew"
+                )
+        return self._executor
+
+    def retry_after(self):
+        """Estimate how many seconds until a slot frees up"""
+        with self._lock:
+            if not self._completed:
+                return self.default_retry_after
+            avg_run = self._run_total / self._completed
+            waiting = max(self._in_flight - self.max_workers, 0) + 1
+        return max(1, math.ceil(avg_run * waiting / self.max_workers))
+
+    def has_capacity(self):
+        """Whether a call to run() would currently be admitted"""
+        with self._lock:
+            return self._in_flight < self.max_workers + self.max_queue
+
+    def _admit(self):
+        with self._lock:
+            if self._in_flight >= self.max_workers + self.max_queue:
+                self._rejected += 1
+                return False
+            self._in_flight += 1
+            self._submitted += 1
+            return True
+
+    def reserve(self):
+        """Admit work now that will be submitted later, e.g. a job accepted before its upload is parsed.
+
+        Raises PoolSaturated when the pool is full. The returned Slot is held
+        until its work ends, or until release() if the work never starts.
+        """
+        if not self._admit():
+            raise PoolSaturated(self.retry_after())
+        return Slot(self)
+
+    async def run(self, fn, *args, **kwargs):
+        """Run ``fn(*args, **kwargs)`` on the pool and await its result"""
+        return await self.reserve().run(fn, *args, **kwargs)
+
+    async def _submit(self, fn, args, kwargs):
+        enqueued = time.time()
+        if self.kind == "thread":
+            # Carry request-scoped context variables into the worker thread
+            ctx = contextvars.copy_context()
+            call = functools.partial(ctx.run, _timed_call, fn, args, kwargs)
+        else:
+            call = functools.partial(_timed_call, fn, args, kwargs)
+
+        try:
+            future = self.executor.submit(call)
+        except BaseException:
+            self._release(None, enqueued)
+            raise
+        # The slot is held until the work itself ends, not just until this caller stops
+        # waiting: a cancelled caller only cancels work that has not started yet
+        future.add_done_callback(functools.partial(self._release, enqueued=enqueued))
+        _, _, result = await asyncio.wrap_future(future)
+        return result
+
+    def _give_back(self):
+        # A reserved slot whose work never started is neither completed nor failed
+        with self._lock:
+            self._in_flight -= 1
+            self._released += 1
+
+    def _release(self, future, enqueued):
+        failed = future is None or future.cancelled() or future.exception() is not None
+        if not failed:
+            started, finished, _ = future.result()
+            self._record(started - enqueued, finished - started)
+        with self._lock:
+            self._in_flight -= 1
+            if failed:
+                self._failed += 1
+            else:
+                self._completed += 1
+
+    def _record(self, wait, run):
+        with self._lock:
+            self._wait_total += wait
+            self._wait_max = max(self._wait_max, wait)
+            self._run_total += run
+            self._run_max = max(self._run_max, run)
+
+    def stats(self):
+        """Snapshot of queue depth, wait time and run time"""
+        with self._lock:
+            done = self._completed or 1
+            return {
+                "kind": self.kind,
+                "max_workers": self.max_workers,
+                "max_queue": self.max_queue,
+                "in_flight": self._in_flight,
+                "queue_depth": max(self._in_flight - self.max_workers, 0),
+                "submitted": self._submitted,
+                "completed": self._completed,
+                "failed": self._failed,
+                "rejected": self._rejected,
+                "released": self._released,
+                "wait_seconds_avg": round(self._wait_total / done, 4),
+                "wait_seconds_max": round(self._wait_max, 4),
+                "run_seconds_avg": round(self._run_total / done, 4),
+                "run_seconds_max": round(self._run_max, 4),
+            }
+
+    def shutdown(self, wait=True):
+        if self._executor is not None:
+            self._executor.shutdown(wait=wait)
+            self._executor = None